@@ -0,0 +1,1655 @@
+import time
+import math
+import argparse
+import json
+import platform
+import sys
+import tracemalloc
+import numpy as np
+import os
+import tempfile
+import warnings
+import concurrent.futures
+import noise
+# Importing pygame prints a banner to stdout, which may be carrying a JSON report.
+os.environ.setdefault('PYGAME_HIDE_SUPPORT_PROMPT', '1')
+import Perlin
+import ChunkGenerator
+import Entity
+import EntityPhysics
+import EnemyRenderer
+import MeshCache
+import collections
+from pygame.locals import K_UP, K_a, K_d, K_m, K_q, K_e
+import Frustum
+import MeshMap as MeshMap_module
+import Camera as Camera_module
+import VertexArena
+import VBOPool
+from MeshMap import MeshMap, EXECUTOR_BACKENDS, MESH_FORMATS, DRAW_MODES
+from GLCallCounter import GLCallCounter
+from ChunkCache import ChunkCache
+from Simulation import Simulation
+from FixedTimestep import FixedTimestep
+from HeadlessRunner import HeadlessRunner, scripted_input
+from Profiler import Profiler, profiler, profiled
+from InputRecording import InputRecording
+
+
+# Headless benchmarks and sanity checks for the game code.
+# None of these touch OpenGL, so they can run without a display:
+#     python Benchmark.py
+# Time budgets are only reported unless asked to fail the run:
+#     python Benchmark.py all --strict
+# The correctness checks also run on small sizes under pytest (see test_headless.py):
+#     python -m pytest -q
+# Terrain generation alone, with machine-readable results for tracking regressions:
+#     python Benchmark.py terrain --chunk-width 16 32 --executor threads processes --json results.json
+
+
+def _noise_height(pos, seed, scale, height_limit):
+    """
+    One terrain height straight from noise.pnoise2, the way MeshMap
+    computed every height before chunk heights were reused.
+    """
+    base_noise = noise.pnoise2(pos[0] * scale, pos[1] * scale, octaves=4, persistence=0.5, lacunarity=2.0,
+                               repeatx=1024, repeaty=1024, base=seed)
+    return (((base_noise + 1) / 2) ** 5) * height_limit
+
+
+def check_noise_parity(seed=48, scale=0.003, samples=20000):
+    """
+    Check that Perlin.pnoise2 matches noise.pnoise2 exactly (which path it takes is reported),
+    that MeshMap.get_heights agrees with the scalar noise height and that
+    MeshMap.get_tile_height returns the height of the tile under a position.
+
+    :param seed: Noise seed (base) to test.
+    :param scale: Noise scale to test.
+    :param samples: Number of random world positions to compare.
+    """
+    rng = np.random.default_rng(seed)
+    xs = rng.uniform(-50000, 50000, samples)
+    zs = rng.uniform(-50000, 50000, samples)
+
+    batched = Perlin.pnoise2(xs * scale, zs * scale, octaves=4, persistence=0.5, lacunarity=2.0,
+                             repeatx=1024, repeaty=1024, base=seed)
+    reference = np.array([
+        noise.pnoise2(x * scale, z * scale, octaves=4, persistence=0.5, lacunarity=2.0,
+                      repeatx=1024, repeaty=1024, base=seed)
+        for x, z in zip(xs, zs)
+    ])
+    assert np.array_equal(batched, reference), "Perlin.pnoise2 does not match noise.pnoise2"
+
+    mesh_map = MeshMap(chunk_width=16, render_distance=1, chunks_per_update=1, seed=seed, scale=scale, height_limit=1000)
+    heights = mesh_map.get_heights(xs, zs)
+    reference = np.array([_noise_height((x, z), seed, scale, 1000) for x, z in zip(xs, zs)])
+    # The noise is identical; numpy's pow can round differently from libm's in the last bit.
+    np.testing.assert_allclose(heights, reference, rtol=1e-12, atol=0)
+    tile_heights = np.array([mesh_map.get_tile_height((x, z)) for x, z in zip(xs, zs)])
+    reference = mesh_map.get_heights(np.floor(xs), np.floor(zs)).astype(np.float32)
+    np.testing.assert_allclose(tile_heights, reference, rtol=1e-6, atol=0)
+    path = 'vectorized' if Perlin.is_vectorized(seed) else f"noise.pnoise2 per sample, the parity probe failed or noise is not {Perlin.NOISE_VERSION}"
+    print(f"noise parity: {samples} samples match (seed={seed}, scale={scale}, {path})")
+
+
+def bench_heightfield(chunk_width=16, chunks=64, seed=48, scale=0.003):
+    """
+    Compare filling chunk heightfields one noise.pnoise2 call at a time
+    against a single get_heights call per chunk.
+
+    :param chunk_width: Number of tiles per chunk side.
+    :param chunks: Number of chunks to time.
+    """
+    mesh_map = MeshMap(chunk_width=chunk_width, render_distance=1, chunks_per_update=1, seed=seed, scale=scale, height_limit=1000)
+    grid_size = chunk_width + 2
+    coords = [(cx, cz) for cx in range(-4, 4) for cz in range(-(chunks // 16), chunks // 16)][:chunks]
+
+    start = time.perf_counter()
+    for chunk_x, chunk_z in coords:
+        heights = np.zeros((grid_size, grid_size), dtype=np.float32)
+        for i in range(grid_size):
+            for j in range(grid_size):
+                heights[i, j] = _noise_height((chunk_x * chunk_width + i - 1, chunk_z * chunk_width + j - 1), seed, scale, 1000)
+    scalar_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for chunk_x, chunk_z in coords:
+        xs, zs = np.meshgrid(
+            np.arange(chunk_x * chunk_width - 1, chunk_x * chunk_width + grid_size - 1),
+            np.arange(chunk_z * chunk_width - 1, chunk_z * chunk_width + grid_size - 1),
+            indexing='ij'
+        )
+        heights = mesh_map.get_heights(xs, zs).astype(np.float32)
+    batched_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for chunk_x, chunk_z in coords:
+        ChunkGenerator.generate_chunk_data(chunk_x, chunk_z, seed, scale, 1000, chunk_width)
+    chunk_time = time.perf_counter() - start
+
+    print(f"heightfield {chunk_width}x{chunk_width}: "
+          f"scalar {len(coords) / scalar_time:.1f} chunks/s, "
+          f"batched {len(coords) / batched_time:.1f} chunks/s "
+          f"({scalar_time / batched_time:.1f}x)")
+    print(f"full chunk generation {chunk_width}x{chunk_width}: {len(coords) / chunk_time:.1f} chunks/s")
+
+
+
+def bench_mesher(chunk_width=16, chunks=64, seed=48, scale=0.003):
+    """
+    Time building chunk meshes from already generated height grids and
+    measure the peak memory used on top of the finished vertex buffer.
+
+    :param chunk_width: Number of tiles per chunk side.
+    :param chunks: Number of chunks to time.
+    """
+    coords = [(chunk_x, 3) for chunk_x in range(chunks)]
+    grids = [ChunkGenerator.generate_chunk_heights(chunk_x, chunk_z, seed, scale, 1000, chunk_width) for chunk_x, chunk_z in coords]
+
+    start = time.perf_counter()
+    for (chunk_x, chunk_z), heights in zip(coords, grids):
+        ChunkGenerator.build_chunk_mesh(heights, chunk_x * chunk_width, chunk_z * chunk_width, 1000)
+    mesh_time = time.perf_counter() - start
+
+    tracemalloc.start()
+    vertex_array, vertex_count = ChunkGenerator.build_chunk_mesh(grids[0], coords[0][0] * chunk_width, coords[0][1] * chunk_width, 1000)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    print(f"mesher {chunk_width}x{chunk_width}: {mesh_time / len(coords) * 1000:.2f} ms/chunk, "
+          f"{vertex_count} vertices, {vertex_array.nbytes / 1024:.1f} KiB output, "
+          f"{(peak - vertex_array.nbytes) / 1024:.1f} KiB peak overhead")
+
+
+def bench_greedy_mesh(chunk_width=16, chunks=64, seed=48, scale=0.003, terrace=None):
+    """
+    Report how many triangles greedy meshing saves per chunk, and check it
+    covers the same top and wall area as the per-tile mesh.
+
+    :param terrace: If set, round heights down to multiples of this first,
+                    to see how merging does on terrain with flat regions.
+    """
+    coords = [(chunk_x, chunk_z) for chunk_x in range(-4, 4) for chunk_z in range(-(chunks // 16), chunks // 16)][:chunks]
+    reductions = []
+    tile_time = 0
+    greedy_time = 0
+    for chunk_x, chunk_z in coords:
+        heights = ChunkGenerator.generate_chunk_heights(chunk_x, chunk_z, seed, scale, 1000, chunk_width)
+        if terrace:
+            heights = np.floor(heights / terrace) * terrace
+        start_x, start_z = chunk_x * chunk_width, chunk_z * chunk_width
+
+        start = time.perf_counter()
+        tile_array, tile_count = ChunkGenerator.build_chunk_mesh(heights, start_x, start_z, 1000)
+        tile_time += time.perf_counter() - start
+        start = time.perf_counter()
+        greedy_array, greedy_count = ChunkGenerator.build_greedy_chunk_mesh(heights, start_x, start_z, 1000)
+        greedy_time += time.perf_counter() - start
+
+        for vertex_array in (tile_array, greedy_array):
+            quads = vertex_array.reshape(-1, 6, 6).astype(np.float64)
+            top = np.ptp(quads[:, :, 1], axis=1) == 0
+            top_area = (np.ptp(quads[top, :, 0], axis=1) * np.ptp(quads[top, :, 2], axis=1)).sum()
+            wall_width = np.maximum(np.ptp(quads[~top, :, 0], axis=1), np.ptp(quads[~top, :, 2], axis=1))
+            wall_area = (wall_width * np.ptp(quads[~top, :, 1], axis=1)).sum()
+            if vertex_array is tile_array:
+                reference_area = (top_area, wall_area)
+        assert top_area == reference_area[0] == chunk_width * chunk_width, "greedy mesh top faces do not cover the chunk"
+        np.testing.assert_allclose(wall_area, reference_area[1], rtol=1e-6)
+        reductions.append(1 - greedy_count / tile_count)
+
+    reductions = np.array(reductions) * 100
+    label = f"terraced to {terrace}" if terrace else "raw heights"
+    print(f"greedy mesh {chunk_width}x{chunk_width} ({label}): triangles per chunk "
+          f"-{reductions.mean():.1f}% mean, -{reductions.min():.1f}% min, -{reductions.max():.1f}% max; "
+          f"{tile_time / len(coords) * 1000:.2f} -> {greedy_time / len(coords) * 1000:.2f} ms/chunk")
+
+
+def bench_lod(chunk_width=16, render_distances=(10, 20, 30), lod_distances=(8, 16, 24), seed=48, scale=0.003):
+    """
+    Compare the total triangle count and generation time of the whole render
+    area ((2 * render_distance + 1)^2 chunks) at full detail and with LOD rings.
+
+    :param render_distances: Render distances (in chunks) to compare.
+    :param lod_distances: LOD bands to use, see MeshMap.
+    """
+    for render_distance in render_distances:
+        coords = [(dx, dz) for dx in range(-render_distance, render_distance + 1) for dz in range(-render_distance, render_distance + 1)]
+        results = []
+        for lod in (None, lod_distances):
+            mesh_map = MeshMap(chunk_width=chunk_width, render_distance=render_distance, chunks_per_update=1, seed=seed,
+                               scale=scale, height_limit=1000, executor='inline', lod_distances=lod)
+            start = time.perf_counter()
+            vertices = 0
+            for coord in coords:
+                vertices += mesh_map.generate_chunk(coord, mesh_map.get_lod_step(*coord))[2]
+            results.append((vertices // 3, time.perf_counter() - start))
+        (full_triangles, full_time), (lod_triangles, lod_time) = results
+        print(f"render distance {render_distance} ({len(coords)} chunks): "
+              f"full detail {full_triangles / 1e6:.2f}M triangles in {full_time:.2f} s, "
+              f"LOD {lod_distances} {lod_triangles / 1e6:.2f}M triangles in {lod_time:.2f} s "
+              f"({full_triangles / lod_triangles:.1f}x fewer triangles, {full_time / lod_time:.1f}x faster)")
+
+
+def check_frustum_culling(chunk_width=16, render_distance=20, seed=48, scale=0.003, boxes=20000):
+    """
+    Check the frustum box test against sampled points, then cull a render
+    area of chunks (bounds only, no VBOs) for a camera like the game's and
+    report drawn/culled counts and the time per frame.
+    """
+    projection = Frustum.perspective_matrix(45, 1500 / 900, 0.01, 2000)
+    eye = np.array([0.0, 400.0, 30.0])
+    view = Frustum.look_at_matrix(eye, (0, 380, 0), (0, 1, 0))
+    frustum = Frustum.Frustum(projection, view)
+    # The look-at point projects to the center of the screen.
+    clip = projection @ view @ np.array([0, 380, 0, 1.0])
+    np.testing.assert_allclose(clip[:2] / clip[3], 0, atol=1e-12)
+
+    # Any box with a sampled point inside the frustum must be kept.
+    rng = np.random.default_rng(seed)
+    mins = rng.uniform(-1500, 1500, (boxes, 3))
+    maxs = mins + rng.uniform(1, 100, (boxes, 3))
+    kept = frustum.contains_boxes(mins, maxs)
+    samples = mins[:, None, :] + rng.uniform(0, 1, (boxes, 64, 3)) * (maxs - mins)[:, None, :]
+    seen = frustum.contains_points(samples.reshape(-1, 3)).reshape(boxes, 64).any(axis=1)
+    assert not np.any(seen & ~kept), "frustum culled a visible box"
+
+    mesh_map = MeshMap(chunk_width=chunk_width, render_distance=render_distance, chunks_per_update=1, seed=seed,
+                       scale=scale, height_limit=1000, executor='inline', headless=True)
+    for dx in range(-render_distance, render_distance + 1):
+        for dz in range(-render_distance, render_distance + 1):
+            mesh_map.store_chunk((dx, dz), *mesh_map.generate_chunk((dx, dz)))
+    chunks = mesh_map.get_resident_chunks()
+    cull = mesh_map.cull
+    for label, args in (('no culling', (None, None)), ('frustum', (frustum, None)),
+                        ('frustum + distance', (frustum, render_distance * chunk_width * 0.75))):
+        start = time.perf_counter()
+        for _ in range(20):
+            drawn = cull((eye[0], eye[2]), *args)
+        elapsed = (time.perf_counter() - start) / 20
+        stats = mesh_map.get_render_stats()
+        if args[0] is not None:
+            # Everything behind the camera (which looks towards -z) is culled.
+            assert all(coord[1] * chunk_width < eye[2] + chunk_width for coord, _ in drawn), "drew a chunk behind the camera"
+        print(f"culling {len(chunks)} chunks ({label}): {stats['drawn_chunks']} drawn, "
+              f"{stats['frustum_culled']} frustum culled, {stats['distance_culled']} distance culled, "
+              f"{elapsed * 1000:.2f} ms/frame")
+
+
+def bench_draw_calls(chunk_width=10, render_distances=(5, 10, 20), seed=48, scale=0.003, frames=20):
+    """
+    Count the OpenGL calls one frame of MeshMap.render makes in each draw
+    mode, against a mocked GL layer, and time the Python side of a frame.
+    Also checks a map left to its defaults draws triangles from arenas, and
+    that drawing indexed chunks batched warns.
+
+    :param render_distances: Render distances (in chunks) to compare.
+    :param frames: Number of frames to average the time over.
+    """
+    modes = [(mode, 'triangles') for mode in DRAW_MODES] + [('batched', 'indexed')]
+    for render_distance in render_distances:
+        for draw_mode, mesh_format in modes:
+            with GLCallCounter(MeshMap_module, VertexArena, VBOPool, mock=True) as counter, warnings.catch_warnings():
+                # Batched indexed chunks warn about their call count, which is what is measured here.
+                warnings.simplefilter('ignore')
+                mesh_map = MeshMap(chunk_width=chunk_width, render_distance=render_distance, chunks_per_update=1,
+                                   seed=seed, scale=scale, height_limit=1000, initial_target=(0, 0), executor='inline',
+                                   mesh_format=mesh_format, draw_mode=draw_mode, evict_distance=render_distance)
+                counter.reset()
+                start = time.perf_counter()
+                for _ in range(frames):
+                    mesh_map.render((0, 0))
+                elapsed = (time.perf_counter() - start) / frames
+                calls = counter.total() // frames
+                drawn = mesh_map.get_render_stats()['drawn_chunks']
+                arenas = mesh_map.get_memory_stats()['arenas']
+                mesh_map.cleanup()
+            print(f"draw calls, {drawn} chunks ({draw_mode}, {mesh_format}"
+                  f"{f', {arenas} arenas' if arenas else ''}): {calls} GL calls/frame, {elapsed * 1000:.2f} ms/frame")
+
+    with GLCallCounter(MeshMap_module, VertexArena, VBOPool, mock=True), warnings.catch_warnings(record=True) as caught:
+        warnings.simplefilter('always')
+        mesh_map = MeshMap(chunk_width=chunk_width, render_distance=1, chunks_per_update=1, seed=seed, scale=scale,
+                           height_limit=1000, initial_target=(0, 0), executor='inline')
+        assert mesh_map.get_memory_stats()['arenas'] > 0, "the default draw mode is not 'arena'"
+        mesh_map.cleanup()
+        assert not caught, "the defaults warned"
+        mesh_map = MeshMap(chunk_width=chunk_width, render_distance=1, chunks_per_update=1, seed=seed, scale=scale,
+                           height_limit=1000, initial_target=(0, 0), executor='inline', mesh_format='indexed')
+        mesh_map.cleanup()
+        assert any('indexed' in str(warning.message) for warning in caught), "batched indexed chunks did not warn"
+
+
+def bench_tile_height(chunk_width=10, render_distance=5, seed=48, scale=0.003, queries=10000):
+    """
+    Time get_tile_height with and without its cache for random queries (mostly
+    outside the loaded area), repeated ones (a few hundred tiles outside it, like
+    enemies waiting past the edge) and spatially coherent ones (a walk through
+    the loaded area, like the player, camera and enemies make), against a bare
+    noise.pnoise2 call each.
+    """
+    with GLCallCounter(MeshMap_module, VertexArena, VBOPool, mock=True):
+        mesh_maps = {size: MeshMap(chunk_width=chunk_width, render_distance=render_distance, chunks_per_update=1, seed=seed,
+                                   scale=scale, height_limit=1000, initial_target=(0, 0), executor='inline',
+                                   tile_height_cache_size=size)
+                     for size in (0, 4096)}
+        rng = np.random.default_rng(seed)
+        loaded = render_distance * 2 * chunk_width
+        walk = np.cumsum(rng.normal(0, 0.3, (queries, 2)), axis=0)
+        walk = np.clip(walk, -loaded, loaded)
+        repeated = rng.uniform(-20000, 20000, (300, 2))[rng.integers(0, 300, queries)]
+        for label, positions in (('random', rng.uniform(-20000, 20000, (queries, 2))), ('repeated', repeated), ('coherent', walk)):
+            positions = [tuple(position) for position in positions]
+            start = time.perf_counter()
+            for x, z in positions:
+                noise.pnoise2(x * scale, z * scale, 4, 0.5, 2.0, 1024, 1024, seed)
+            noise_time = time.perf_counter() - start
+            lookup_times = {}
+            for size, mesh_map in mesh_maps.items():
+                start = time.perf_counter()
+                heights = [mesh_map.get_tile_height(position) for position in positions]
+                lookup_times[size] = time.perf_counter() - start
+                reference = mesh_map.get_heights(np.floor(positions)[:, 0], np.floor(positions)[:, 1]).astype(np.float32)
+                np.testing.assert_allclose(heights, reference, rtol=1e-6)
+            print(f"get_tile_height {queries} {label} queries: noise {noise_time / queries * 1e6:.2f} us, "
+                  f"lookup {lookup_times[0] / queries * 1e6:.2f} us uncached, {lookup_times[4096] / queries * 1e6:.2f} us "
+                  f"with a 4096 tile cache ({lookup_times[0] / lookup_times[4096]:.1f}x)")
+        for mesh_map in mesh_maps.values():
+            mesh_map.cleanup()
+
+
+def bench_bulk_heights(chunk_width=10, render_distance=5, seed=48, scale=0.003, swarm_sizes=(100, 1000, 5000)):
+    """
+    Compare one get_tile_height call per entity against one get_tile_heights
+    call for the whole swarm, for swarms around the player with a few
+    stragglers outside the loaded area. Also checks the bulk heights match
+    and that interpolated heights agree with the tile heights at tile corners.
+    """
+    with GLCallCounter(MeshMap_module, VertexArena, VBOPool, mock=True):
+        mesh_map = MeshMap(chunk_width=chunk_width, render_distance=render_distance, chunks_per_update=1, seed=seed,
+                           scale=scale, height_limit=1000, initial_target=(0, 0), executor='inline')
+        rng = np.random.default_rng(seed)
+        # The chunk index is built on the first query after chunks change, not every frame.
+        mesh_map.get_tile_heights([(0, 0)])
+        for swarm_size in swarm_sizes:
+            positions = rng.normal(0, render_distance * chunk_width, (swarm_size, 2))
+            positions[:swarm_size // 20] *= 20
+
+            start = time.perf_counter()
+            single = np.array([mesh_map.get_tile_height(tuple(position)) for position in positions])
+            single_time = time.perf_counter() - start
+            start = time.perf_counter()
+            bulk = mesh_map.get_tile_heights(positions)
+            bulk_time = time.perf_counter() - start
+            start = time.perf_counter()
+            mesh_map.get_tile_heights(positions, interpolate=True)
+            interpolated_time = time.perf_counter() - start
+
+            np.testing.assert_allclose(bulk, single, rtol=1e-6)
+            corners = np.floor(positions)
+            np.testing.assert_array_equal(mesh_map.get_tile_heights(corners, interpolate=True), mesh_map.get_tile_heights(corners))
+            print(f"{swarm_size} entity heights: per entity {single_time * 1000:.2f} ms, "
+                  f"bulk {bulk_time * 1000:.2f} ms ({single_time / bulk_time:.1f}x), "
+                  f"bulk interpolated {interpolated_time * 1000:.2f} ms")
+        mesh_map.cleanup()
+
+
+def _time_terrain_queries(mesh_map) -> list:
+    """
+    Wrap mesh_map's terrain height queries so the time spent in them adds up.
+
+    :return: A one element list holding the seconds spent so far; reset it by assigning 0.0.
+    """
+    terrain_time = [0.0]
+
+    def timed(query):
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            result = query(*args, **kwargs)
+            terrain_time[0] += time.perf_counter() - start
+            return result
+        return wrapper
+
+    for name in ('get_tile_heights', 'get_tile_corner_heights', 'interpolate_tile_heights'):
+        setattr(mesh_map, name, timed(getattr(mesh_map, name)))
+    return terrain_time
+
+
+def bench_swarm(chunk_width=10, render_distance=5, seed=48, scale=0.003, swarm_sizes=(100, 1000, 10000), frames=20,
+                budget_ms=2.0, strict=False):
+    """
+    Time EnemyManager.update (flocking off) for swarms spread around the player on a
+    headless map, against the old loop over per enemy position arrays, with the time spent
+    in the terrain height queries split out. Also checks both move enemies the same, that
+    the heights kept for enemies staying on their tile match a fresh query (with and
+    without interpolation), and reports whether the whole update, terrain included, fits
+    the budget for swarms of up to 10k.
+
+    :param budget_ms: Most milliseconds a whole update of 10k enemies should take.
+    :param strict: Fail when an update goes over the budget instead of only reporting it.
+                   Timings vary between machines and runs, so this is off by default.
+    """
+    mesh_map = MeshMap(chunk_width=chunk_width, render_distance=render_distance, chunks_per_update=1, seed=seed,
+                       scale=scale, height_limit=1000, initial_target=(0, 0), executor='inline', headless=True)
+    terrain_time = _time_terrain_queries(mesh_map)
+    rng = np.random.default_rng(seed)
+    player_position = (np.float32(3.5), np.float32(0), np.float32(-2.5), np.float32(0))
+    dt = 1 / 60
+    for swarm_size in swarm_sizes:
+        manager = Entity.EnemyManager(mesh_map, spawn_radius=50, spawn_rate=math.inf, group_spawn_size=4)
+        manager.flocking = False
+        offsets = rng.uniform(-render_distance * chunk_width, render_distance * chunk_width, (swarm_size, 2))
+        manager.add_enemies([(x, 0, z, 0) for x, z in offsets])
+        old_positions = [np.array((x, 0, z, 0), dtype=np.float32) for x, z in offsets]
+
+        terrain_time[0] = 0.0
+        start = time.perf_counter()
+        for _ in range(frames):
+            for position in old_positions:
+                target = np.array(player_position[:3])
+                direction = target - position[:3]
+                distance = np.linalg.norm(direction)
+                if distance > 0:
+                    direction /= distance
+                    position[:3] += direction * 2 * dt
+            heights = mesh_map.get_tile_heights(np.array([(position[0], position[2]) for position in old_positions]),
+                                                interpolate=manager.interpolate_heights)
+            for position, height in zip(old_positions, heights):
+                position[1] = height
+        old_time = (time.perf_counter() - start - terrain_time[0]) / frames
+
+        terrain_time[0] = 0.0
+        start = time.perf_counter()
+        for _ in range(frames):
+            manager.update(player_position, dt)
+        update_time = (time.perf_counter() - start) / frames
+        new_terrain_time = terrain_time[0] / frames
+
+        np.testing.assert_allclose(manager.positions[:swarm_size], np.array(old_positions), rtol=1e-5, atol=1e-4)
+        # Kept corner heights must give exactly what a fresh query does.
+        fresh = mesh_map.get_tile_heights(manager.positions[:swarm_size, 0:3:2], manager.interpolate_heights).astype(np.float32)
+        assert np.array_equal(manager.positions[:swarm_size, 1], fresh), "kept tile heights went stale"
+        over_budget = swarm_size <= 10000 and update_time * 1000 > budget_ms
+        print(f"{swarm_size} enemies: update {update_time * 1000:.2f} ms, of which terrain {new_terrain_time * 1000:.2f} ms; "
+              f"steering {(update_time - new_terrain_time) * 1000:.2f} ms vs old loop {old_time * 1000:.2f} ms "
+              f"({old_time / (update_time - new_terrain_time):.0f}x)"
+              f"{f', OVER the {budget_ms} ms budget' if over_budget else ''}")
+        assert not (strict and over_budget), \
+            f"updating {swarm_size} enemies took {update_time * 1000:.2f} ms, over the {budget_ms} ms budget"
+
+
+    # Enemies blending heights across tiles, which they only do when asked.
+    manager = Entity.EnemyManager(mesh_map, spawn_radius=50, spawn_rate=math.inf, group_spawn_size=4, interpolate_heights=True)
+    manager.add_enemies([(x, 0, z, 0) for x, z in rng.uniform(-render_distance * chunk_width, render_distance * chunk_width, (1000, 2))])
+    terrain_time[0] = 0.0
+    start = time.perf_counter()
+    for _ in range(frames):
+        manager.update(player_position, dt)
+    update_time = (time.perf_counter() - start) / frames
+    fresh = mesh_map.get_tile_heights(manager.positions[:1000, 0:3:2], interpolate=True).astype(np.float32)
+    assert np.array_equal(manager.positions[:1000, 1], fresh), "kept corner heights went stale"
+    print(f"1000 enemies, interpolated heights: update {update_time * 1000:.2f} ms, of which terrain {terrain_time[0] / frames * 1000:.2f} ms")
+    mesh_map.cleanup()
+
+
+def bench_attacks(chunk_width=16, seed=48, scale=0.003, swarm_sizes=(100, 1000, 10000, 50000), area=160, attacks=200,
+                  kills=50):
+    """
+    Compare finding the enemies a melee attack hits by testing every enemy against
+    the attack circle with a query of the enemy manager's spatial grid, for swarms of
+    growing size spread over the same area. Then time lethal attacks, which also
+    remove the dead from the swarm and the grid, and single kills, and time keeping the
+    grid up to date as the swarm moves. Checks the grid, through its cells and through
+    its direct test of every point, finds exactly the enemies brute force does, before
+    and after the removals.
+
+    :param area: Width of the square around the player the enemies are spread over.
+    :param attacks: Number of attacks at random spots to average over.
+    :param kills: Number of single kills to take the median of.
+    """
+    mesh_map = MeshMap(chunk_width=chunk_width, render_distance=3, chunks_per_update=1, seed=seed,
+                       scale=scale, height_limit=1000, initial_target=(0, 0), executor='inline', headless=True)
+    rng = np.random.default_rng(seed)
+
+    def check_queries(manager, centers, radius, message):
+        positions = manager.positions[:len(manager.enemies), 0:3:2]
+        direct_limit = manager.grid.direct_limit
+        for limit in (0, math.inf):
+            manager.grid.direct_limit = limit
+            for x, z in centers:
+                expected = np.flatnonzero(np.hypot(positions[:, 0] - x, positions[:, 1] - z) <= radius)
+                found = manager.grid.query_radius((x, z), radius, positions)
+                assert np.array_equal(np.sort(found), expected), message
+        manager.grid.direct_limit = direct_limit
+
+    for swarm_size in swarm_sizes:
+        manager = Entity.EnemyManager(mesh_map, spawn_radius=50, spawn_rate=math.inf, group_spawn_size=4)
+        placements = np.zeros((swarm_size, 4))
+        placements[:, [0, 2]] = rng.uniform(-area / 2, area / 2, (swarm_size, 2))
+        manager.add_enemies(placements)
+        positions = manager.positions[:swarm_size, 0:3:2]
+        centers = rng.uniform(-area / 2, area / 2, (attacks, 2))
+        radius = 3.0
+        check_queries(manager, centers[:20], radius, "grid query missed or added enemies")
+
+        start = time.perf_counter()
+        for x, z in centers:
+            np.flatnonzero(np.hypot(positions[:, 0] - x, positions[:, 1] - z) <= radius)
+        brute_time = (time.perf_counter() - start) / attacks
+        start = time.perf_counter()
+        for center in centers:
+            manager.grid.query_radius(center, radius, positions)
+        query_time = (time.perf_counter() - start) / attacks
+
+        # Lethal attacks, so removing the dead and patching the grid is timed too.
+        manager.attack_damage = manager.max_healths[0]
+        start = time.perf_counter()
+        for center in centers:
+            manager.handle_player_attacks(center, radius)
+        attack_time = (time.perf_counter() - start) / attacks
+        killed = swarm_size - len(manager.enemies)
+        # Kills on their own: the cost of a removal without the grid being sorted again.
+        kill_times = []
+        for _ in range(min(kills, len(manager.enemies))):
+            target = manager.positions[len(manager.enemies) // 2, 0:3:2].copy()
+            start = time.perf_counter()
+            manager.handle_player_attacks(target, 1e-3)
+            kill_times.append(time.perf_counter() - start)
+
+        count = len(manager.enemies)
+        assert all(enemy.slot == slot for slot, enemy in enumerate(manager.enemies))
+        assert len(manager.grid) == count
+        check_queries(manager, centers[:20], radius + 5, "grid lost track of enemies after removals")
+        manager.attack_damage = 0
+
+        manager.update((np.float32(0), np.float32(0), np.float32(0), np.float32(0)), 1 / 60)
+        positions = manager.positions[:count]
+        positions[:, [0, 2]] += rng.normal(0, 1 / 30, (count, 2)).astype(np.float32)
+        start = time.perf_counter()
+        moved = manager.grid.update(positions[:, 0:3:2])
+        grid_time = time.perf_counter() - start
+        check_queries(manager, centers[:20], radius, "grid lost track of enemies that moved")
+        print(f"{swarm_size} enemies: attack query {query_time * 1e6:.0f} us with the grid, "
+              f"{brute_time * 1e6:.0f} us testing every enemy ({brute_time / query_time:.1f}x); "
+              f"lethal attack {attack_time * 1e6:.0f} us ({killed} killed); "
+              f"single kill {np.median(kill_times) * 1e6:.0f} us; grid update {grid_time * 1000:.2f} ms ({moved} moved)")
+    mesh_map.cleanup()
+
+
+def bench_flocking(chunk_width=10, seed=48, scale=0.003, swarm_sizes=(1000, 2000, 10000, 50000), frames=30, density=0.3):
+    """
+    Stress test flocking: time EnemyManager.update, less the terrain height query,
+    for swarms spread around the player on a headless map, finding neighbours
+    every update and every flock_interval updates (the default). The mean is
+    what a frame pays on average; the max is the update that searched for
+    neighbours. Swarms flock here whatever their size; the game only flocks
+    swarms up to flock_limit, whose updates should fit the budget. Then check
+    separation stops a swarm collapsing on the player, by counting enemies left
+    on top of another one after a few seconds of chasing with flocking on and off.
+
+    :param density: Enemies per square world unit the swarms start at.
+    """
+    mesh_map = MeshMap(chunk_width=chunk_width, render_distance=3, chunks_per_update=1, seed=seed,
+                       scale=scale, height_limit=1000, initial_target=(0, 0), executor='inline', headless=True)
+    terrain_time = _time_terrain_queries(mesh_map)
+    rng = np.random.default_rng(seed)
+    player_position = (0.0, 0.0, 0.0, 0.0)
+    dt = 1 / 60
+    default_interval = Entity.EnemyManager(mesh_map, spawn_radius=50, spawn_rate=math.inf, group_spawn_size=4).flock_interval
+    for swarm_size in swarm_sizes:
+        radius = math.sqrt(swarm_size / density / math.pi)
+        angles = rng.uniform(0, 2 * math.pi, swarm_size)
+        distances = radius * np.sqrt(rng.uniform(0, 1, swarm_size))
+        placements = np.zeros((swarm_size, 4))
+        placements[:, 0] = distances * np.cos(angles)
+        placements[:, 2] = distances * np.sin(angles)
+        for interval in (1, default_interval):
+            manager = Entity.EnemyManager(mesh_map, spawn_radius=50, spawn_rate=math.inf, group_spawn_size=4)
+            manager.flock_limit = math.inf
+            manager.flock_interval = interval
+            manager.add_enemies(placements)
+            times = []
+            for _ in range(frames):
+                terrain_time[0] = 0.0
+                start = time.perf_counter()
+                manager.update(player_position, dt)
+                times.append(time.perf_counter() - start - terrain_time[0])
+            pairs = len(Entity.neighbour_pairs(manager.positions[:swarm_size, 0:3:2], manager.neighbour_radius)[0])
+            print(f"flocking {swarm_size} enemies, neighbours every {interval} updates: update without the terrain "
+                  f"query mean {np.mean(times) * 1000:.1f} ms, max {np.max(times) * 1000:.1f} ms, "
+                  f"{pairs * 2 / swarm_size:.1f} neighbours per enemy")
+
+    for flocking in (False, True):
+        manager = Entity.EnemyManager(mesh_map, spawn_radius=50, spawn_rate=math.inf, group_spawn_size=4)
+        manager.flocking = flocking
+        placements = np.zeros((500, 4))
+        placements[:, [0, 2]] = rng.uniform(-15, 15, (500, 2))
+        manager.add_enemies(placements)
+        for _ in range(600):
+            manager.update(player_position, dt)
+        first, second, _, _ = Entity.neighbour_pairs(manager.positions[:500, 0:3:2], 0.1)
+        stacked = len(np.unique(np.concatenate((first, second))))
+        print(f"500 enemies chasing for 10 s, flocking {'on' if flocking else 'off'}: {stacked} within 0.1 of another")
+    mesh_map.cleanup()
+
+
+def check_enemy_draw_calls(chunk_width=16, seed=48, scale=0.003, swarm_sizes=(10, 100, 1000, 10000)):
+    """
+    Count the OpenGL calls one frame of EnemyManager.render makes for growing
+    swarms against a mocked GL layer, next to drawing every enemy with
+    Entity.draw_entity_box as before, and check the batched boxes' edges have
+    the same corners as the ones draw_entity_box's transforms give.
+    """
+    mesh_map = MeshMap(chunk_width=chunk_width, render_distance=3, chunks_per_update=1, seed=seed,
+                       scale=scale, height_limit=1000, initial_target=(0, 0), executor='inline', headless=True)
+    rng = np.random.default_rng(seed)
+    batched_calls = set()
+    for swarm_size in swarm_sizes:
+        manager = Entity.EnemyManager(mesh_map, spawn_radius=50, spawn_rate=math.inf, group_spawn_size=4)
+        placements = rng.uniform(-40, 40, (swarm_size, 4))
+        placements[:, 3] = rng.uniform(0, 360, swarm_size)
+        manager.add_enemies(placements)
+        with GLCallCounter(EnemyRenderer, Entity, mock=True) as counter:
+            start = time.perf_counter()
+            manager.render((0, 0, 0, 0), 100)
+            batched_time = time.perf_counter() - start
+            batched = counter.total()
+            counter.reset()
+            start = time.perf_counter()
+            for enemy in manager.enemies:
+                enemy.draw_entity_box(color=(1.0, 1.0, 1.0))
+            per_enemy_time = time.perf_counter() - start
+            per_enemy = counter.total()
+            manager.cleanup()
+        batched_calls.add(batched)
+        print(f"enemy draw calls, {swarm_size} enemies: {batched} GL calls batched ({batched_time * 1000:.2f} ms), "
+              f"{per_enemy} drawing each box ({per_enemy_time * 1000:.2f} ms)")
+    assert len(batched_calls) == 1, "batched enemy rendering makes more GL calls for more enemies"
+
+    # The same corners as glTranslatef(x, y, z) then glRotatef(-heading, 0, 1, 0).
+    positions = manager.positions[:len(manager.enemies)]
+    vertices = EnemyRenderer.EnemyRenderer.build_vertices(positions, manager.widths[:len(positions)], np.ones(len(positions)))
+    # Expanded through the index buffer into the line vertices that are drawn.
+    vertices = vertices[EnemyRenderer.EnemyRenderer.box_indices(len(positions))].reshape(len(positions), -1, 6)
+    for slot in rng.integers(0, len(positions), 20):
+        x, y, z, heading = positions[slot].astype(np.float64)
+        angle = math.radians(-heading)
+        rotation = np.array([[math.cos(angle), 0, math.sin(angle)], [0, 1, 0], [-math.sin(angle), 0, math.cos(angle)]])
+        half_width = manager.widths[slot] / 2
+        local = EnemyRenderer._BOX_LINES * (half_width, half_width * 4, half_width)
+        np.testing.assert_allclose(vertices[slot, :, :3], local @ rotation.T + (x, y, z), rtol=1e-5, atol=1e-4)
+    mesh_map.cleanup()
+
+
+def check_player_render(frames=30, camera_distances=(10.0, 40.0, 80.0)):
+    """
+    Render the player against a mocked GL layer and check its meshes are built
+    once and then only drawn: after the first frame no buffers are created and
+    each frame makes a fixed number of GL calls. Also check the cached meshes
+    lie on the unit cone and sphere, and print how many vertices the player is
+    drawn with at each camera distance.
+    """
+    for shape, (vertices, indices) in (('cone', MeshCache.cone_mesh(50, 50)), ('sphere', MeshCache.sphere_mesh(50, 50))):
+        radii = np.hypot(vertices[:, 0], vertices[:, 1])
+        if shape == 'cone':
+            np.testing.assert_allclose(radii, 1 - vertices[:, 2], atol=1e-6)
+        else:
+            np.testing.assert_allclose(np.hypot(radii, vertices[:, 2]), 1, atol=1e-6)
+        assert indices.max() < len(vertices) and len(indices) % 3 == 0
+
+    player = Entity.Player((0, 0, 0, 30), 0.1, 0.01, 0.1, 1.0, 0.05, 1.0, 1.0)
+    player.melee_attack()
+    with GLCallCounter(Entity, MeshCache, mock=True) as counter:
+        player.render()
+        first_frame = counter.total()
+        counter.reset()
+        frame_calls = set()
+        for frame in range(frames):
+            player.attack_timer = player.attack_duration * frame / frames
+            player.render()
+            frame_calls.add((counter.total(), counter.counts['glDrawElements']))
+            assert counter.counts['glGenBuffers'] == 0, "player meshes were rebuilt"
+            counter.reset()
+        assert len(frame_calls) == 1, "player render call count changed between frames"
+        calls, draws = frame_calls.pop()
+        # GLU sent every vertex of the 50 x 50 body and head and the 20 x 5 attack cone each frame.
+        immediate_vertices = 50 * 51 * 2 * 2 + 5 * 21 * 2
+        print(f"player render: {first_frame} GL calls building meshes, {calls} per frame after with {draws} draws; "
+              f"GLU sent {immediate_vertices} vertices a frame")
+        for camera_distance in (None,) + camera_distances:
+            vertex_count = sum(player.mesh_cache.get_mesh(shape, *player.mesh_cache.get_detail(slices, stacks, camera_distance))['vertex_count']
+                               for shape, slices, stacks in (('cone', 50, 50), ('sphere', 50, 50), ('cone', 20, 5)))
+            print(f"    camera distance {camera_distance}: {vertex_count} cached vertices")
+    print(f"    {player.mesh_cache.get_mesh_count()} meshes cached")
+
+
+def _make_simulation(mesh_map, seed):
+    """
+    A fresh player and enemy manager on mesh_map, with the random spawns seeded.
+    """
+    player = Entity.Player((0, 0, 0, 45), 2, 0.1, 0.7, 0.7, 0.1, -1.5, 0.75)
+    enemy_manager = Entity.EnemyManager(mesh_map, spawn_radius=30, spawn_rate=0.25, group_spawn_size=6, seed=seed)
+    return Simulation(mesh_map, player, enemy_manager)
+
+
+def check_fixed_timestep(chunk_width=10, render_distance=5, seed=48, scale=0.003, steps=600, soak_steps=3600):
+    """
+    Run the game headless through a FixedTimestep with steady frames and with
+    frames of random length, with a camera (against a mocked GL layer) following
+    the player, and check both end in the same state, camera zoom included, so
+    frame rate no longer changes gameplay or the view. Also check a long frame is capped at
+    max_substeps, and time how much faster than real time a headless soak runs.
+    """
+    mesh_map = MeshMap(chunk_width=chunk_width, render_distance=render_distance, chunks_per_update=1, seed=seed,
+                       scale=scale, height_limit=1000, initial_target=(0, 0), executor='inline', headless=True)
+    # Zooming out as far as the camera goes, so the terrain gets in its way.
+    keys = collections.defaultdict(bool, {K_UP: True, K_d: True, K_m: True, K_e: True})
+    rng = np.random.default_rng(seed)
+    frame_times = {'steady 60 fps': np.full(steps * 2, 1 / 60), 'random 2-70 ms': rng.uniform(0.002, 0.07, steps * 2)}
+    states = {}
+    for name, frames in frame_times.items():
+        simulation = _make_simulation(mesh_map, seed)
+        timestep = FixedTimestep(step=simulation.step_time, max_substeps=5)
+        frame_count = 0
+        zoom_collisions = 0
+        with GLCallCounter(Camera_module, mock=True):
+            camera = Camera_module.Camera(simulation.player, mesh_map, (1500, 900), 1000)
+            for frame_time in frames:
+                if simulation.steps == steps:
+                    break
+                frame_count += 1
+                for _ in range(min(timestep.advance(frame_time), steps - simulation.steps)):
+                    simulation.step(keys)
+                    camera.update(keys)
+                    zoom_collisions += camera.zoom_cooldown == 20
+                camera.apply(timestep.alpha)
+        manager = simulation.enemy_manager
+        states[name] = (np.array(simulation.player.position), manager.positions[:len(manager.enemies)].copy(),
+                        (camera.zoom_distance, camera.user_zoom_distance, camera.zoom_cooldown))
+        print(f"fixed timestep, {name}: {frame_count} frames for {steps} steps, "
+              f"{len(manager.enemies)} enemies, player at {np.round(states[name][0][:3], 2)}, "
+              f"camera zoom {camera.zoom_distance:g} after {zoom_collisions} steps zooming in past terrain")
+    (player_a, enemies_a, camera_a), (player_b, enemies_b, camera_b) = states.values()
+    assert np.array_equal(player_a, player_b) and np.array_equal(enemies_a, enemies_b), "frame times changed the simulation"
+    assert camera_a == camera_b, "frame times changed the camera's zoom"
+
+    timestep = FixedTimestep(step=1 / 60, max_substeps=5)
+    spike_steps = timestep.advance(1.0)
+    assert spike_steps == 5 and 0 <= timestep.alpha < 1
+    print(f"    a 1 s frame runs {spike_steps} steps and drops {timestep.dropped_time:.3f} s")
+
+    simulation = _make_simulation(mesh_map, seed)
+    start = time.perf_counter()
+    simulation.run(soak_steps, keys)
+    elapsed = time.perf_counter() - start
+    print(f"    headless soak: {simulation.get_simulated_time():.0f} s simulated in {elapsed:.2f} s "
+          f"({simulation.get_simulated_time() / elapsed:.1f}x real time, {len(simulation.enemy_manager.enemies)} enemies)")
+    mesh_map.cleanup()
+
+
+def check_headless_determinism(ticks=1200, seed=7):
+    """
+    Run the headless game twice with the same seed and input script and check
+    the final state hashes match, and that another seed or script changes
+    them. Prints each run's throughput and where its ticks went.
+    """
+    script = scripted_input([(0, ticks, (K_UP,)), (0, ticks // 3, (K_d,)), (ticks // 2, ticks, (K_m,))])
+    hashes = []
+    for run_seed, input_script in ((seed, script), (seed, script), (seed + 1, script), (seed, None)):
+        runner = HeadlessRunner(seed=run_seed, input_script=input_script, render_distance=5, spawn_rate=0.25)
+        report = runner.run(ticks)
+        runner.cleanup()
+        hashes.append(report['state_hash'])
+        subsystems = ", ".join(f"{name} {timing['per_tick_ms']:.3f}" for name, timing in report['subsystems'].items())
+        print(f"headless run, seed {run_seed}, {'scripted' if input_script else 'circling'} input: "
+              f"{report['ticks_per_second']:.0f} ticks/s, {report['enemies']} enemies, hash {report['state_hash'][:12]}; "
+              f"ms per tick: {subsystems}")
+    assert hashes[0] == hashes[1], "the same seed and input gave different states"
+    assert hashes[0] != hashes[2] and hashes[0] != hashes[3], "seed or input did not change the state"
+
+
+def check_profiler(ticks=600, calls=200000):
+    """
+    Measure what a profiled call costs with the profiler off and on, profile a
+    headless run and check its breakdown names the game's scopes and its Chrome
+    trace is well formed, and that the ring buffer keeps only the last frames.
+    """
+    def plain():
+        pass
+
+    @profiled('check_profiler.noop')
+    def wrapped():
+        pass
+
+    def time_calls(function):
+        start = time.perf_counter()
+        for _ in range(calls):
+            function()
+        return (time.perf_counter() - start) / calls * 1e9
+
+    baseline = time_calls(plain)
+    profiler.enabled = False
+    disabled = time_calls(wrapped)
+    profiler.enabled = True
+    profiler.begin_frame()
+    enabled = time_calls(wrapped)
+    profiler.enabled = False
+    profiler.clear()
+    print(f"profiler: a call costs {baseline:.0f} ns plain, {disabled:.0f} ns profiled while off, "
+          f"{enabled:.0f} ns profiled while on")
+
+    reports = {}
+    for enabled in (False, True):
+        profiler.enabled = enabled
+        runner = HeadlessRunner(seed=3, render_distance=5, spawn_rate=0.25)
+        reports[enabled] = runner.run(ticks)
+        runner.cleanup()
+    profiler.enabled = False
+    assert reports[False]['state_hash'] == reports[True]['state_hash'], "profiling changed the simulation"
+    print(f"    headless run: {reports[False]['ticks_per_second']:.0f} ticks/s unprofiled, "
+          f"{reports[True]['ticks_per_second']:.0f} ticks/s profiled")
+    breakdown = profiler.get_breakdown()
+    for name, timing in breakdown.items():
+        print(f"    {name}: p50 {timing['p50']:.3f} ms, p99 {timing['p99']:.3f} ms")
+    for name in ('frame', 'MeshMap.update', 'EnemyManager.update', 'EnemyManager.handle_player_attacks'):
+        assert name in breakdown, f"{name} missing from the breakdown"
+    assert profiler.get_frame_count() == min(ticks, profiler.capacity)
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'trace.json')
+        profiler.export_chrome_trace(path)
+        with open(path) as file:
+            trace = json.load(file)
+    events = trace['traceEvents']
+    assert events and all(event['ph'] == 'X' and event['dur'] >= 0 for event in events)
+    frames = sorted((event['ts'], event['ts'] + event['dur']) for event in events if event['name'] == 'frame')
+    inside = sum(any(start <= event['ts'] and event['ts'] + event['dur'] <= end + 1e-3 for start, end in frames)
+                 for event in events if event['name'] != 'frame')
+    print(f"    Chrome trace: {len(events)} events, {inside} of {len(events) - len(frames)} scopes inside a frame")
+    profiler.clear()
+
+    ring = Profiler(capacity=10, enabled=True)
+    for _ in range(25):
+        ring.begin_frame()
+        with ring.scope('work'):
+            pass
+        ring.end_frame()
+    assert ring.get_frame_count() == 10 and set(ring.get_breakdown()) == {'frame', 'work'}
+
+
+# Committed input recordings that make up the replay benchmark suite.
+REPLAY_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'replays')
+
+
+def make_benchmark_replays(directory=REPLAY_DIRECTORY, seed=48):
+    """
+    Write the replay suite's recordings, as if played at a shaky 60 to 120 fps:
+    'traversal', a minute of running across the map with the normal spawns, and
+    'swarm_fight', a minute of circling and attacking in a fast spawning swarm.
+    Each stores the state hash its replay ends in, so later replays show whether
+    the game still plays it the same.
+    """
+    def traversal_keys(frame):
+        # Run forward, weaving left and right, zooming the camera out then in.
+        keys = [K_UP, K_d if (frame // 300) % 3 == 0 else K_a if (frame // 300) % 3 == 1 else None]
+        keys.append(K_e if frame < 120 else K_q if 3000 <= frame < 3120 else None)
+        return keys
+
+    def swarm_fight_keys(frame):
+        return (K_UP, K_m, K_d if (frame // 400) % 2 == 0 else K_a)
+
+    suite = {
+        'traversal': (traversal_keys, {'seed': 1}),
+        'swarm_fight': (swarm_fight_keys, {'seed': 2, 'render_distance': 5, 'spawn_rate': 0.1, 'group_spawn_size': 10})
+    }
+    os.makedirs(directory, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    for name, (keys_at, settings) in suite.items():
+        runner = HeadlessRunner(**settings)
+        recording = InputRecording({'name': name, 'settings': runner.settings, 'max_substeps': 5})
+        frame_ms = []
+        while sum(frame_ms) < 60000:
+            frame_ms.append(int(rng.choice((8, 8, 9, 16, 17, 17, 25, 33))))
+        for frame, milliseconds in enumerate(frame_ms):
+            pressed = keys_at(frame)
+            recording.record(milliseconds, collections.defaultdict(bool, {key: True for key in pressed if key is not None}))
+        recording.metadata['state_hash'] = runner.replay(recording)['state_hash']
+        runner.cleanup()
+        path = os.path.join(directory, f"{name}.swrp")
+        recording.save(path)
+        print(f"wrote {path}: {len(recording)} frames, {os.path.getsize(path)} bytes")
+
+
+def bench_replays(paths=None, log=sys.stdout) -> list:
+    """
+    Replay recordings headless and report each frame's processing time as a
+    histogram, so runs of the same recordings can be compared across versions,
+    and whether the replay still ends in the recorded state.
+
+    :param paths: Recording files; None for every recording in REPLAY_DIRECTORY.
+    :param log: Where to print.
+    :return: A result dict per recording: its 'name' and path, plus the replay report.
+    """
+    if paths is None:
+        paths = sorted(os.path.join(REPLAY_DIRECTORY, name) for name in os.listdir(REPLAY_DIRECTORY) if name.endswith('.swrp'))
+    results = []
+    for path in paths:
+        recording = InputRecording.load(path)
+        runner = HeadlessRunner.from_recording(recording)
+        report = runner.replay(recording)
+        runner.cleanup()
+        frame_times = report['frame_times']
+        histogram = " ".join(f"{'<=' + format(bin['up_to_ms'], 'g') if bin['up_to_ms'] is not None else '>'}:{bin['frames']}"
+                             for bin in frame_times['histogram'])
+        print(f"replay {recording.metadata.get('name', path)}: {frame_times['frames']} frames, {report['ticks']} ticks, "
+              f"{report['enemies']} enemies; frame ms p50 {frame_times['p50_ms']:.2f}, p95 {frame_times['p95_ms']:.2f}, "
+              f"p99 {frame_times['p99_ms']:.2f}, max {frame_times['max_ms']:.2f}; "
+              f"{'matches' if report['matches_recording'] else 'DIFFERS FROM'} the recording", file=log)
+        print(f"    ms histogram {histogram}", file=log)
+        results.append(dict(report, name=recording.metadata.get('name'), path=path))
+    return results
+
+
+def _machine_info() -> dict:
+    """
+    The interpreter, numpy version and machine a JSON report was made on.
+    """
+    return {
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count()
+    }
+
+
+def run_replays(args):
+    """
+    Run bench_replays for the replay command, plus the JSON report if asked for.
+
+    :param args: Parsed arguments of the replay command.
+    """
+    log = sys.stderr if args.json == '-' else sys.stdout
+    results = bench_replays(args.paths or None, log=log)
+    if args.json is None:
+        return
+    report = {
+        'machine': _machine_info(),
+        'results': results
+    }
+    if args.json == '-':
+        json.dump(report, sys.stdout, indent=2)
+        print()
+    else:
+        with open(args.json, 'w') as file:
+            json.dump(report, file, indent=2)
+
+
+def run_simulation(args):
+    """
+    Run the headless game for the simulate command and print its report, plus
+    the JSON report if asked for.
+
+    :param args: Parsed arguments of the simulate command.
+    """
+    log = sys.stderr if args.json == '-' else sys.stdout
+    runner = HeadlessRunner(seed=args.seed, chunk_width=args.chunk_width, render_distance=args.render_distance,
+                            spawn_rate=args.spawn_rate, group_spawn_size=args.group_spawn_size, executor=args.executor)
+    report = runner.run(args.ticks)
+    runner.cleanup()
+    print(f"{report['ticks']} ticks ({report['simulated_seconds']:.0f} s simulated) in {report['seconds']:.2f} s: "
+          f"{report['ticks_per_second']:.0f} ticks/s, {report['enemies']} enemies, state hash {report['state_hash']}", file=log)
+    for name, timing in report['subsystems'].items():
+        print(f"    {name}: {timing['total_ms']:.1f} ms, {timing['per_tick_ms']:.3f} ms per tick", file=log)
+    if args.json is None:
+        return
+    report = {
+        'machine': _machine_info(),
+        'settings': {name: value for name, value in vars(args).items() if name not in ('command', 'json')},
+        'result': report
+    }
+    if args.json == '-':
+        json.dump(report, sys.stdout, indent=2)
+        print()
+    else:
+        with open(args.json, 'w') as file:
+            json.dump(report, file, indent=2)
+
+
+def _reference_push(entity, input_velocity):
+    """
+    Entity.push as it was before EntityPhysics, for parity checks.
+    """
+    velocity_delta = np.array(input_velocity, dtype=np.float32)
+    current_velocity = np.array((entity.velocity[0], entity.velocity[2]), dtype=np.float32)
+    current_speed = np.linalg.norm(current_velocity)
+    new_velocity = current_velocity + velocity_delta
+    new_speed = np.linalg.norm(new_velocity)
+    speed_change = new_speed - current_speed
+    if speed_change > entity.max_acceleration:
+        scale_factor = (current_speed + entity.max_acceleration) / new_speed
+        new_velocity *= scale_factor
+    final_speed = np.linalg.norm(new_velocity)
+    if final_speed > entity.max_speed:
+        scale_factor = entity.max_speed / final_speed
+        new_velocity *= scale_factor
+    entity.velocity[0] = new_velocity[0]
+    entity.velocity[2] = new_velocity[1]
+    entity.position[0] += entity.velocity[0]
+    entity.position[2] += entity.velocity[2]
+
+
+def _reference_friction(entity):
+    """
+    Entity.apply_friction as it was before EntityPhysics.
+    """
+    entity.velocity[0] *= entity.friction_coefficient
+    entity.velocity[2] *= entity.friction_coefficient
+
+
+def _reference_gravity(entity):
+    """
+    Entity.apply_gravity as it was before EntityPhysics.
+    """
+    if entity.position[1] > 0:
+        if entity.velocity[1] > entity.max_fall_velocity:
+            entity.velocity[1] -= entity.gravity
+    else:
+        entity.velocity[1] = 0
+
+
+def _reference_snap(entity, map_height):
+    """
+    Player.update's ground snap as it was before EntityPhysics.
+    """
+    if entity.position[1] <= map_height:
+        entity.position[1] = map_height
+        entity.velocity[1] = 0
+
+
+def _random_entity_states(rng, count):
+    """
+    Random positions, velocities, inputs, limits and ground heights for count
+    entities, including the edge cases: standing still, no input, on the ground,
+    at 0 height, at max fall speed and inputs big enough to hit both limits.
+    """
+    positions = rng.uniform(-50, 50, (count, 4)).astype(np.float32)
+    positions[:, 1] = rng.uniform(-2, 2, count)
+    velocities = rng.normal(0, 1, (count, 4)).astype(np.float32)
+    inputs = rng.normal(0, 1, (count, 2)) * rng.choice((0.0, 0.01, 0.2, 5.0), (count, 1))
+    max_accelerations = rng.choice((0.0, 0.05, 0.1, 1.0), count)
+    max_speeds = rng.choice((0.5, 1.0, 2.0, 4.0), count)
+    frictions = rng.choice((0.0, 0.5, 0.7, 1.0), count)
+    gravities = rng.choice((0.05, 0.1), count)
+    max_falls = rng.choice((-1.5, -0.5), count)
+    ground = positions[:, 1].astype(np.float64) + rng.choice((-1e-7, 0.0, 1e-7, -0.5, 0.5), count)
+    edge = np.arange(count) % 7
+    velocities[edge == 0, 0:3:2] = 0
+    inputs[edge == 1] = 0
+    positions[edge == 2, 1] = 0
+    velocities[edge == 3, 1] = max_falls[edge == 3]
+    ground[edge == 4] = positions[edge == 4, 1]
+    return positions, velocities, inputs, max_accelerations, max_speeds, frictions, gravities, max_falls, ground
+
+
+def check_physics_parity(count=20000, seed=48):
+    """
+    Check the batched EntityPhysics kernels give exactly what the old per entity
+    Entity methods gave, entity by entity, that the scalar *_one versions give
+    exactly what the kernels do, and that Entity's methods (built on the scalar
+    versions) still match the old ones, for players and for enemies of a swarm.
+    """
+    rng = np.random.default_rng(seed)
+    positions, velocities, inputs, max_accelerations, max_speeds, frictions, gravities, max_falls, ground = \
+        _random_entity_states(rng, count)
+
+    def reference_entity(index):
+        entity = Entity.Entity(positions[index], float(max_speeds[index]), float(max_accelerations[index]),
+                               float(frictions[index]), 0.7, float(gravities[index]), float(max_falls[index]), 0.75)
+        entity.velocity = velocities[index].copy()
+        return entity
+
+    # Batched kernels against the old methods run one entity at a time.
+    pushed = EntityPhysics.push(velocities[:, 0:3:2], inputs, max_accelerations, max_speeds)
+    slowed = EntityPhysics.apply_friction(velocities[:, 0:3:2], frictions)
+    fallen = EntityPhysics.apply_gravity(positions[:, 1], velocities[:, 1], gravities, max_falls)
+    snapped_heights, snapped_velocities = EntityPhysics.snap_to_ground(positions[:, 1], velocities[:, 1], ground)
+    for index in range(count):
+        entity = reference_entity(index)
+        _reference_push(entity, list(inputs[index]))
+        assert np.array_equal(entity.velocity[0:3:2], pushed[index]), f"push differs for entity {index}"
+        entity = reference_entity(index)
+        _reference_friction(entity)
+        assert np.array_equal(entity.velocity[0:3:2], slowed[index]), f"friction differs for entity {index}"
+        entity = reference_entity(index)
+        _reference_gravity(entity)
+        assert entity.velocity[1] == fallen[index], f"gravity differs for entity {index}"
+        entity = reference_entity(index)
+        _reference_snap(entity, ground[index])
+        assert entity.position[1] == snapped_heights[index] and entity.velocity[1] == snapped_velocities[index], \
+            f"ground snap differs for entity {index}"
+
+        # Scalar versions against the kernels.
+        velocity_x, velocity_z = velocities[index, 0], velocities[index, 2]
+        assert np.array_equal(EntityPhysics.push_one(velocity_x, velocity_z, *inputs[index], max_accelerations[index],
+                                                     max_speeds[index]), pushed[index]), f"push_one differs for entity {index}"
+        assert np.array_equal(EntityPhysics.apply_friction_one(velocity_x, velocity_z, frictions[index]), slowed[index]), \
+            f"apply_friction_one differs for entity {index}"
+        assert EntityPhysics.apply_gravity_one(positions[index, 1], velocities[index, 1], gravities[index], max_falls[index]) \
+            == fallen[index], f"apply_gravity_one differs for entity {index}"
+        assert EntityPhysics.snap_to_ground_one(positions[index, 1], velocities[index, 1], ground[index]) \
+            == (snapped_heights[index], snapped_velocities[index]), f"snap_to_ground_one differs for entity {index}"
+
+    # Entity's own methods, on players and on swarm enemies, against the old ones.
+    mesh_map = MeshMap(chunk_width=10, render_distance=1, chunks_per_update=1, seed=seed, scale=0.003,
+                       height_limit=1000, initial_target=(0, 0), executor='inline', headless=True)
+    manager = Entity.EnemyManager(mesh_map, spawn_radius=50, spawn_rate=math.inf, group_spawn_size=4)
+    sample = range(0, count, 10)
+    enemies = manager.add_enemies([positions[index] for index in sample])
+    for enemy, index in zip(enemies, sample):
+        enemy.velocity = velocities[index]
+        enemy.max_speed, enemy.max_acceleration = max_speeds[index], max_accelerations[index]
+        enemy.friction_coefficient, enemy.gravity, enemy.max_fall_velocity = frictions[index], gravities[index], max_falls[index]
+    for enemy, index in zip(enemies, sample):
+        player = reference_entity(index)
+        reference = reference_entity(index)
+        for target in (player, enemy):
+            target.apply_friction()
+            target.push(list(inputs[index]))
+            target.apply_gravity()
+        _reference_friction(reference)
+        _reference_push(reference, list(inputs[index]))
+        _reference_gravity(reference)
+        for target in (player, enemy):
+            assert np.array_equal(target.velocity, reference.velocity) and np.array_equal(target.position, reference.position), \
+                f"{type(target).__name__} {index} moved differently"
+    mesh_map.cleanup()
+    print(f"physics parity: kernels match the old Entity methods and the scalar versions for {count} entities, "
+          f"and Entity methods match them for {len(enemies)} players and enemies")
+
+
+def bench_physics(entity_counts=(1, 100, 10000, 100000), seed=48, repeat=5):
+    """
+    Time one movement update (friction, push, gravity and the ground snap) for
+    growing numbers of entities with the batched EntityPhysics kernels, against
+    the old per entity methods run entity by entity. Then time a single
+    entity's update, as the player makes each step, with Entity's methods (on
+    the scalar versions), with the kernels on arrays of one, and the old way.
+    """
+    rng = np.random.default_rng(seed)
+    for count in entity_counts:
+        positions, velocities, inputs, max_accelerations, max_speeds, frictions, gravities, max_falls, ground = \
+            _random_entity_states(rng, count)
+        positions = positions.astype(np.float32)
+        max_accelerations = max_accelerations.astype(np.float32)
+        max_speeds = max_speeds.astype(np.float32)
+        best = math.inf
+        for _ in range(repeat):
+            moved_positions = positions.copy()
+            moved_velocities = velocities.copy()
+            start = time.perf_counter()
+            moved_velocities[:, 0:3:2] = EntityPhysics.apply_friction(moved_velocities[:, 0:3:2], frictions)
+            moved_velocities[:, 0:3:2] = EntityPhysics.push(moved_velocities[:, 0:3:2], inputs, max_accelerations, max_speeds)
+            moved_positions[:, 0:3:2] += moved_velocities[:, 0:3:2]
+            moved_velocities[:, 1] = EntityPhysics.apply_gravity(moved_positions[:, 1], moved_velocities[:, 1], gravities, max_falls)
+            moved_positions += moved_velocities
+            moved_positions[:, 1], moved_velocities[:, 1] = EntityPhysics.snap_to_ground(moved_positions[:, 1], moved_velocities[:, 1], ground)
+            best = min(best, time.perf_counter() - start)
+        kernel_time = best
+
+        reference_count = min(count, 10000)
+        entities = [Entity.Entity(positions[index], float(max_speeds[index]), float(max_accelerations[index]),
+                                  float(frictions[index]), 0.7, float(gravities[index]), float(max_falls[index]), 0.75)
+                    for index in range(reference_count)]
+        for entity, velocity in zip(entities, velocities):
+            entity.velocity = velocity.copy()
+        input_lists = inputs[:reference_count].tolist()
+        start = time.perf_counter()
+        for entity, input_velocity, map_height in zip(entities, input_lists, ground):
+            _reference_friction(entity)
+            _reference_push(entity, input_velocity)
+            _reference_gravity(entity)
+            entity.position += entity.velocity
+            _reference_snap(entity, map_height)
+        reference_time = (time.perf_counter() - start) * count / reference_count
+        for entity, index in zip(entities, range(reference_count)):
+            assert np.array_equal(entity.position, moved_positions[index]) and np.array_equal(entity.velocity, moved_velocities[index])
+        print(f"physics update, {count} entities: kernels {kernel_time * 1000:.3f} ms ({count / kernel_time / 1e6:.2f} M entities/s), "
+              f"per entity methods {reference_time * 1000:.3f} ms{' (estimated)' if reference_count < count else ''}, "
+              f"{reference_time / kernel_time:.1f}x faster")
+
+    positions, velocities, inputs, max_accelerations, max_speeds, frictions, gravities, max_falls, ground = \
+        _random_entity_states(rng, 1000)
+    entities = [Entity.Entity(positions[index], float(max_speeds[index]), float(max_accelerations[index]),
+                              float(frictions[index]), 0.7, float(gravities[index]), float(max_falls[index]), 0.75)
+                for index in range(len(positions))]
+    input_lists = inputs.tolist()
+
+    def scalar_update(entity, input_velocity, map_height):
+        entity.apply_friction()
+        entity.push(input_velocity)
+        entity.apply_gravity()
+        entity.position += entity.velocity
+        entity.position[1], entity.velocity[1] = EntityPhysics.snap_to_ground_one(entity.position[1], entity.velocity[1], map_height)
+
+    def kernel_update(entity, input_velocity, map_height):
+        entity.velocity[0:3:2] = EntityPhysics.apply_friction(entity.velocity[0:3:2], entity.friction_coefficient)
+        entity.velocity[0:3:2] = EntityPhysics.push(entity.velocity[0:3:2], input_velocity, entity.max_acceleration, entity.max_speed)
+        entity.position[0:3:2] += entity.velocity[0:3:2]
+        entity.velocity[1] = EntityPhysics.apply_gravity(entity.position[1], entity.velocity[1], entity.gravity, entity.max_fall_velocity)
+        entity.position += entity.velocity
+        entity.position[1], entity.velocity[1] = EntityPhysics.snap_to_ground(entity.position[1], entity.velocity[1], map_height)
+
+    def reference_update(entity, input_velocity, map_height):
+        _reference_friction(entity)
+        _reference_push(entity, input_velocity)
+        _reference_gravity(entity)
+        entity.position += entity.velocity
+        _reference_snap(entity, map_height)
+
+    single_times = {}
+    finals = {}
+    for name, update in (('Entity methods', scalar_update), ('kernels on one entity', kernel_update),
+                         ('old methods', reference_update)):
+        for entity, index in zip(entities, range(len(entities))):
+            entity.position = positions[index].copy()
+            entity.velocity = velocities[index].copy()
+        start = time.perf_counter()
+        for entity, input_velocity, map_height in zip(entities, input_lists, ground):
+            update(entity, input_velocity, map_height)
+        single_times[name] = (time.perf_counter() - start) / len(entities)
+        finals[name] = np.array([np.concatenate((entity.position, entity.velocity)) for entity in entities])
+    reference = finals['old methods']
+    assert all(np.array_equal(final, reference) for final in finals.values()), "single entity updates differ"
+    print("physics update, one entity: " + ", ".join(f"{name} {seconds * 1e3:.4f} ms" for name, seconds in single_times.items()))
+
+
+def bench_streaming(chunk_width=10, render_distance=10, seed=48, scale=0.003, speed=2.0, frames=240, frame_time=1 / 60):
+    """
+    Move the target quickly along +x at 60 updates per second (threads backend,
+    mocked GL) and count holes: required chunks ahead of the target that are
+    not resident yet. Compares distance-only priorities with distance and heading.
+
+    :param speed: World units the target moves per frame (the player's max speed is 2).
+    """
+    for heading in (None, 90.0):
+        with GLCallCounter(MeshMap_module, VertexArena, VBOPool, mock=True):
+            mesh_map = MeshMap(chunk_width=chunk_width, render_distance=render_distance, chunks_per_update=4, seed=seed,
+                               scale=scale, height_limit=1000, initial_target=(0, 0), executor='threads')
+            chunks = mesh_map.get_resident_chunks()
+            holes = 0
+            for frame in range(frames):
+                start = time.perf_counter()
+                target = (frame * speed, 0.0)
+                mesh_map.update(target, heading=heading)
+                chunk_x = math.floor(target[0] / chunk_width)
+                holes += sum((chunk_x + dx, dz) not in chunks
+                             for dx in range(render_distance + 1) for dz in range(-render_distance // 2, render_distance // 2 + 1))
+                time.sleep(max(0.0, frame_time - (time.perf_counter() - start)))
+            stats = mesh_map.get_streaming_stats()
+            mesh_map.cleanup()
+        print(f"streaming at {speed / chunk_width * 60:.0f} chunks/s ({'distance + heading' if heading is not None else 'distance only'}): "
+              f"{holes / frames:.1f} holes ahead per frame, time to visible "
+              f"mean {stats['time_to_visible_mean'] * 1000:.0f} ms, p95 {stats['time_to_visible_p95'] * 1000:.0f} ms, "
+              f"{stats['cancelled_chunks']} cancelled")
+
+
+def check_upload_budget(chunk_width=10, render_distance=5, seed=48, scale=0.003, budget_ms=2.0, bytes_per_ms=100000,
+                        piece_bytes=16384, speed=2.0, frames=120, draw_modes=('batched', 'arena')):
+    """
+    Stream chunks against a mocked GL layer whose buffer uploads take a fixed
+    time per byte, and check that chunks are uploaded in pieces of at most
+    piece_bytes, that no update uploads more bytes than fit in the budget at
+    that speed (or one piece, which is always let through), that the required
+    chunks all end up resident, and that evicted chunks' buffers are reused.
+    The measured milliseconds over the budget are reported, not checked,
+    since they also depend on how busy the machine is.
+
+    :param budget_ms: MeshMap's upload_budget_ms.
+    :param bytes_per_ms: Upload speed of the mocked GL layer.
+    :param piece_bytes: MeshMap's upload_piece_bytes.
+    :param speed: World units the target moves per frame.
+    """
+    for draw_mode in draw_modes:
+        with GLCallCounter(MeshMap_module, VertexArena, VBOPool, mock=True) as counter:
+            piece_sizes = []
+
+            def slow_upload(buffer_sub_data):
+                def slow_buffer_sub_data(target, offset, size, data):
+                    # Spin rather than sleep: sleeps overshoot by more than a small piece takes.
+                    end = time.perf_counter() + size / bytes_per_ms / 1000
+                    while time.perf_counter() < end:
+                        pass
+                    piece_sizes.append(size)
+                    return buffer_sub_data(target, offset, size, data)
+                return slow_buffer_sub_data
+
+            VBOPool.glBufferSubData = slow_upload(VBOPool.glBufferSubData)
+            VertexArena.glBufferSubData = slow_upload(VertexArena.glBufferSubData)
+            mesh_map = MeshMap(chunk_width=chunk_width, render_distance=render_distance, chunks_per_update=64, seed=seed,
+                               scale=scale, height_limit=1000, initial_target=(0, 0), executor='inline',
+                               evict_distance=render_distance + 1, upload_budget_ms=budget_ms,
+                               upload_piece_bytes=piece_bytes, draw_mode=draw_mode)
+            chunks = mesh_map.get_resident_chunks()
+            piece_sizes.clear()
+            counter.reset()
+            upload_ms = []
+            upload_bytes = []
+            uploaded_chunks = 0
+            for frame in range(frames):
+                mesh_map.update((frame * speed, 0.0))
+                stats = mesh_map.get_upload_stats()
+                upload_ms.append(stats['last_upload_ms'])
+                upload_bytes.append(stats['last_upload_bytes'])
+                uploaded_chunks += stats['last_upload_chunks']
+            # Let the queue drain with the target standing still.
+            target = ((frames - 1) * speed, 0.0)
+            for _ in range(1000):
+                streaming = mesh_map.get_streaming_stats()
+                stats = mesh_map.get_upload_stats()
+                if not (streaming['queued_chunks'] or streaming['pending_chunks'] or stats['staged_chunks'] or stats['partial_upload_bytes']):
+                    break
+                mesh_map.update(target)
+            stats = mesh_map.get_upload_stats()
+            chunk_x = math.floor(target[0] / chunk_width)
+            missing = [(chunk_x + dx, dz) for dx in range(-render_distance, render_distance + 1)
+                       for dz in range(-render_distance, render_distance + 1) if (chunk_x + dx, dz) not in chunks]
+            created = counter.counts['glGenBuffers']
+            mesh_map.cleanup()
+        upload_ms = np.array(upload_ms)
+        assert not missing, f"{draw_mode}: required chunks never uploaded: {missing}"
+        assert max(piece_sizes) <= piece_bytes, f"{draw_mode}: a {max(piece_sizes)} byte piece was uploaded in one call"
+        assert len(piece_sizes) > uploaded_chunks, f"{draw_mode}: no chunk was split into pieces"
+        # Every piece is timed at no less than the mocked speed, so the prediction never lets through more than this.
+        assert max(upload_bytes) <= max(piece_bytes, budget_ms * bytes_per_ms), \
+            f"{draw_mode}: an update uploaded {max(upload_bytes)} bytes, more than fit in {budget_ms} ms"
+        if draw_mode != 'arena':
+            assert stats['pool_reused'] > 0, f"{draw_mode}: no buffers were reused"
+        over = upload_ms[upload_ms > budget_ms] - budget_ms
+        print(f"upload budget {budget_ms} ms ({draw_mode}): mean {upload_ms.mean():.2f} ms, p95 {np.percentile(upload_ms, 95):.2f} ms, "
+              f"max {upload_ms.max():.2f} ms per update; {len(over) / len(upload_ms) * 100:.0f}% of updates over, "
+              f"by {over.mean() if len(over) else 0.0:.2f} ms on average; {len(piece_sizes)} pieces for {uploaded_chunks} chunks, "
+              f"{created} buffers created and {stats['pool_reused']} reused while streaming")
+
+
+def check_gpu_budget(chunk_width=10, render_distance=3, seed=48, scale=0.003, speed=2.0, frames=120,
+                     mesh_formats=MESH_FORMATS):
+    """
+    Stream chunks against a mocked GL layer with a VBO budget a little above what
+    the required chunks need, and check MeshMap counts every resident chunk's
+    buffers at their full pooled capacity plus the pool's free buffers, and
+    keeps that total within the budget once streaming settles.
+
+    :param speed: World units the target moves per frame.
+    """
+    for mesh_format in mesh_formats:
+        draw_mode = 'per_chunk' if mesh_format == 'indexed' else 'batched'
+        with GLCallCounter(MeshMap_module, VertexArena, VBOPool, mock=True):
+            settings = dict(chunk_width=chunk_width, render_distance=render_distance, chunks_per_update=64, seed=seed,
+                            scale=scale, height_limit=1000, initial_target=(0, 0), executor='inline',
+                            mesh_format=mesh_format, draw_mode=draw_mode)
+            # Size the budget from what the chunks within the render distance take; the
+            # preload loads twice as far, so the budget bites from the start.
+            unbudgeted = MeshMap(**settings)
+            memory = unbudgeted.get_memory_stats()
+            unbudgeted.cleanup()
+            budget = int(memory['gpu_bytes'] / memory['resident_chunks'] * (2 * render_distance + 1) ** 2 * 1.5)
+            mesh_map = MeshMap(gpu_budget_bytes=budget, **settings)
+            chunks = mesh_map.get_resident_chunks()
+            largest = 0
+            for frame in range(frames):
+                mesh_map.update((frame * speed, 0.0))
+                held = sum(chunk['vbo_capacity'] + chunk.get('ibo_capacity', 0) for chunk in chunks.values())
+                gpu_bytes = mesh_map.get_memory_stats()['gpu_bytes']
+                assert gpu_bytes == held + mesh_map.get_upload_stats()['pool_free_bytes'], \
+                    "gpu_bytes misses pooled capacity or free buffers"
+                assert all(chunk['vbo_capacity'] >= chunk['vbo_bytes'] - chunk.get('ibo_capacity', 0) for chunk in chunks.values())
+                largest = max(largest, gpu_bytes)
+            stats = mesh_map.get_memory_stats()
+            free_bytes = mesh_map.get_upload_stats()['pool_free_bytes']
+            mesh_map.cleanup()
+        assert stats['gpu_bytes'] <= budget, f"{stats['gpu_bytes']} VBO bytes held, over the {budget} byte budget"
+        print(f"{mesh_format} chunks, VBO budget {budget / 1e6:.2f} MB: {stats['gpu_bytes'] / 1e6:.2f} MB held at the end "
+              f"({free_bytes / 1e6:.2f} MB of it free in the pool), peak {largest / 1e6:.2f} MB, "
+              f"{stats['budget_evictions']} budget evictions")
+
+
+def bench_terrain(chunk_width=16, render_distance=5, scale=0.003, seed=48, executor='processes', workers=None,
+                  greedy=False, lod_distances=None, mesh_format='triangles', repeat=1) -> dict:
+    """
+    Time a headless MeshMap's initial preload (every chunk within twice the
+    render distance) and measure the chunks it made.
+
+    :param repeat: Number of preloads to run; the fastest is reported.
+    :return: A dict of the settings plus preload_seconds, chunks, chunks_per_second,
+             vertices_per_chunk, bytes_per_chunk (vertex data as it would be uploaded)
+             and host_bytes_per_chunk (height data kept on the host).
+    """
+    preload_seconds = math.inf
+    for _ in range(repeat):
+        start = time.perf_counter()
+        mesh_map = MeshMap(chunk_width=chunk_width, render_distance=render_distance, chunks_per_update=1, seed=seed,
+                           scale=scale, height_limit=1000, initial_target=(0, 0), executor=executor, workers=workers,
+                           greedy=greedy, lod_distances=lod_distances, mesh_format=mesh_format, headless=True)
+        preload_seconds = min(preload_seconds, time.perf_counter() - start)
+        memory = mesh_map.get_memory_stats()
+        chunks = memory['resident_chunks']
+        vertices = sum(chunk['vertex_count'] for chunk in mesh_map.get_resident_chunks().values())
+        mesh_map.cleanup()
+    return {
+        'chunk_width': chunk_width,
+        'render_distance': render_distance,
+        'scale': scale,
+        'seed': seed,
+        'executor': executor,
+        'workers': workers or os.cpu_count() or 1,
+        'greedy': greedy,
+        'lod_distances': list(lod_distances or ()),
+        'mesh_format': mesh_format,
+        'preload_seconds': preload_seconds,
+        'chunks': chunks,
+        'chunks_per_second': chunks / preload_seconds,
+        'vertices_per_chunk': vertices / chunks,
+        'bytes_per_chunk': memory['gpu_bytes'] / chunks,
+        'host_bytes_per_chunk': memory['host_bytes'] / chunks
+    }
+
+
+def run_terrain_benchmarks(args):
+    """
+    Run bench_terrain for every combination of the command line settings and
+    print a line per result, plus the JSON report if asked for.
+
+    :param args: Parsed arguments of the terrain command.
+    """
+    results = []
+    # Keep stdout to the JSON alone when it is written there.
+    log = sys.stderr if args.json == '-' else sys.stdout
+    for chunk_width in args.chunk_width:
+        for render_distance in args.render_distance:
+            for scale in args.scale:
+                for executor in args.executor:
+                    result = bench_terrain(chunk_width=chunk_width, render_distance=render_distance, scale=scale,
+                                           seed=args.seed, executor=executor, workers=args.workers, greedy=args.greedy,
+                                           lod_distances=args.lod_distances, mesh_format=args.mesh_format, repeat=args.repeat)
+                    results.append(result)
+                    print(f"terrain width {chunk_width}, distance {render_distance}, scale {scale}, {executor}: "
+                          f"{result['chunks']} chunks preloaded in {result['preload_seconds']:.2f} s "
+                          f"({result['chunks_per_second']:.0f} chunks/s), {result['vertices_per_chunk']:.0f} vertices/chunk, "
+                          f"{result['bytes_per_chunk'] / 1024:.1f} KiB/chunk", file=log)
+    if args.json is None:
+        return
+    report = {
+        'machine': _machine_info(),
+        'results': results
+    }
+    if args.json == '-':
+        json.dump(report, sys.stdout, indent=2)
+        print()
+    else:
+        with open(args.json, 'w') as file:
+            json.dump(report, file, indent=2)
+
+
+def run_all(strict=False):
+    """
+    Run every check and benchmark.
+
+    :param strict: Also fail when a benchmark misses its time budget.
+    """
+    check_noise_parity()
+    bench_heightfield(chunk_width=16)
+    bench_heightfield(chunk_width=64, chunks=16)
+    check_indexed_mesh(chunk_width=16)
+    check_indexed_mesh(chunk_width=64, chunks=4)
+    bench_mesher(chunk_width=16)
+    bench_mesher(chunk_width=64, chunks=16)
+    bench_greedy_mesh(chunk_width=16)
+    bench_greedy_mesh(chunk_width=64, chunks=16)
+    bench_greedy_mesh(chunk_width=16, terrace=25)
+    bench_lod()
+    check_frustum_culling()
+    bench_draw_calls()
+    bench_tile_height()
+    bench_bulk_heights()
+    bench_swarm(strict=strict)
+    bench_attacks()
+    bench_flocking()
+    check_enemy_draw_calls()
+    check_player_render()
+    check_fixed_timestep()
+    check_headless_determinism()
+    check_profiler()
+    bench_replays()
+    check_physics_parity()
+    bench_physics()
+    bench_streaming()
+    check_upload_budget()
+    check_gpu_budget()
+    bench_preload()
+    bench_cache()
+
+
+def _time_preload(mesh_map, coords):
+    """
+    Submit every chunk in coords to the map's executor and collect the
+    results the way the map's preload does, minus the VBOs.
+
+    :return: Elapsed seconds.
+    """
+    start = time.perf_counter()
+    futures = [(coord, mesh_map.submit_chunk(coord)) for coord in coords]
+    concurrent.futures.wait([future for _, future in futures])
+    for coord, future in futures:
+        mesh_map.get_chunk_result(coord, future)
+    return time.perf_counter() - start
+
+
+def bench_preload(chunk_width=10, render_distance=5, seed=48, scale=0.003, backends=EXECUTOR_BACKENDS, max_workers=None):
+    """
+    Time generating the initial preload area ((4 * render_distance + 1)^2 chunks)
+    for each executor backend and worker count, without creating any VBOs.
+
+    :param backends: Executor backends to compare.
+    :param max_workers: Largest worker count to try (defaults to the CPU count).
+    """
+    max_workers = max_workers or os.cpu_count() or 1
+    initial_distance = render_distance * 2
+    coords = [(dx, dz) for dx in range(-initial_distance, initial_distance + 1) for dz in range(-initial_distance, initial_distance + 1)]
+    for backend in backends:
+        for workers in ([1] if backend == 'inline' else range(1, max_workers + 1)):
+            mesh_map = MeshMap(chunk_width=chunk_width, render_distance=render_distance, chunks_per_update=1, seed=seed,
+                               scale=scale, height_limit=1000, executor=backend, workers=workers)
+            # Let pools spin up their workers before timing.
+            mesh_map.generate_chunk((0, 0))
+            elapsed = _time_preload(mesh_map, coords)
+            mesh_map.cleanup()
+            print(f"preload {len(coords)} chunks ({backend}, {workers} workers): "
+                  f"{elapsed:.2f} s, {len(coords) / elapsed:.1f} chunks/s")
+
+
+def bench_cache(chunk_width=10, render_distance=5, seed=48, scale=0.003):
+    """
+    Time the preload area with a cold chunk cache (generate and save) and
+    then a warm one (load only), using a temporary cache folder.
+    """
+    initial_distance = render_distance * 2
+    coords = [(dx, dz) for dx in range(-initial_distance, initial_distance + 1) for dz in range(-initial_distance, initial_distance + 1)]
+    with tempfile.TemporaryDirectory() as directory:
+        for state in ('cold', 'warm'):
+            cache = ChunkCache(directory)
+            mesh_map = MeshMap(chunk_width=chunk_width, render_distance=render_distance, chunks_per_update=1, seed=seed,
+                               scale=scale, height_limit=1000, executor='inline', cache=cache)
+            elapsed = _time_preload(mesh_map, coords)
+            chunk_count, total_bytes = cache.get_size()
+            print(f"preload {len(coords)} chunks ({state} cache): {elapsed:.3f} s, "
+                  f"{cache.hits} hits, {cache.misses} misses, {total_bytes / 1024 / 1024:.1f} MiB on disk")
+            del mesh_map, cache
+
+
+def check_indexed_mesh(chunk_width=16, seed=48, scale=0.003, chunks=16):
+    """
+    Check that the indexed mesh format expands back to the triangle list
+    build_chunk_mesh produces (to within its quantization) and report how
+    many bytes it saves per chunk.
+    """
+    triangle_bytes = 0
+    indexed_bytes = 0
+    for chunk_x in range(chunks):
+        heights, vertex_array, vertex_count = ChunkGenerator.generate_chunk_data(chunk_x, -3, seed, scale, 1000, chunk_width)
+        start_x, start_z = chunk_x * chunk_width, -3 * chunk_width
+        mesh = ChunkGenerator.build_indexed_mesh(vertex_array, start_x, start_z)
+        expanded = ChunkGenerator.expand_indexed_mesh(mesh, start_x, start_z).reshape(-1, 6)
+        reference = vertex_array.reshape(-1, 6)
+        assert expanded.shape == reference.shape, "indexed mesh has a different vertex count"
+        # Positions are exact in x and z and within half a height step in y; colors within half a uint8 step.
+        np.testing.assert_array_equal(expanded[:, [0, 2]], reference[:, [0, 2]])
+        np.testing.assert_allclose(expanded[:, 1], reference[:, 1], rtol=0, atol=mesh['y_step'] * 0.5 + 1e-3)
+        np.testing.assert_allclose(expanded[:, 3:], reference[:, 3:], rtol=0, atol=0.5 / 255 + 1e-6)
+        triangle_bytes += vertex_array.nbytes
+        indexed_bytes += mesh['positions'].nbytes + mesh['colors'].nbytes + mesh['indices'].nbytes
+    print(f"indexed mesh {chunk_width}x{chunk_width}: matches triangle list, "
+          f"{triangle_bytes / chunks / 1024:.1f} KiB -> {indexed_bytes / chunks / 1024:.1f} KiB per chunk "
+          f"({triangle_bytes / indexed_bytes:.2f}x smaller)")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Headless benchmarks and sanity checks for the game code.")
+    commands = parser.add_subparsers(dest='command')
+    run = commands.add_parser('all', help="Run every check and benchmark (the default).")
+    run.add_argument('--strict', action='store_true', help="Also fail when a benchmark misses its time budget.")
+    terrain = commands.add_parser('terrain', help="Time headless terrain generation for each combination of settings.")
+    terrain.add_argument('--chunk-width', type=int, nargs='+', default=[16])
+    terrain.add_argument('--render-distance', type=int, nargs='+', default=[5])
+    terrain.add_argument('--scale', type=float, nargs='+', default=[0.003])
+    terrain.add_argument('--executor', choices=EXECUTOR_BACKENDS, nargs='+', default=['processes'])
+    terrain.add_argument('--workers', type=int, default=None, help="Generation workers (defaults to the CPU count).")
+    terrain.add_argument('--seed', type=int, default=48)
+    terrain.add_argument('--greedy', action='store_true', help="Use greedy meshing.")
+    terrain.add_argument('--lod-distances', type=int, nargs='*', default=None)
+    terrain.add_argument('--mesh-format', choices=MESH_FORMATS, default='triangles')
+    terrain.add_argument('--repeat', type=int, default=1, help="Preloads per setting; the fastest is reported.")
+    terrain.add_argument('--json', metavar='PATH', default=None, help="Write the results as JSON to PATH ('-' for stdout).")
+    simulate = commands.add_parser('simulate', help="Run the game headless with scripted input and report its throughput.")
+    simulate.add_argument('--ticks', type=int, default=3600)
+    simulate.add_argument('--seed', type=int, default=0, help="Enemy spawn seed.")
+    simulate.add_argument('--chunk-width', type=int, default=10)
+    simulate.add_argument('--render-distance', type=int, default=10)
+    simulate.add_argument('--spawn-rate', type=float, default=2, help="Seconds between enemy groups.")
+    simulate.add_argument('--group-spawn-size', type=int, default=4)
+    simulate.add_argument('--executor', choices=EXECUTOR_BACKENDS, default='inline')
+    simulate.add_argument('--json', metavar='PATH', default=None, help="Write the report as JSON to PATH ('-' for stdout).")
+    replay = commands.add_parser('replay', help="Replay recorded sessions headless and report their frame times.")
+    replay.add_argument('paths', nargs='*', help="Recordings to replay (defaults to the committed suite in replays/).")
+    replay.add_argument('--json', metavar='PATH', default=None, help="Write the results as JSON to PATH ('-' for stdout).")
+    commands.add_parser('make-replays', help="Write the committed replay suite again.")
+    args = parser.parse_args()
+    if args.command == 'replay':
+        run_replays(args)
+    elif args.command == 'make-replays':
+        make_benchmark_replays()
+    elif args.command == 'terrain':
+        run_terrain_benchmarks(args)
+    elif args.command == 'simulate':
+        run_simulation(args)
+    else:
+        run_all(strict=getattr(args, 'strict', False))
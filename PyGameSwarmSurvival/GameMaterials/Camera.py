@@ -5,6 +5,8 @@ from Entity import Player
 from pygame.locals import *
 import math
 from MeshMap import MeshMap
+from Frustum import Frustum, perspective_matrix, look_at_matrix
+from Profiler import profiled
 
 
 class Camera():
@@ -15,6 +17,9 @@ class Camera():
         self.user_zoom_distance = zoom_distance
         self.zoom_cooldown = 0
         self.elevation_angle = elevation_angle
+        # Zoom and elevation before the last update, to blend from when rendering between steps
+        self.previous_zoom_distance = zoom_distance
+        self.previous_elevation_angle = elevation_angle
         
         glEnable(GL_DEPTH_TEST)
         glClearColor(0.5, 0.7, 1.0, 1.0)  # light blue sky background
@@ -23,49 +28,50 @@ class Camera():
         glLoadIdentity()
         gluPerspective(45, (display[0] / display[1]), 0.01, far_plane)
         glMatrixMode(GL_MODELVIEW)
+        # Keep numpy copies of the matrices for culling without reading them back from GL.
+        self.projection = perspective_matrix(45, (display[0] / display[1]), 0.01, far_plane)
+        self.view = None
      
-    # Use this to update the camera position and what it's looking at
-    def apply(self):
+    # Use this to get where the camera sits behind a player position at a zoom distance and elevation angle
+    def get_eye(self, player_position, zoom_distance, elevation_angle):
+        player_height = self.player.get_height() * 5 / 6
+        camera_x = player_position[0] - zoom_distance * math.sin(math.radians(player_position[3]))
+        camera_z = player_position[2] + zoom_distance * math.cos(math.radians(player_position[3]))
+        camera_y = player_position[1] + zoom_distance * math.sin(math.radians(elevation_angle)) + player_height
+        return camera_x, camera_y, camera_z
+
+    # Use this to update the camera position and what it's looking at,
+    # following the player alpha of the way through the current simulation step.
+    # Zoom and elevation are blended between the last two steps the same way.
+    @profiled('Camera.apply')
+    def apply(self, alpha=1.0):
         glClear(GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT)
         glLoadIdentity()
 
-        player_position = self.player.get_position()
+        player_position = self.player.get_interpolated_position(alpha)
         player_height = self.player.get_height() * 5 / 6
-
-        # Compute initial camera position at the current zoom level
-        camera_x = player_position[0] - self.zoom_distance * math.sin(math.radians(player_position[3]))
-        camera_z = player_position[2] + self.zoom_distance * math.cos(math.radians(player_position[3]))
-        camera_y = player_position[1] + self.zoom_distance * math.sin(math.radians(self.elevation_angle)) + player_height
-
-        # Get terrain height at the camera's (x, z) position
-        terrain_height = self.mesh_map.get_tile_height((camera_x, camera_z)) + 1.0  
-
-        if camera_y < terrain_height:
-            # If colliding, zoom in
-            self.zoom_distance = max(1.0, self.zoom_distance - 1)
-            self.zoom_cooldown = 20  # Set cooldown to prevent immediate zoom-out
-        elif self.zoom_distance < self.user_zoom_distance:
-            if self.zoom_cooldown > 0:
-                self.zoom_cooldown -= 1  # Decrease cooldown timer
-            else:
-                # If no collision and cooldown expired, zoom out
-                self.zoom_distance = min(self.user_zoom_distance, self.zoom_distance + 1)
-        elif self.zoom_distance > self.user_zoom_distance:
-            self.zoom_distance = max(self.user_zoom_distance, self.zoom_distance - 1)
-
-
-        # Recalculate camera position after zoom adjustments
-        camera_x = player_position[0] - self.zoom_distance * math.sin(math.radians(player_position[3]))
-        camera_z = player_position[2] + self.zoom_distance * math.cos(math.radians(player_position[3]))
-        camera_y = player_position[1] + self.zoom_distance * math.sin(math.radians(self.elevation_angle)) + player_height
+        zoom_distance = self.previous_zoom_distance + (self.zoom_distance - self.previous_zoom_distance) * alpha
+        elevation_angle = self.previous_elevation_angle + (self.elevation_angle - self.previous_elevation_angle) * alpha
+        camera_x, camera_y, camera_z = self.get_eye(player_position, zoom_distance, elevation_angle)
 
         # Apply gluLookAt with the adjusted zoom distance
         gluLookAt(camera_x, camera_y, camera_z,  
                   player_position[0], player_position[1] + player_height, player_position[2],  
                   0, 1, 0)   
+        self.view = look_at_matrix((camera_x, camera_y, camera_z),
+                                   (player_position[0], player_position[1] + player_height, player_position[2]),
+                                   (0, 1, 0))
+
+    # Use this to get the view frustum from the last apply, for culling
+    def get_frustum(self):
+        return Frustum(self.projection, self.view)
 
-    # Use this to update the camera position attributes with use controls
+    # Use this to update the camera position attributes with use controls, and to zoom
+    # in when the terrain is in the way. Run it once per simulation step, after the player moves,
+    # so zooming goes at the same speed whatever the frame rate.
     def update(self, keys):
+        self.previous_zoom_distance = self.zoom_distance
+        self.previous_elevation_angle = self.elevation_angle
         if keys[K_q]:
             self.user_zoom_distance = max(1.0, self.user_zoom_distance - 1)  # Prevent getting too close
         if keys[K_e]:
@@ -76,3 +82,20 @@ class Camera():
             self.elevation_angle = max(-85, self.elevation_angle - 2)  # Lower the camera, look upwards
         if keys[K_s]:
             self.elevation_angle = min(85, self.elevation_angle + 2)  # Raise the camera, look downwards
+
+        # Get terrain height at the camera's (x, z) position at the current zoom level
+        camera_x, camera_y, camera_z = self.get_eye(self.player.get_position(), self.zoom_distance, self.elevation_angle)
+        terrain_height = self.mesh_map.get_tile_height((camera_x, camera_z)) + 1.0  
+
+        if camera_y < terrain_height:
+            # If colliding, zoom in
+            self.zoom_distance = max(1.0, self.zoom_distance - 1)
+            self.zoom_cooldown = 20  # Set cooldown (in steps) to prevent immediate zoom-out
+        elif self.zoom_distance < self.user_zoom_distance:
+            if self.zoom_cooldown > 0:
+                self.zoom_cooldown -= 1  # Decrease cooldown timer
+            else:
+                # If no collision and cooldown expired, zoom out
+                self.zoom_distance = min(self.user_zoom_distance, self.zoom_distance + 1)
+        elif self.zoom_distance > self.user_zoom_distance:
+            self.zoom_distance = max(self.user_zoom_distance, self.zoom_distance - 1)
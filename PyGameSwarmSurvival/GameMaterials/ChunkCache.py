@@ -0,0 +1,154 @@
+import numpy as np
+import os
+import collections
+import ChunkGenerator
+
+
+def default_directory() -> str:
+    """
+    The chunk cache folder in the user's cache directory
+    (%LOCALAPPDATA% on Windows, $XDG_CACHE_HOME or ~/.cache elsewhere),
+    so the cache is never written into the source tree.
+    """
+    if os.name == 'nt':
+        root = os.environ.get('LOCALAPPDATA') or os.path.expanduser('~')
+    else:
+        root = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(root, 'PyGameSwarmSurvival', 'chunk_cache')
+
+
+class ChunkCache:
+    """
+    Persistent on-disk cache of generated chunks.
+
+    Each chunk is stored as a single .npy file holding the packed chunk
+    (height grid followed by vertex data, see ChunkGenerator.pack_chunk).
+    Files are grouped in one folder per set of terrain parameters and cache
+    format version, so changing the seed, scale, height limit, chunk width,
+    mesher or detail level (or the format) never picks up stale chunks. Files are loaded as memory
+    maps, so a hit costs no copy beyond what the OS pages in.
+
+    The total size on disk is capped; the least recently used chunks are
+    deleted first. Recency survives restarts through file modification times.
+    """
+    # Bump whenever the packed chunk layout or mesh output changes.
+    FORMAT_VERSION = 1
+
+    def __init__(self, directory: str, max_bytes: int = 512 * 1024 * 1024):
+        """
+        :param directory: Folder to keep cached chunks in. Created if missing.
+        :param max_bytes: Maximum total size of all cached chunk files.
+        """
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        # Every cached file path mapped to its size, least recently used first.
+        self.__entries = collections.OrderedDict()
+        self.__total_bytes = 0
+        files = []
+        for folder in os.scandir(directory):
+            if not folder.is_dir():
+                continue
+            for entry in os.scandir(folder.path):
+                if entry.name.endswith('.npy'):
+                    stat = entry.stat()
+                    files.append((stat.st_mtime, entry.path, stat.st_size))
+        for _, path, size in sorted(files):
+            self.__entries[path] = size
+            self.__total_bytes += size
+        self.__evict()
+
+    def __path(self, key: tuple) -> str:
+        """
+        :param key: (seed, scale, height_limit, chunk_width, greedy, lod_step, chunk_x, chunk_z)
+        :return: The file path for that chunk.
+        """
+        seed, scale, height_limit, chunk_width, greedy, lod_step, chunk_x, chunk_z = key
+        folder = f"v{self.FORMAT_VERSION}_seed{seed}_scale{scale!r}_height{height_limit}_width{chunk_width}"
+        if greedy:
+            folder += "_greedy"
+        if lod_step > 1:
+            folder += f"_lod{lod_step}"
+        return os.path.join(self.directory, folder, f"{chunk_x}_{chunk_z}.npy")
+
+    def get(self, key: tuple):
+        """
+        Look up a chunk.
+
+        :param key: (seed, scale, height_limit, chunk_width, greedy, lod_step, chunk_x, chunk_z)
+        :return: A tuple (heights, vertex_array, vertex_count) of read-only
+                 memory-mapped views, or None on a miss.
+        """
+        path = self.__path(key)
+        if path not in self.__entries:
+            self.misses += 1
+            return None
+        try:
+            packed = np.load(path, mmap_mode='r')
+            os.utime(path)
+        except (OSError, ValueError):
+            # Unreadable or truncated; forget it and regenerate.
+            self.__remove(path)
+            self.misses += 1
+            return None
+        self.__entries.move_to_end(path)
+        self.hits += 1
+        return ChunkGenerator.unpack_chunk(packed, key[3] // key[5])
+
+    def put(self, key: tuple, heights: np.ndarray, vertex_array: np.ndarray):
+        """
+        Store a chunk, then evict old chunks if the cache is over its size cap.
+
+        :param key: (seed, scale, height_limit, chunk_width, greedy, lod_step, chunk_x, chunk_z)
+        :param heights: The chunk's height grid.
+        :param vertex_array: The chunk's interleaved vertex data.
+        """
+        path = self.__path(key)
+        packed = np.empty(heights.size + vertex_array.size, dtype=np.float32)
+        ChunkGenerator.pack_chunk(packed, heights, vertex_array)
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write to a temporary file first so a crash never leaves a partial chunk behind.
+        temp_path = path + '.tmp'
+        try:
+            with open(temp_path, 'wb') as file:
+                np.save(file, packed)
+            os.replace(temp_path, path)
+        except OSError as e:
+            print(f"Error caching chunk {key[-2:]}: {e}")
+            return
+
+        if path in self.__entries:
+            self.__total_bytes -= self.__entries.pop(path)
+        size = os.path.getsize(path)
+        self.__entries[path] = size
+        self.__total_bytes += size
+        self.__evict()
+
+    def __evict(self):
+        """
+        Delete least recently used chunk files until the cache fits in max_bytes.
+        """
+        while self.__total_bytes > self.max_bytes and self.__entries:
+            path = next(iter(self.__entries))
+            self.__remove(path)
+            self.evictions += 1
+
+    def __remove(self, path: str):
+        self.__total_bytes -= self.__entries.pop(path)
+        try:
+            os.remove(path)
+        except OSError:
+            # Still memory mapped somewhere (Windows) or already gone.
+            pass
+
+    def get_size(self):
+        """
+        :return: A tuple (chunk_count, total_bytes) of what is currently cached.
+        """
+        return len(self.__entries), self.__total_bytes
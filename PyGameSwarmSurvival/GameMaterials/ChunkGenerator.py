@@ -0,0 +1,440 @@
+import numpy as np
+from multiprocessing import shared_memory
+import Perlin
+
+# Chunk data generation for MeshMap.
+# These are plain module level functions of the terrain parameters (no OpenGL,
+# no MeshMap state) so they can run on worker threads or in worker processes.
+
+# Vertex offsets (from the tile's bottom-left corner) of the two top face
+# triangles (p1, p2, p3) and (p1, p3, p4).
+_TOP_DX = np.array([0, 1, 1, 0, 1, 0])
+_TOP_DZ = np.array([0, 0, 1, 0, 1, 1])
+
+# Top edge of each tile side as ((local start), (local end)), in the order the
+# walls are emitted: North, South, East, West.
+# Local coordinates: (0,0) is bottom-left of the tile; (1,1) is top-right.
+_SIDE_EDGES = (
+    ((0, 1), (1, 1)),  # North edge: top edge (p4 to p3)
+    ((0, 0), (1, 0)),  # South edge: bottom edge (p1 to p2)
+    ((1, 0), (1, 1)),  # East edge: right edge (p2 to p3)
+    ((0, 0), (0, 1))   # West edge: left edge (p1 to p4)
+)
+# Per wall vertex: whether it sits at the edge end, and whether it is on the top edge.
+_WALL_END = np.array([False, False, True, False, True, True])
+_WALL_TOP = np.array([True, False, False, True, False, True])
+
+# colorsys.hsv_to_rgb's channel selection per hue sector, as indices into (v, t, p, q).
+_HSV_SECTOR_CHANNELS = np.array([
+    (0, 1, 2),  # (v, t, p)
+    (3, 0, 2),  # (q, v, p)
+    (2, 0, 1),  # (p, v, t)
+    (2, 3, 0),  # (p, q, v)
+    (1, 2, 0),  # (t, p, v)
+    (0, 2, 3)   # (v, p, q)
+])
+
+
+def terrain_heights(xs, zs, seed: int, scale: float, height_limit: int) -> np.ndarray:
+    """
+    Compute terrain heights for many positions at once using the vectorized
+    Perlin implementation, which matches noise.pnoise2 exactly.
+
+    :param xs: Array-like of world x coordinates.
+    :param zs: Array-like of world z coordinates (same shape as xs).
+    :param seed: Seed for the noise generator.
+    :param scale: Scale for noise generation.
+    :param height_limit: Maximum height of the generated terrain.
+    :return: A float64 numpy array of heights with the shape of xs.
+    """
+    xs = np.asarray(xs, dtype=np.float64)
+    zs = np.asarray(zs, dtype=np.float64)
+    base_noise = Perlin.pnoise2(
+        xs * scale,
+        zs * scale,
+        octaves=4,
+        persistence=0.5,
+        lacunarity=2.0,
+        repeatx=1024,
+        repeaty=1024,
+        base=seed
+    )
+    # Normalize noise to [0, 1] then scale to height_limit.
+    normalized_noise = (base_noise + 1) / 2
+    return (normalized_noise ** 5) * height_limit
+
+
+def height_colors(heights: np.ndarray, height_limit: int) -> np.ndarray:
+    """
+    Determine colors based on height values.
+    This is colorsys.hsv_to_rgb(height / height_limit, 1, 1) done for a
+    whole array at once, keeping the same float32 arithmetic.
+
+    :param heights: A float32 array of y values or heights.
+    :param height_limit: Maximum height of the generated terrain.
+    :return: A float32 array of shape (n, 3) with (r, g, b) values in the range [0, 1].
+    """
+    h6 = (heights / height_limit) * 6.0
+    sector = h6.astype(np.int64)
+    f = h6 - sector.astype(np.float32)
+    q = 1.0 - f
+    t = 1.0 - (1.0 - f)
+    # Candidate channel values (v, t, p, q) with v = 1 and p = 0.
+    candidates = np.stack((np.ones_like(f), t, np.zeros_like(f), q))
+    channels = _HSV_SECTOR_CHANNELS[sector % 6]
+    return candidates[channels, np.arange(len(heights))[:, None]]
+
+
+def generate_chunk_heights(chunk_x: int, chunk_z: int, seed: int, scale: float, height_limit: int, chunk_width: int, step: int = 1) -> np.ndarray:
+    """
+    Generate the height grid for a chunk, including a one tile border
+    so walls can be built against neighboring chunks.
+    The tile at index [1,1] corresponds to the first tile in the chunk.
+
+    :param chunk_x: Chunk coordinate in x.
+    :param chunk_z: Chunk coordinate in z.
+    :param step: Sample every step-th tile, for lower detail chunks. Must divide chunk_width.
+    :return: A float32 array of shape (chunk_width / step + 2, chunk_width / step + 2).
+    """
+    grid_size = chunk_width // step + 2
+    start_x = chunk_x * chunk_width
+    start_z = chunk_z * chunk_width
+    world_xs, world_zs = np.meshgrid(
+        np.arange(start_x - step, start_x + (grid_size - 1) * step, step),
+        np.arange(start_z - step, start_z + (grid_size - 1) * step, step),
+        indexing='ij'
+    )
+    return terrain_heights(world_xs, world_zs, seed, scale, height_limit).astype(np.float32)
+
+
+def build_chunk_mesh(heights: np.ndarray, start_x: int, start_z: int, height_limit: int, step: int = 1):
+    """
+    Build the interleaved [x, y, z, r, g, b] vertex data for a chunk from its height grid.
+    Every tile and wall is computed with array operations and written
+    straight into a preallocated float32 buffer, in the same order as
+    looping over the tiles one by one (top face, then North, South, East
+    and West walls).
+
+    :param heights: Height grid from generate_chunk_heights.
+    :param start_x: World x of the chunk's first tile.
+    :param start_z: World z of the chunk's first tile.
+    :param height_limit: Maximum height of the generated terrain (for colors).
+    :param step: World size of each tile in the grid (the step it was sampled with).
+    :return: A tuple (vertex_array, vertex_count)
+    """
+    w = heights.shape[0] - 2
+    tile_heights = heights[1:-1, 1:-1]
+    # Neighbor heights for each side, in the order walls are emitted per tile.
+    neighbor_heights = np.stack((
+        heights[1:-1, 2:],   # North (0, +1)
+        heights[1:-1, :-2],  # South (0, -1)
+        heights[2:, 1:-1],   # East (+1, 0)
+        heights[:-2, 1:-1]   # West (-1, 0)
+    ))
+    # Generate a wall wherever a tile is higher than its neighbor.
+    walls = tile_heights > neighbor_heights
+
+    # Each tile gets one top quad followed by one quad per wall. Work out
+    # where each tile's quads start in the output so every quad can be
+    # written straight into a preallocated buffer in tile order.
+    quads_per_tile = 1 + walls.sum(axis=0).ravel()
+    quad_start = np.cumsum(quads_per_tile) - quads_per_tile
+    quad_count = int(quads_per_tile.sum())
+    vertex_array = np.empty(quad_count * 6 * 6, dtype=np.float32)
+    quads = vertex_array.reshape(quad_count, 6, 6)
+
+    # World position of each tile's bottom-left corner.
+    world_x = np.repeat(np.arange(start_x, start_x + w * step, step), w)
+    world_z = np.tile(np.arange(start_z, start_z + w * step, step), w)
+    flat_heights = tile_heights.ravel()
+    top_colors = height_colors(flat_heights, height_limit)
+    # For wall color, darken the tile's top color.
+    wall_colors = top_colors * np.float32(0.7)
+
+    # Top face triangles: (p1, p2, p3) and (p1, p3, p4).
+    quads[quad_start, :, 0] = world_x[:, None] + _TOP_DX * step
+    quads[quad_start, :, 1] = flat_heights[:, None]
+    quads[quad_start, :, 2] = world_z[:, None] + _TOP_DZ * step
+    quads[quad_start, :, 3:] = top_colors[:, None, :]
+
+    # Walls: (top start, bottom start, bottom end) and (top start, bottom end, top end).
+    # A wall's slot within its tile is 1 + the number of walls emitted before it.
+    wall_slot = np.cumsum(walls, axis=0) - walls
+    for side, ((lx0, lz0), (lx1, lz1)) in enumerate(_SIDE_EDGES):
+        mask = walls[side].ravel()
+        if not mask.any():
+            continue
+        wall = quad_start[mask] + 1 + wall_slot[side].ravel()[mask]
+        quads[wall, :, 0] = world_x[mask, None] + np.where(_WALL_END, lx1, lx0) * step
+        quads[wall, :, 1] = np.where(_WALL_TOP, flat_heights[mask, None], neighbor_heights[side].ravel()[mask, None])
+        quads[wall, :, 2] = world_z[mask, None] + np.where(_WALL_END, lz1, lz0) * step
+        quads[wall, :, 3:] = wall_colors[mask, None, :]
+
+    vertex_count = len(vertex_array) // 6  # 6 floats per vertex.
+    return vertex_array, vertex_count
+
+
+def _merge_runs(mask: np.ndarray, *values: np.ndarray):
+    """
+    Find runs of consecutive cells along the last axis that are all set in
+    mask and share the same values.
+
+    :param mask: 2D bool array of cells to merge.
+    :param values: 2D arrays (same shape as mask) that must match within a run.
+    :return: A tuple (rows, starts, lengths) of int arrays, one entry per run.
+    """
+    same_as_previous = mask.copy()
+    same_as_previous[:, 0] = False
+    same_as_previous[:, 1:] &= mask[:, :-1]
+    for value in values:
+        same_as_previous[:, 1:] &= value[:, 1:] == value[:, :-1]
+    rows, starts = np.nonzero(mask & ~same_as_previous)
+    # Each set cell belongs to the most recent run start before it, in row-major order.
+    run_ids = np.cumsum((mask & ~same_as_previous).ravel())[mask.ravel()] - 1
+    lengths = np.bincount(run_ids, minlength=len(rows))
+    return rows, starts, lengths
+
+
+def build_greedy_chunk_mesh(heights: np.ndarray, start_x: int, start_z: int, height_limit: int, step: int = 1):
+    """
+    Build the same surface as build_chunk_mesh with fewer triangles by merging
+    neighboring tiles that share a height into larger quads.
+    Top faces are merged into rectangles: runs of equal height along z, then
+    identical runs in neighboring x columns. Walls on the same side of a
+    row of tiles are merged where both their top and bottom heights match.
+    Merging is exact, so terrain with no equal neighboring heights comes out
+    with the same triangle count as build_chunk_mesh (in a different order).
+
+    :param heights: Height grid from generate_chunk_heights.
+    :param start_x: World x of the chunk's first tile.
+    :param start_z: World z of the chunk's first tile.
+    :param height_limit: Maximum height of the generated terrain (for colors).
+    :param step: World size of each tile in the grid (the step it was sampled with).
+    :return: A tuple (vertex_array, vertex_count)
+    """
+    w = heights.shape[0] - 2
+    tile_heights = heights[1:-1, 1:-1]
+    neighbor_heights = np.stack((
+        heights[1:-1, 2:],   # North (0, +1)
+        heights[1:-1, :-2],  # South (0, -1)
+        heights[2:, 1:-1],   # East (+1, 0)
+        heights[:-2, 1:-1]   # West (-1, 0)
+    ))
+    walls = tile_heights > neighbor_heights
+
+    # Top faces: runs along z, then chain runs with the same start, length and
+    # height across consecutive x columns into rectangles.
+    run_x, run_z, run_dz = _merge_runs(np.ones((w, w), dtype=bool), tile_heights)
+    run_heights = tile_heights[run_x, run_z]
+    order = np.lexsort((run_x, run_heights, run_dz, run_z))
+    run_x, run_z, run_dz, run_heights = run_x[order], run_z[order], run_dz[order], run_heights[order]
+    chained = np.zeros(len(order), dtype=bool)
+    chained[1:] = ((run_x[1:] == run_x[:-1] + 1) & (run_z[1:] == run_z[:-1])
+                   & (run_dz[1:] == run_dz[:-1]) & (run_heights[1:] == run_heights[:-1]))
+    rect_ids = np.cumsum(~chained) - 1
+    top_x = run_x[~chained]
+    top_z = run_z[~chained]
+    top_dx = np.bincount(rect_ids)
+    top_dz = run_dz[~chained]
+    top_heights = run_heights[~chained]
+
+    # Walls: North and South walls run along x, East and West walls along z.
+    wall_runs = []
+    for side in range(4):
+        along_x = side < 2
+        mask, top, bottom = walls[side], tile_heights, neighbor_heights[side]
+        if along_x:
+            mask, top, bottom = mask.T, top.T, bottom.T
+        rows, starts, lengths = _merge_runs(mask, top, bottom)
+        xs, zs = (starts, rows) if along_x else (rows, starts)
+        wall_runs.append((xs, zs, lengths, tile_heights[xs, zs], neighbor_heights[side][xs, zs]))
+
+    quad_count = len(top_x) + sum(len(run[0]) for run in wall_runs)
+    vertex_array = np.empty(quad_count * 6 * 6, dtype=np.float32)
+    quads = vertex_array.reshape(quad_count, 6, 6)
+
+    # Top face triangles: (p1, p2, p3) and (p1, p3, p4), stretched over the rectangle.
+    top_count = len(top_x)
+    quads[:top_count, :, 0] = (start_x + top_x * step)[:, None] + _TOP_DX * (top_dx * step)[:, None]
+    quads[:top_count, :, 1] = top_heights[:, None]
+    quads[:top_count, :, 2] = (start_z + top_z * step)[:, None] + _TOP_DZ * (top_dz * step)[:, None]
+    quads[:top_count, :, 3:] = height_colors(top_heights, height_limit)[:, None, :]
+
+    # Walls: (top start, bottom start, bottom end) and (top start, bottom end, top end),
+    # with the edge stretched along the run.
+    first = top_count
+    for side, ((lx0, lz0), (lx1, lz1)) in enumerate(_SIDE_EDGES):
+        xs, zs, lengths, tops, bottoms = wall_runs[side]
+        wall = slice(first, first + len(xs))
+        first += len(xs)
+        x_scale = (lengths * step)[:, None] if side < 2 else step
+        z_scale = step if side < 2 else (lengths * step)[:, None]
+        quads[wall, :, 0] = (start_x + xs * step)[:, None] + np.where(_WALL_END, lx1, lx0) * x_scale
+        quads[wall, :, 1] = np.where(_WALL_TOP, tops[:, None], bottoms[:, None])
+        quads[wall, :, 2] = (start_z + zs * step)[:, None] + np.where(_WALL_END, lz1, lz0) * z_scale
+        quads[wall, :, 3:] = (height_colors(tops, height_limit) * np.float32(0.7))[:, None, :]
+
+    vertex_count = len(vertex_array) // 6  # 6 floats per vertex.
+    return vertex_array, vertex_count
+
+
+def generate_chunk_data(chunk_x: int, chunk_z: int, seed: int, scale: float, height_limit: int, chunk_width: int,
+                        greedy: bool = False, lod_step: int = 1):
+    """
+    Generate the data for a chunk (without creating the VBO).
+    The vertex data is interleaved as [x, y, z, r, g, b] per vertex.
+    In addition to the top faces of each tile, vertical walls are generated
+    to connect a tile's top to its lower neighbor.
+
+    Lower detail chunks (lod_step > 1) are meshed from every lod_step-th
+    tile. Their neighbors may be at a different detail level, so instead of
+    walls against the neighboring heights they get skirts: every edge tile
+    hangs a wall down to the lowest point of the terrain, which hides any
+    crack along the chunk border.
+
+    :param chunk_x: Chunk coordinate in x.
+    :param chunk_z: Chunk coordinate in z.
+    :param greedy: Merge equal height faces with build_greedy_chunk_mesh.
+    :param lod_step: Sample every lod_step-th tile. Must divide chunk_width.
+    :return: A tuple (heights, vertex_array, vertex_count), heights being the chunk's height grid.
+    """
+    heights = generate_chunk_heights(chunk_x, chunk_z, seed, scale, height_limit, chunk_width, lod_step)
+    mesh_heights = heights
+    if lod_step > 1:
+        # Dropping the border to the floor makes the edge walls into skirts.
+        mesh_heights = heights.copy()
+        skirt_floor = min(heights.min(), 0)
+        mesh_heights[[0, -1], :] = skirt_floor
+        mesh_heights[:, [0, -1]] = skirt_floor
+    build_mesh = build_greedy_chunk_mesh if greedy else build_chunk_mesh
+    vertex_array, vertex_count = build_mesh(mesh_heights, chunk_x * chunk_width, chunk_z * chunk_width, height_limit, lod_step)
+    return heights, vertex_array, vertex_count
+
+
+def build_indexed_mesh(vertex_array: np.ndarray, start_x: int, start_z: int) -> dict:
+    """
+    Convert a chunk's triangle list into the compact indexed format.
+    Identical vertices (same position and color) are stored once and the
+    triangles become an index buffer. Positions are chunk-local int16:
+    x and z are exact tile offsets, y is quantized to 65536 steps between
+    the chunk's lowest and highest vertex. Colors are normalized uint8.
+    A vertex's world position is (start_x + x, y_offset + y * y_step, start_z + z).
+
+    :param vertex_array: Interleaved [x, y, z, r, g, b] float32 triangle list.
+    :param start_x: World x of the chunk's first tile.
+    :param start_z: World z of the chunk's first tile.
+    :return: A dict with 'positions' (n, 3) int16, 'colors' (n, 3) uint8,
+             'indices' (uint16, or uint32 if there are more than 65536 vertices),
+             'y_offset' and 'y_step'.
+    """
+    vertices = vertex_array.reshape(-1, 6)
+    local_x = np.rint(vertices[:, 0] - start_x).astype(np.int64)
+    local_z = np.rint(vertices[:, 2] - start_z).astype(np.int64)
+    y = vertices[:, 1].astype(np.float64)
+    y_min = y.min()
+    y_max = y.max()
+    y_step = (y_max - y_min) / 65535 if y_max > y_min else 1.0
+    quantized_y = np.rint((y - y_min) / y_step).astype(np.int64)
+    rgb = np.rint(vertices[:, 3:] * 255).astype(np.int64)
+    _, color_ids = np.unique((rgb[:, 0] << 16) | (rgb[:, 1] << 8) | rgb[:, 2], return_inverse=True)
+    color_count = int(color_ids.max()) + 1
+
+    # One integer key per distinct (position, color) in mixed radix.
+    side = int(local_x.max()) + 1
+    keys = ((local_x * side + local_z) * 65536 + quantized_y) * color_count + color_ids.ravel()
+    _, first, indices = np.unique(keys, return_index=True, return_inverse=True)
+
+    positions = np.empty((len(first), 3), dtype=np.int16)
+    positions[:, 0] = local_x[first]
+    positions[:, 1] = quantized_y[first] - 32768
+    positions[:, 2] = local_z[first]
+    index_type = np.uint16 if len(first) <= 65536 else np.uint32
+    return {
+        'positions': positions,
+        'colors': rgb[first].astype(np.uint8),
+        'indices': indices.ravel().astype(index_type),
+        'y_offset': y_min + 32768 * y_step,
+        'y_step': y_step
+    }
+
+
+def expand_indexed_mesh(mesh: dict, start_x: int, start_z: int) -> np.ndarray:
+    """
+    Turn an indexed mesh back into an interleaved [x, y, z, r, g, b] float32 triangle list.
+    Used to check the indexed format against build_chunk_mesh's output.
+
+    :param mesh: A dict from build_indexed_mesh.
+    :param start_x: World x of the chunk's first tile.
+    :param start_z: World z of the chunk's first tile.
+    :return: The expanded vertex array.
+    """
+    positions = mesh['positions'][mesh['indices']].astype(np.float64)
+    vertices = np.empty((len(positions), 6), dtype=np.float32)
+    vertices[:, 0] = positions[:, 0] + start_x
+    vertices[:, 1] = mesh['y_offset'] + positions[:, 1] * mesh['y_step']
+    vertices[:, 2] = positions[:, 2] + start_z
+    vertices[:, 3:] = mesh['colors'][mesh['indices']] / 255
+    return vertices.ravel()
+
+
+# Chunk data is passed between processes and stored on disk as one flat
+# float32 "pack": the (chunk_width + 2)^2 height grid followed by the
+# interleaved vertex data.
+
+def max_chunk_floats(chunk_width: int) -> int:
+    """
+    Upper bound on the packed size of one chunk: the height grid plus every
+    tile with a top face and all four walls, 6 vertices of 6 floats per quad.
+
+    :param chunk_width: Number of tiles per chunk side.
+    :return: The maximum number of float32 values in a packed chunk.
+    """
+    return (chunk_width + 2) ** 2 + chunk_width * chunk_width * 5 * 6 * 6
+
+
+def pack_chunk(out: np.ndarray, heights: np.ndarray, vertex_array: np.ndarray) -> int:
+    """
+    Write a chunk's height grid and vertex data into a flat float32 array.
+
+    :param out: Destination float32 array, at least max_chunk_floats long.
+    :return: The number of floats written.
+    """
+    grid_floats = heights.size
+    out[:grid_floats] = heights.ravel()
+    out[grid_floats:grid_floats + vertex_array.size] = vertex_array
+    return grid_floats + vertex_array.size
+
+
+def unpack_chunk(packed: np.ndarray, grid_width: int):
+    """
+    Split a packed chunk back into its parts. The parts are views of packed.
+
+    :param packed: Flat float32 array holding exactly one packed chunk.
+    :param grid_width: Number of tiles per side of the chunk's height grid,
+                       without the border (chunk_width / lod_step).
+    :return: A tuple (heights, vertex_array, vertex_count)
+    """
+    grid_size = grid_width + 2
+    heights = packed[:grid_size * grid_size].reshape(grid_size, grid_size)
+    vertex_array = packed[grid_size * grid_size:]
+    return heights, vertex_array, len(vertex_array) // 6
+
+
+def generate_chunk_shared(chunk_x: int, chunk_z: int, seed: int, scale: float, height_limit: int, chunk_width: int,
+                          greedy: bool, lod_step: int, block_name: str):
+    """
+    Process pool entry point for generate_chunk_data.
+    The packed chunk is written into a shared memory block provided (and
+    owned) by the parent instead of being pickled back; only the vertex
+    count is returned.
+
+    :param block_name: Name of a block of at least max_chunk_floats(chunk_width) float32s.
+    :return: The vertex count.
+    """
+    heights, vertex_array, vertex_count = generate_chunk_data(chunk_x, chunk_z, seed, scale, height_limit, chunk_width, greedy, lod_step)
+    block = shared_memory.SharedMemory(name=block_name)
+    try:
+        pack_chunk(np.ndarray((max_chunk_floats(chunk_width),), dtype=np.float32, buffer=block.buf), heights, vertex_array)
+    finally:
+        block.close()
+    return vertex_count
@@ -0,0 +1,136 @@
+from OpenGL.GL import *
+import numpy as np
+import ctypes
+
+# Corners of a box with its base centered on the origin, as multiples of
+# (half width, height, half width), and the corner pairs of its 12 edges.
+# Same box Entity.draw_entity_box draws.
+_BOX_CORNERS = np.array([
+    (1, 0, 1), (1, 0, -1), (-1, 0, -1), (-1, 0, 1),
+    (1, 1, 1), (1, 1, -1), (-1, 1, -1), (-1, 1, 1)
+], dtype=np.float32)
+_BOX_EDGES = np.array([
+    (0, 1), (1, 2), (2, 3), (3, 0),
+    (4, 5), (5, 6), (6, 7), (7, 4),
+    (0, 4), (1, 5), (2, 6), (3, 7)
+])
+# The 24 line vertices of a box, in edge order: what the index buffer draws each box's corners as.
+_BOX_LINES = _BOX_CORNERS[_BOX_EDGES.ravel()]
+
+
+class EnemyRenderer:
+    """
+    Draws many enemy boxes with one draw call. Each frame only the 8 corners
+    of every enemy's box are computed, for all enemies at once with numpy
+    (scaled, turned to the enemy's heading and moved to its position, colored
+    by its health), into an array kept between frames. They are streamed into
+    a single VBO and drawn as GL_LINES through a fixed index buffer holding
+    the 12 edges of every box, so the number of GL calls per frame does not
+    depend on the number of enemies.
+    """
+    def __init__(self, line_width: float = 2.0):
+        """
+        No GL calls are made until the first draw.
+
+        :param line_width: Width of the box lines in pixels.
+        """
+        self.line_width = line_width
+        self.vbo = None
+        self.ibo = None
+        # Corner vertices of up to len(self.__vertices) boxes, reused every frame,
+        # and the number of boxes the index buffer has edges for.
+        self.__vertices = np.empty((0, len(_BOX_CORNERS), 6), dtype=np.float32)
+        self.__index_capacity = 0
+
+    @staticmethod
+    def build_vertices(positions: np.ndarray, widths: np.ndarray, health_fractions: np.ndarray, out: np.ndarray = None) -> np.ndarray:
+        """
+        :param positions: (n, 4) array of (x, y, z, heading) enemy positions.
+        :param widths: n enemy widths. Boxes are twice as tall as they are wide.
+        :param health_fractions: n values from 0 to 1; boxes fade from white at
+                                 full health to red at none.
+        :param out: Optional float32 array of at least (n, 8, 6) to write into.
+        :return: An (n * 8, 6) float32 array of [x, y, z, r, g, b] corner vertices,
+                 in the order box_indices expects.
+        """
+        count = len(positions)
+        vertices = (np.empty((count, len(_BOX_CORNERS), 6), dtype=np.float32) if out is None else out)[:count]
+        positions = np.asarray(positions, dtype=np.float32)
+        half_widths = np.asarray(widths, dtype=np.float32) / 2
+        # Same turn as glRotatef(-heading, 0, 1, 0). The bottom corners (1, 1), (1, -1),
+        # (-1, -1) and (-1, 1) turn to (p, q), (q, -p), (-p, -q) and (-q, p) times the half width.
+        heading = np.radians(positions[:, 3])
+        cos = half_widths * np.cos(heading)
+        sin = half_widths * np.sin(heading)
+        p = cos - sin
+        q = cos + sin
+        x = positions[:, 0, None]
+        z = positions[:, 2, None]
+        np.add(x, np.stack((p, q, -p, -q), axis=1), out=vertices[:, :4, 0])
+        np.add(z, np.stack((q, -p, -q, p), axis=1), out=vertices[:, :4, 2])
+        vertices[:, 4:, 0] = vertices[:, :4, 0]
+        vertices[:, 4:, 2] = vertices[:, :4, 2]
+        vertices[:, :4, 1] = positions[:, 1, None]
+        vertices[:, 4:, 1] = (positions[:, 1] + half_widths * 4)[:, None]
+        vertices[:, :, 3] = 1.0
+        vertices[:, :, 4:6] = np.clip(health_fractions, 0, 1)[:, None, None]
+        return vertices.reshape(-1, 6)
+
+    @staticmethod
+    def box_indices(count: int) -> np.ndarray:
+        """
+        :param count: Number of boxes.
+        :return: count * 24 uint32 indices drawing the edges of each box's 8 corners as GL_LINES.
+        """
+        first_corners = np.arange(count, dtype=np.uint32)[:, None] * len(_BOX_CORNERS)
+        return (first_corners + _BOX_EDGES.ravel().astype(np.uint32)).ravel()
+
+    def draw(self, positions: np.ndarray, widths: np.ndarray, health_fractions: np.ndarray):
+        """
+        Draw one box per enemy. This must run on the main thread.
+
+        :param positions: (n, 4) array of (x, y, z, heading) enemy positions.
+        :param widths: n enemy widths.
+        :param health_fractions: n health / max health values.
+        """
+        count = len(positions)
+        if not count:
+            return
+        if count > len(self.__vertices):
+            # Grow in powers of two, so the arrays and index buffer are rarely rebuilt.
+            self.__vertices = np.empty((1 << (count - 1).bit_length(), len(_BOX_CORNERS), 6), dtype=np.float32)
+        vertices = self.build_vertices(positions, widths, health_fractions, out=self.__vertices)
+        if self.vbo is None:
+            self.vbo, self.ibo = glGenBuffers(2)
+        glBindBuffer(GL_ARRAY_BUFFER, self.vbo)
+        # Respecifying the whole buffer lets the driver hand back fresh storage
+        # instead of waiting for last frame's draw to finish with the old one.
+        glBufferData(GL_ARRAY_BUFFER, vertices.nbytes, vertices, GL_STREAM_DRAW)
+        glBindBuffer(GL_ELEMENT_ARRAY_BUFFER, self.ibo)
+        if self.__index_capacity < len(self.__vertices):
+            self.__index_capacity = len(self.__vertices)
+            indices = self.box_indices(self.__index_capacity)
+            glBufferData(GL_ELEMENT_ARRAY_BUFFER, indices.nbytes, indices, GL_STATIC_DRAW)
+        glEnableClientState(GL_VERTEX_ARRAY)
+        glEnableClientState(GL_COLOR_ARRAY)
+        stride = 6 * 4
+        glVertexPointer(3, GL_FLOAT, stride, ctypes.c_void_p(0))
+        glColorPointer(3, GL_FLOAT, stride, ctypes.c_void_p(12))
+        glLineWidth(self.line_width)
+        glDrawElements(GL_LINES, count * len(_BOX_LINES), GL_UNSIGNED_INT, None)
+        glLineWidth(1.0)
+        glDisableClientState(GL_VERTEX_ARRAY)
+        glDisableClientState(GL_COLOR_ARRAY)
+        glBindBuffer(GL_ELEMENT_ARRAY_BUFFER, 0)
+        glBindBuffer(GL_ARRAY_BUFFER, 0)
+
+    def delete(self):
+        """
+        Delete the buffers.
+        """
+        if self.vbo is not None:
+            glDeleteBuffers(2, [self.vbo, self.ibo])
+            self.vbo = None
+            self.ibo = None
+            self.__vertices = np.empty((0, len(_BOX_CORNERS), 6), dtype=np.float32)
+            self.__index_capacity = 0
@@ -5,6 +5,29 @@ from OpenGL.GL import *
 from OpenGL.GLU import *
 import random
 import math
+import types
+from SpatialHashGrid import SpatialHashGrid, neighbour_pairs
+from EnemyRenderer import EnemyRenderer
+from MeshCache import MeshCache
+import EntityPhysics
+from Profiler import profiled
+
+def interpolate_positions(previous: np.ndarray, current: np.ndarray, alpha: float) -> np.ndarray:
+    """
+    Blend (x, y, z, r) positions, turning headings the short way around.
+
+    :param previous: Positions at the start of a simulation step, (4,) or (n, 4).
+    :param current: Positions at its end, the same shape.
+    :param alpha: 0 for previous, 1 for current.
+    :return: The blended positions as a new array.
+    """
+    previous = np.asarray(previous, dtype=np.float32)
+    difference = np.asarray(current, dtype=np.float32) - previous
+    difference[..., 3] = (difference[..., 3] + 180) % 360 - 180
+    blended = previous + difference * alpha
+    blended[..., 3] %= 360
+    return blended
+
 
 class Entity():
     def __init__(self, 
@@ -30,6 +53,8 @@ class Entity():
         
         self.width = width
         self.height = width * 2
+        # Position at the start of the last simulation step, to draw between steps.
+        self.previous_position = self.position.copy()
         
         
     def get_width(self):
@@ -43,6 +68,14 @@ class Entity():
     
     def get_position(self):
         return tuple(self.position)
+
+    def get_interpolated_position(self, alpha=1.0):
+        """
+        :param alpha: How far through the current simulation step to look, from
+                      0 (its start) to 1 (its end).
+        :return: The (x, y, z, r) position that far between the last two steps.
+        """
+        return tuple(interpolate_positions(self.previous_position, self.position, alpha))
     
     def set_velocity(self, vx, vy, vz, vr):
         self.velocity = np.array([vx, vy, vz, vr], dtype=np.float32)
@@ -50,43 +83,25 @@ class Entity():
     def get_velocity(self):
         return tuple(self.velocity)
     
+    # Movement rules live in EntityPhysics so whole swarms can follow them at once;
+    # a single entity uses its scalar versions, which round the same way.
     def apply_friction(self):
-        self.velocity[0] *= self.friction_coefficient
-        self.velocity[2] *= self.friction_coefficient
+        velocity = self.velocity
+        velocity[0], velocity[2] = EntityPhysics.apply_friction_one(velocity[0], velocity[2], self.friction_coefficient)
     
     def apply_gravity(self):
-        if self.position[1] > 0:
-            if self.velocity[1] > self.max_fall_velocity:
-                self.velocity[1] -= self.gravity
-        else:
-            self.velocity[1] = 0
+        self.velocity[1] = EntityPhysics.apply_gravity_one(self.position[1], self.velocity[1], self.gravity, self.max_fall_velocity)
         
     def jump(self):
         self.velocity[1] += self.jump_power
             
     def push(self, input_velocity):
-        velocity_delta = np.array(input_velocity, dtype=np.float32)
-        current_velocity = np.array((self.velocity[0], self.velocity[2]), dtype=np.float32)
-        current_speed = np.linalg.norm(current_velocity)
-        new_velocity = current_velocity + velocity_delta
-        new_speed = np.linalg.norm(new_velocity)
-
-        speed_change = new_speed - current_speed
-        if speed_change > self.max_acceleration:
-            scale_factor = (current_speed + self.max_acceleration) / new_speed
-            new_velocity *= scale_factor
-
-        final_speed = np.linalg.norm(new_velocity)
-        if final_speed > self.max_speed:
-            scale_factor = self.max_speed / final_speed
-            new_velocity *= scale_factor
-
-        self.velocity[0] = new_velocity[0]
-        self.velocity[2] = new_velocity[1]
+        velocity = self.velocity
+        velocity[0], velocity[2] = EntityPhysics.push_one(velocity[0], velocity[2], input_velocity[0], input_velocity[1],
+                                                          self.max_acceleration, self.max_speed)
 
         # Update position based on velocity in x, z
-        self.position[0] += self.velocity[0]
-        self.position[2] += self.velocity[2]
+        self.position[0:3:2] += self.velocity[0:3:2]
         
     def rotate(self, r):
         self.position[3] += r
@@ -131,8 +146,10 @@ class Entity():
 
 
 class Player(Entity):
-    def __init__(self, placement, max_speed, max_acceleration, friction_coefficient, jump_power, gravity, max_fall_velocity, width, max_attack_range=3.0, attack_cooldown=1.0):
+    def __init__(self, placement, max_speed, max_acceleration, friction_coefficient, jump_power, gravity, max_fall_velocity, width, max_attack_range=3.0, attack_cooldown=1.0, mesh_cache=None):
         super().__init__(placement, max_speed, max_acceleration, friction_coefficient, jump_power, gravity, max_fall_velocity, width)
+        # Body, head and attack cone meshes, built once and shared with anything else given the same cache.
+        self.mesh_cache = mesh_cache if mesh_cache is not None else MeshCache()
         self.is_attacking = False
         self.attack_timer = 0.0
         self.attack_duration = 0.2  # Attack lasts 0.2 seconds
@@ -143,6 +160,7 @@ class Player(Entity):
         self.cooldown_timer = 0.0  # Timer to track time until the next attack is allowed
 
     def update(self, keys, map_height, dt):  
+        self.previous_position[:] = self.position
         direction_angle = np.radians(self.position[3])
         
         if (self.position[1] - map_height) < self.width / 2:
@@ -179,9 +197,7 @@ class Player(Entity):
             
         self.position += self.velocity
 
-        if self.position[1] <= map_height:
-            self.position[1] = map_height
-            self.velocity[1] = 0
+        self.position[1], self.velocity[1] = EntityPhysics.snap_to_ground_one(self.position[1], self.velocity[1], map_height)
         
         # Handle cooldown before allowing another attack
         self.cooldown_timer += dt  # Increase the cooldown timer by the delta time
@@ -197,14 +213,19 @@ class Player(Entity):
                 self.attack_timer = 0.0
         
 
-    def render(self):
+    @profiled('Player.render')
+    def render(self, camera_distance=None, alpha=1.0):
+        """
+        :param camera_distance: Distance from the camera, to draw the model with
+                                less detail when far away; None for full detail.
+        :param alpha: How far through the current simulation step to draw the player.
+        """
+        position = self.get_interpolated_position(alpha)
         glPushMatrix()
-        glTranslatef(self.position[0], self.position[1], self.position[2])
-        glRotatef(-self.position[3], 0, 1, 0)
-        
-        quad = gluNewQuadric()
+        glTranslatef(position[0], position[1], position[2])
+        glRotatef(-position[3], 0, 1, 0)
         
-        theta = math.radians(self.position[3])
+        theta = math.radians(position[3])
         x_relative_velocity = self.velocity[0] * math.cos(theta) + self.velocity[2] * math.sin(theta)
         z_relative_velocity = -self.velocity[0] * math.sin(theta) + self.velocity[2] * math.cos(theta)
         
@@ -219,9 +240,8 @@ class Player(Entity):
         # Tilt, print, untilt to show directional movement
         glRotatef(z_tilt, 1, 0, 0)
         glRotatef(-x_tilt, 0, 1, 0)
-        gluCylinder(quad, self.width / 2, 0, self.height * (2/3), 50, 50)
-        glRotatef(-z_tilt, 1, 0, 0)
-        glRotatef(x_tilt, 0, 1, 0)
+        glScalef(self.width / 2, self.width / 2, self.height * (2/3))
+        self.mesh_cache.draw('cone', 50, 50, camera_distance)
 
         glPopMatrix()
 
@@ -229,12 +249,11 @@ class Player(Entity):
         glPushMatrix()
         glTranslatef(0, self.height * 5 / 6, 0)
         glColor3f(0.0, 0.0, 0.0)  # Black head
-        gluSphere(quad, self.width / 3, 50, 50)
+        glScalef(self.width / 3, self.width / 3, self.width / 3)
+        self.mesh_cache.draw('sphere', 50, 50, camera_distance)
         
         glPopMatrix()
 
-        gluDeleteQuadric(quad)
-
         # Render the melee attack animation (a spinning cone) if active.
         if self.is_attacking:
             glPushMatrix()
@@ -258,12 +277,17 @@ class Player(Entity):
             glTranslatef(0, 0, attack_offset)  # Move the cone out from the player
 
             cone_base_radius = self.width * 0.2
-            quad = gluNewQuadric()
-            gluCylinder(quad, cone_base_radius, 0.0, tip_distance, 20, 5)  # cone's tip moves in/out smoothly
-            gluDeleteQuadric(quad)
+            glScalef(cone_base_radius, cone_base_radius, tip_distance)  # cone's tip moves in/out smoothly
+            self.mesh_cache.draw('cone', 20, 5, camera_distance)
             glPopMatrix()
         glPopMatrix()
 
+    def cleanup(self):
+        """
+        Delete the model meshes' buffers.
+        """
+        self.mesh_cache.delete()
+
     def melee_attack(self):
         if not self.is_attacking:
             self.is_attacking = True
@@ -281,8 +305,57 @@ class Player(Entity):
         return center, attack_radius
 
 
+# Per enemy arrays of an EnemyManager's swarm, and the Enemy attribute each row backs.
+SWARM_FIELDS = {
+    'positions': 'position',
+    'previous_positions': 'previous_position',
+    'velocities': 'velocity',
+    'max_speeds': 'max_speed',
+    'max_accelerations': 'max_acceleration',
+    'widths': 'width',
+    'healths': 'health',
+    'max_healths': 'max_health',
+    'flock_steerings': 'flock_steering',
+    'tiles': 'tile',
+    'tile_corner_heights': 'tile_corner_height'
+}
+
+
+def _swarm_field(name: str):
+    """
+    A property reading and writing an enemy's row of one of its swarm's arrays.
+    Rows of positions and velocities come back as writable views.
+    """
+    def get(self):
+        return getattr(self.swarm, name)[self.slot]
+
+    def set(self, value):
+        getattr(self.swarm, name)[self.slot] = value
+
+    return property(get, set)
+
+
 class Enemy(Entity):
+    """
+    One enemy of an EnemyManager. Its position, velocity, max_speed and health
+    are rows of the manager's swarm arrays rather than its own, so the whole
+    swarm can be updated at once; this object is a view onto that row.
+    """
+    position = _swarm_field('positions')
+    previous_position = _swarm_field('previous_positions')
+    velocity = _swarm_field('velocities')
+    max_speed = _swarm_field('max_speeds')
+    max_acceleration = _swarm_field('max_accelerations')
+    width = _swarm_field('widths')
+    health = _swarm_field('healths')
+    max_health = _swarm_field('max_healths')
+    flock_steering = _swarm_field('flock_steerings')
+    tile = _swarm_field('tiles')
+    tile_corner_height = _swarm_field('tile_corner_heights')
+
     def __init__(self, 
+                 swarm,
+                 slot: int,
                  placement: tuple, 
                  max_speed: float, 
                  max_acceleration: float, 
@@ -292,11 +365,26 @@ class Enemy(Entity):
                  max_fall_velocity: float, 
                  width: float, 
                  max_health: float):
+        """
+        :param swarm: The EnemyManager whose arrays hold this enemy's data.
+        :param slot: The enemy's row in those arrays.
+        """
+        self.swarm = swarm
+        self.slot = slot
         super().__init__(placement, max_speed, max_acceleration, friction_coefficient, 
                          jump_power, gravity, max_fall_velocity, width)
         self.max_health = max_health
         self.health = max_health
 
+    def detach(self):
+        """
+        Move the enemy's data out of its swarm into arrays of its own,
+        for when it is removed from the swarm.
+        """
+        data = {name: getattr(self.swarm, name)[self.slot:self.slot + 1].copy() for name in SWARM_FIELDS}
+        self.swarm = types.SimpleNamespace(**data)
+        self.slot = 0
+
     def take_damage(self, damage: float):
         self.health -= damage
         if self.health < 0:
@@ -310,39 +398,153 @@ class Enemy(Entity):
 
 
 class EnemyManager:
-    def __init__(self, mesh_map, spawn_radius, spawn_rate, group_spawn_size):
+    def __init__(self, mesh_map, spawn_radius, spawn_rate, group_spawn_size, cell_size=None, seed=None,
+                 interpolate_heights=False):
         self.mesh_map = mesh_map            # Reference to the mesh map for tile height lookups
+        self.random = random.Random(seed)   # Spawn randomness; seed it for repeatable runs
         self.spawn_radius = spawn_radius    # Maximum distance from the player for spawning
         self.spawn_rate = spawn_rate        # Time (in seconds) between spawns
         self.group_spawn_size = group_spawn_size  # Average number of enemies per group
         self.enemies = []                   # List to hold enemies
         self.time_since_last_spawn = 0      # Timer to track spawn intervals
+        self.interpolate_heights = interpolate_heights  # Blend terrain heights across tiles instead of standing on each tile's height
 
         self.attack_damage = 20  # Damage dealt per hit when the player attacks (I'll move this to player later)
+        self.spawn_spacing = 0.75  # Closest a new enemy spawns to an existing one (an enemy's width)
+
+        # Flocking: each enemy heads for the player while keeping clear of, lining up with and
+        # staying with the enemies around it. With flocking off they run straight at the player.
+        self.flocking = True
+        # Largest swarm that flocks; bigger swarms run straight at the player, since finding the
+        # neighbours costs about 1 ms an update at 2000 enemies but several ms at 10k.
+        self.flock_limit = 2000
+        self.flock_interval = 4         # Updates between finding neighbours; steering from them is reused in between
+        self.neighbour_radius = 3.0     # Enemies this close count as neighbours
+        self.separation_radius = 1.0    # Neighbours this close are pushed away from
+        self.seek_weight = 1.0
+        self.separation_weight = 1.5
+        self.alignment_weight = 0.5
+        self.cohesion_weight = 0.3
+
+        # The swarm as a structure of arrays: row i of each belongs to self.enemies[i].
+        # Rows past len(self.enemies) are spare, so spawning rarely reallocates.
+        self.positions = np.zeros((0, 4), dtype=np.float32)
+        self.previous_positions = np.zeros((0, 4), dtype=np.float32)  # Positions before the last update, to draw between updates
+        self.velocities = np.zeros((0, 4), dtype=np.float32)
+        self.max_speeds = np.zeros(0, dtype=np.float32)
+        self.max_accelerations = np.zeros(0, dtype=np.float32)
+        self.widths = np.zeros(0, dtype=np.float32)
+        self.healths = np.zeros(0, dtype=np.float32)
+        self.max_healths = np.zeros(0, dtype=np.float32)
+        self.flock_steerings = np.zeros((0, 2), dtype=np.float32)  # Weighted separation, alignment and cohesion from the last neighbour search
+        self.__flock_updates = 0  # Flocking updates so far, to find neighbours every flock_interval of them
+        # The tile each enemy was on at its last update and the heights of that tile's corners,
+        # so only enemies that moved onto another tile need the terrain looked up again.
+        self.tiles = np.zeros((0, 2), dtype=np.int64)
+        self.tile_corner_heights = np.zeros((0, 4), dtype=np.float64)
+        # Grid over the enemies' x, z positions for attack, render and spawn queries,
+        # with cells a chunk wide unless cell_size says otherwise. It is brought up to
+        # date by update, so positions written directly show up after the next update.
+        self.grid = SpatialHashGrid(cell_size or mesh_map.get_chunk_width())
+        # Draws every enemy's box in one draw call.
+        self.renderer = EnemyRenderer()
+
+    def __ground_positions(self) -> np.ndarray:
+        """
+        :return: A view of the live enemies' (x, z) positions.
+        """
+        return self.positions[:len(self.enemies), 0:3:2]
+
+    def __reserve(self, count: int):
+        """
+        Make sure the swarm arrays have room for count enemies.
+        """
+        capacity = len(self.positions)
+        if count <= capacity:
+            return
+        capacity = max(count, capacity * 2, 64)
+        for name in SWARM_FIELDS:
+            array = getattr(self, name)
+            grown = np.zeros((capacity,) + array.shape[1:], dtype=array.dtype)
+            grown[:len(self.enemies)] = array[:len(self.enemies)]
+            setattr(self, name, grown)
+
+    def add_enemies(self, placements, max_speed=2, max_acceleration=0.1, friction_coefficient=0.7, jump_power=0.7,
+                    gravity=0.1, max_fall_velocity=-1.5, width=0.75, max_health=100) -> list:
+        """
+        Add enemies to the swarm.
+
+        :param placements: (x, y, z, r) placement of each new enemy.
+        :return: The new enemies.
+        """
+        first = len(self.enemies)
+        self.__reserve(first + len(placements))
+        added = [
+            Enemy(self, first + i, placement, max_speed, max_acceleration, friction_coefficient,
+                  jump_power, gravity, max_fall_velocity, width, max_health)
+            for i, placement in enumerate(placements)
+        ]
+        self.enemies.extend(added)
+        # Spare rows may hold a removed enemy's steering; new enemies have none until the next neighbour search.
+        self.flock_steerings[first:len(self.enemies)] = 0
+        # No tile yet, so the first update looks up their terrain.
+        self.tiles[first:len(self.enemies)] = np.iinfo(np.int64).min
+        self.grid.update(self.__ground_positions())
+        return added
+
+    def __remove_dead(self, slots):
+        """
+        Drop enemies with no health left. The last live enemies move into the
+        rows the dead leave, so only they are renumbered, and the grid drops and
+        renumbers just those slots instead of being rebuilt.
+
+        :param slots: Distinct slots that may have died, e.g. those just hit; no other slot is looked at.
+        """
+        count = len(self.enemies)
+        slots = np.asarray(slots, dtype=np.int64)
+        dead = np.sort(slots[self.healths[slots] <= 0])
+        if not len(dead):
+            return
+        # Anything still holding a dead enemy keeps its last state.
+        for slot in dead:
+            self.enemies[slot].detach()
+        survivors = count - len(dead)
+        holes = dead[dead < survivors]
+        # The live rows past the survivors' end are the ones moved into holes.
+        live_tail = np.ones(count - survivors, dtype=bool)
+        live_tail[dead[dead >= survivors] - survivors] = False
+        movers = np.flatnonzero(live_tail) + survivors
+        for name in SWARM_FIELDS:
+            array = getattr(self, name)
+            array[holes] = array[movers]
+        for hole, mover in zip(holes.tolist(), movers.tolist()):
+            enemy = self.enemies[mover]
+            enemy.slot = hole
+            self.enemies[hole] = enemy
+        del self.enemies[survivors:]
+        self.grid.remove(dead, movers, holes)
 
     def spawn_enemy_group(self, player_position):
         """Spawn a group of enemies randomly within the spawn radius around the player."""
-        group_size = int(self.group_spawn_size + random.uniform(-2, 2))
+        group_size = int(self.group_spawn_size + self.random.uniform(-2, 2))
+        spawn_positions = []
         for _ in range(group_size):
-            spawn_distance = random.uniform(0, self.spawn_radius / 4) + self.spawn_radius
-            spawn_angle = random.uniform(0, 2 * np.pi)
-            x_offset = spawn_distance * np.cos(spawn_angle)
-            z_offset = spawn_distance * np.sin(spawn_angle)
-            spawn_position = (player_position[0] + x_offset, 0, player_position[2] + z_offset)
-            spawn_height = self.mesh_map.get_tile_height((spawn_position[0], spawn_position[2]))
-            enemy = Enemy(
-                placement=(spawn_position[0], spawn_height, spawn_position[2], 0),
-                max_speed=2,
-                max_acceleration=0.1,
-                friction_coefficient=0.7,
-                jump_power=0.7,
-                gravity=0.1,
-                max_fall_velocity=-1.5,
-                width=0.75,
-                max_health=100
-            )
-            self.enemies.append(enemy)
-
+            # Try a few spots so enemies do not spawn inside one another.
+            for _ in range(3):
+                spawn_distance = self.random.uniform(0, self.spawn_radius / 4) + self.spawn_radius
+                spawn_angle = self.random.uniform(0, 2 * np.pi)
+                x_offset = spawn_distance * np.cos(spawn_angle)
+                z_offset = spawn_distance * np.sin(spawn_angle)
+                spawn_position = (player_position[0] + x_offset, player_position[2] + z_offset)
+                if not len(self.grid.query_radius(spawn_position, self.spawn_spacing, self.__ground_positions())):
+                    break
+            spawn_positions.append(spawn_position)
+        if not spawn_positions:
+            return
+        spawn_heights = self.mesh_map.get_tile_heights(spawn_positions)
+        self.add_enemies([(x, height, z, 0) for (x, z), height in zip(spawn_positions, spawn_heights)])
+
+    @profiled('EnemyManager.update')
     def update(self, player_position, dt):
         """Update enemy spawning and move all enemies toward the player.
            Also adjust each enemy's y position based on the terrain.
@@ -352,43 +554,133 @@ class EnemyManager:
             self.spawn_enemy_group(player_position)
             self.time_since_last_spawn = 0
 
-        # Move each enemy toward the player and fix y-position.
-        for enemy in self.enemies:
-            target = np.array(player_position[:3])
-            enemy_pos = enemy.position[:3]
-            direction = target - enemy_pos
-            distance = np.linalg.norm(direction)
-            if distance > 0:
-                direction /= distance  # Normalize
-                velocity = direction * enemy.max_speed
-                enemy.position[:3] += velocity * dt
-
-            # Adjust enemy's y-coordinate based on the terrain.
-            tile_height = self.mesh_map.get_tile_height((enemy.position[0], enemy.position[2]))
-            enemy.position[1] = tile_height
+        count = len(self.enemies)
+        if not count:
+            return
+        positions = self.positions[:count]
+        self.previous_positions[:count] = positions
+        if self.flocking and count <= self.flock_limit:
+            if self.__flock_updates % self.flock_interval == 0:
+                self.flock_steerings[:count] = self.__neighbour_steering(count)
+            self.__flock_updates += 1
+            self.velocities[:count, 0:3:2] = self.__flock(player_position, count)
+            positions[:, 0:3:2] += self.velocities[:count, 0:3:2] * dt
+        else:
+            # Find neighbours afresh whenever flocking resumes.
+            self.__flock_updates = 0
+            # Steer the whole swarm straight toward the player at max speed.
+            direction = np.asarray(player_position[:3]) - positions[:, :3]
+            distance = np.sqrt(np.einsum('ij,ij->i', direction, direction))[:, None]
+            np.divide(direction, distance, out=direction, where=distance > 0)  # Normalize
+            velocity = direction * self.max_speeds[:count, None]
+            self.velocities[:count, :3] = velocity
+            positions[:, :3] += velocity * dt
+
+        # Adjust every enemy's y-coordinate based on the terrain. Only enemies that moved onto
+        # another tile need a terrain query; the rest use the corner heights they kept.
+        ground = positions[:, 0:3:2].astype(np.float64)
+        tiles = np.floor(ground).astype(np.int64)
+        moved = np.flatnonzero((tiles != self.tiles[:count]).any(axis=1))
+        if len(moved):
+            self.tiles[moved] = tiles[moved]
+            self.tile_corner_heights[moved] = self.mesh_map.get_tile_corner_heights(tiles[moved]).T
+        if self.interpolate_heights:
+            positions[:, 1] = self.mesh_map.interpolate_tile_heights(ground, self.tile_corner_heights[:count].T)
+        else:
+            positions[:, 1] = self.tile_corner_heights[:count, 0]
+        self.grid.update(self.__ground_positions())
+
+    def __neighbour_steering(self, count: int) -> np.ndarray:
+        """
+        The separation, alignment and cohesion parts of __flock's steering, weighted,
+        for the whole swarm. Neighbours are found with neighbour_pairs, so the cost
+        grows with the swarm size rather than its square, and the pairs' shares are
+        summed with bincount one axis at a time.
 
+        :param count: Number of live enemies.
+        :return: A (count, 2) array of (x, z) steering.
+        """
+        ground = self.positions[:count, 0:3:2].astype(np.float64)
+        velocity = self.velocities[:count, 0:3:2].astype(np.float64)
+        max_speeds = self.max_speeds[:count].astype(np.float64)
+        first, second, offsets, distances = neighbour_pairs(ground, self.neighbour_radius)
+        neighbours = np.maximum(np.bincount(first, minlength=count) + np.bincount(second, minlength=count), 1)
+        cohesion = self.cohesion_weight / self.neighbour_radius
+        alignment_first = self.alignment_weight / max_speeds[first]
+        alignment_second = self.alignment_weight / max_speeds[second]
+        close = np.flatnonzero((distances < self.separation_radius) & (distances > 0))
+        close_first, close_second = first[close], second[close]
+        separation = self.separation_weight * self.separation_radius / distances[close] ** 2
+
+        steering = np.empty((count, 2))
+        for axis in range(2):
+            offset = offsets[:, axis]
+            axis_velocity = velocity[:, axis]
+            # Each pair is found once, so it steers both of its enemies. Cohesion (toward the
+            # neighbours' center, relative to the neighbour radius) and alignment (along their
+            # mean velocity, relative to max speed) are averages over the neighbours.
+            averaged = (np.bincount(first, axis_velocity[second] * alignment_first - offset * cohesion, minlength=count)
+                        + np.bincount(second, axis_velocity[first] * alignment_second + offset * cohesion, minlength=count))
+            # Separation: away from neighbours inside the separation radius, harder the closer they are.
+            push = offset[close] * separation
+            steering[:, axis] = (averaged / neighbours + np.bincount(close_first, push, minlength=count)
+                                 - np.bincount(close_second, push, minlength=count))
+        return steering
+
+    def __flock(self, player_position, count: int) -> np.ndarray:
+        """
+        Boids steering for the whole swarm: toward the player, plus the neighbour
+        steering from the last __neighbour_steering. The new velocities follow
+        Entity.push's limits (EntityPhysics.limit_velocities): speed grows by at most
+        max_acceleration per update and never passes max_speed.
+
+        :param player_position: The (x, y, z, r) position being chased.
+        :param count: Number of live enemies.
+        :return: A (count, 2) array of new (x, z) velocities.
+        """
+        ground = self.positions[:count, 0:3:2].astype(np.float64)
+        velocity = self.velocities[:count, 0:3:2].astype(np.float64)
+        max_speeds = self.max_speeds[:count].astype(np.float64)
+        # Seek: toward the player.
+        seek = np.array((player_position[0], player_position[2]), dtype=np.float64) - ground
+        seek_length = np.hypot(seek[:, 0], seek[:, 1])[:, None]
+        np.divide(seek, seek_length, out=seek, where=seek_length > 0)
+
+        direction = seek * self.seek_weight + self.flock_steerings[:count]
+        length = np.hypot(direction[:, 0], direction[:, 1])[:, None]
+        new_velocity = np.divide(direction * max_speeds[:, None], length, out=np.zeros_like(direction), where=length > 0)
+
+        # Same limits as Entity.push.
+        return EntityPhysics.limit_velocities(velocity, new_velocity, self.max_accelerations[:count], max_speeds)
+
+    @profiled('EnemyManager.handle_player_attacks')
     def handle_player_attacks(self, attack_center, attack_radius):
         """
         Given the affected x,z coordinates of an attack and its effective radius,
         apply damage to any enemy within that area.
         """
-        attack_center = np.array(attack_center)
-        for enemy in self.enemies:
-            enemy_pos = np.array([enemy.position[0], enemy.position[2]])
-            distance = np.linalg.norm(attack_center - enemy_pos)
-            if distance <= attack_radius:
-                enemy.take_damage(self.attack_damage)
-                
+        count = len(self.enemies)
+        if not count:
+            return
+        hit = self.grid.query_radius(attack_center, attack_radius, self.__ground_positions())
+        healths = self.healths[:count]
+        healths[hit] = np.maximum(healths[hit] - self.attack_damage, 0)
+
         # Remove any enemies that have died.
-        self.enemies = [enemy for enemy in self.enemies if enemy.is_alive()]
-
-    def render(self, player_position, distance):
-        """Render all spawned enemies."""
-        for enemy in self.enemies:
-            position = enemy.get_position()
-            absolute_distance = math.sqrt((player_position[0] - position[0])**2 + (player_position[2] - position[2])**2)
-            if absolute_distance <= distance:
-                enemy.draw_entity_box(color=(1.0, 1.0, 1.0))
+        self.__remove_dead(hit)
+
+    @profiled('EnemyManager.render')
+    def render(self, player_position, distance, alpha=1.0):
+        """Render all spawned enemies within distance of the player, as boxes fading
+           from white to red as they lose health, in a single draw call.
+           Enemies are drawn alpha of the way from their previous to their current position."""
+        nearby = np.sort(self.grid.query_radius((player_position[0], player_position[2]), distance, self.__ground_positions()))
+        positions = interpolate_positions(self.previous_positions[nearby], self.positions[nearby], alpha)
+        self.renderer.draw(positions, self.widths[nearby], self.healths[nearby] / self.max_healths[nearby])
+
+    def cleanup(self):
+        """Delete the enemy renderer's buffer."""
+        self.renderer.delete()
 
     
     
@@ -0,0 +1,183 @@
+import math
+import numpy as np
+
+# Movement rules of Entity, for any number of entities at once. Each function
+# takes arrays with one row (or value) per entity, or a single entity's values,
+# and returns new arrays in the dtype of the velocities or heights it was given,
+# rounding the same way Entity's float32 arithmetic does, so the results match
+# Entity's per entity methods exactly.
+#
+# The *_one functions below follow the same rules for a single entity with
+# float32 scalars, which is cheaper than going through arrays of one; Entity's
+# methods use them, and each rounds every step exactly as its batched kernel does.
+
+
+def speeds(velocities: np.ndarray) -> np.ndarray:
+    """
+    :param velocities: (..., 2) array of (x, z) velocities.
+    :return: Their lengths, computed as np.linalg.norm computes them.
+    """
+    velocities = np.asarray(velocities)
+    return np.sqrt(velocities[..., 0] * velocities[..., 0] + velocities[..., 1] * velocities[..., 1])
+
+
+def limit_velocities(velocities: np.ndarray, new_velocities: np.ndarray, max_accelerations, max_speeds) -> np.ndarray:
+    """
+    Limit changes of velocity the way Entity.push does: the speed may grow by at
+    most max_acceleration, then is capped at max_speed. Directions are kept.
+
+    :param velocities: (..., 2) array of current (x, z) velocities.
+    :param new_velocities: (..., 2) array of the (x, z) velocities asked for.
+    :param max_accelerations: Largest speed gain of each entity.
+    :param max_speeds: Largest speed of each entity.
+    :return: The limited (x, z) velocities.
+    """
+    velocities = np.asarray(velocities)
+    dtype = velocities.dtype
+    max_accelerations = np.asarray(max_accelerations, dtype=dtype)
+    max_speeds = np.asarray(max_speeds, dtype=dtype)
+    current_speed = speeds(velocities)
+    new_velocities = np.array(new_velocities, dtype=dtype)
+    new_speed = speeds(new_velocities)
+
+    too_fast = new_speed - current_speed > max_accelerations
+    scale = np.divide(current_speed + max_accelerations, new_speed, out=np.ones_like(new_speed), where=too_fast)
+    new_velocities *= scale[..., None]
+
+    final_speed = speeds(new_velocities)
+    over = final_speed > max_speeds
+    scale = np.divide(max_speeds, final_speed, out=np.ones_like(final_speed), where=over)
+    new_velocities *= scale[..., None]
+    return new_velocities
+
+
+def push(velocities: np.ndarray, inputs, max_accelerations, max_speeds) -> np.ndarray:
+    """
+    Entity.push's velocity change: add the inputs, then limit_velocities.
+
+    :param velocities: (..., 2) array of current (x, z) velocities.
+    :param inputs: (..., 2) array-like of (x, z) velocity changes asked for.
+    :param max_accelerations: Largest speed gain of each entity.
+    :param max_speeds: Largest speed of each entity.
+    :return: The new (x, z) velocities. Entity.push then moves by them.
+    """
+    velocities = np.asarray(velocities)
+    return limit_velocities(velocities, velocities + np.asarray(inputs, dtype=velocities.dtype), max_accelerations, max_speeds)
+
+
+def apply_friction(velocities: np.ndarray, friction_coefficients) -> np.ndarray:
+    """
+    :param velocities: (..., 2) array of (x, z) velocities.
+    :param friction_coefficients: Fraction of its speed each entity keeps.
+    :return: The slowed (x, z) velocities.
+    """
+    velocities = np.asarray(velocities)
+    return velocities * np.asarray(friction_coefficients, dtype=velocities.dtype)[..., None]
+
+
+def apply_gravity(heights, vertical_velocities, gravities, max_fall_velocities) -> np.ndarray:
+    """
+    Entity.apply_gravity: entities above 0 fall faster by gravity until they
+    reach max_fall_velocity; entities at or below 0 stop falling.
+
+    :param heights: y position of each entity.
+    :param vertical_velocities: y velocity of each entity.
+    :param gravities: Fall speed gained per update by each entity.
+    :param max_fall_velocities: Most negative y velocity gravity takes each entity to.
+    :return: The new y velocities.
+    """
+    vertical_velocities = np.asarray(vertical_velocities)
+    dtype = vertical_velocities.dtype
+    gravities = np.asarray(gravities, dtype=dtype)
+    max_fall_velocities = np.asarray(max_fall_velocities, dtype=dtype)
+    airborne = np.asarray(heights) > 0
+    falling = airborne & (vertical_velocities > max_fall_velocities)
+    return np.where(falling, vertical_velocities - gravities, np.where(airborne, vertical_velocities, dtype.type(0)))
+
+
+def snap_to_ground(heights, vertical_velocities, ground_heights):
+    """
+    Put entities at or below the ground on it and stop their fall, as
+    Player.update does after moving.
+
+    :param heights: y position of each entity.
+    :param vertical_velocities: y velocity of each entity.
+    :param ground_heights: Terrain height under each entity.
+    :return: A tuple (heights, vertical_velocities) after the snap.
+    """
+    heights = np.asarray(heights)
+    vertical_velocities = np.asarray(vertical_velocities)
+    ground_heights = np.asarray(ground_heights)
+    # Compared before rounding the ground to the heights' dtype, as Player.update does.
+    grounded = heights <= ground_heights
+    return (np.where(grounded, ground_heights.astype(heights.dtype), heights),
+            np.where(grounded, vertical_velocities.dtype.type(0), vertical_velocities))
+
+
+def limit_velocity_one(velocity_x, velocity_z, new_x, new_z, max_acceleration, max_speed) -> tuple:
+    """
+    limit_velocities for one entity.
+
+    :return: The limited (x, z) velocity as float32 scalars.
+    """
+    float32 = np.float32
+    velocity_x, velocity_z = float32(velocity_x), float32(velocity_z)
+    new_x, new_z = float32(new_x), float32(new_z)
+    max_acceleration, max_speed = float32(max_acceleration), float32(max_speed)
+    # A float32 square root taken in double precision rounds to the same float32.
+    current_speed = float32(math.sqrt(velocity_x * velocity_x + velocity_z * velocity_z))
+    new_speed = float32(math.sqrt(new_x * new_x + new_z * new_z))
+    if new_speed - current_speed > max_acceleration:
+        scale = (current_speed + max_acceleration) / new_speed
+        new_x, new_z = new_x * scale, new_z * scale
+    final_speed = float32(math.sqrt(new_x * new_x + new_z * new_z))
+    if final_speed > max_speed:
+        scale = max_speed / final_speed
+        new_x, new_z = new_x * scale, new_z * scale
+    return new_x, new_z
+
+
+def push_one(velocity_x, velocity_z, input_x, input_z, max_acceleration, max_speed) -> tuple:
+    """
+    push for one entity.
+
+    :return: The new (x, z) velocity as float32 scalars.
+    """
+    velocity_x, velocity_z = np.float32(velocity_x), np.float32(velocity_z)
+    return limit_velocity_one(velocity_x, velocity_z, velocity_x + np.float32(input_x), velocity_z + np.float32(input_z),
+                              max_acceleration, max_speed)
+
+
+def apply_friction_one(velocity_x, velocity_z, friction_coefficient) -> tuple:
+    """
+    apply_friction for one entity.
+
+    :return: The slowed (x, z) velocity as float32 scalars.
+    """
+    friction_coefficient = np.float32(friction_coefficient)
+    return np.float32(velocity_x) * friction_coefficient, np.float32(velocity_z) * friction_coefficient
+
+
+def apply_gravity_one(height, vertical_velocity, gravity, max_fall_velocity):
+    """
+    apply_gravity for one entity.
+
+    :return: The new y velocity as a float32 scalar.
+    """
+    vertical_velocity = np.float32(vertical_velocity)
+    if not height > 0:
+        return np.float32(0)
+    if vertical_velocity > np.float32(max_fall_velocity):
+        return vertical_velocity - np.float32(gravity)
+    return vertical_velocity
+
+
+def snap_to_ground_one(height, vertical_velocity, ground_height) -> tuple:
+    """
+    snap_to_ground for one entity.
+
+    :return: A tuple (height, vertical_velocity) of float32 scalars after the snap.
+    """
+    if height <= ground_height:
+        return np.float32(ground_height), np.float32(0)
+    return np.float32(height), np.float32(vertical_velocity)
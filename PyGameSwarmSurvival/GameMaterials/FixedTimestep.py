@@ -0,0 +1,47 @@
+class FixedTimestep:
+    """
+    Turns irregular frame times into a whole number of fixed length simulation
+    steps. Frame time builds up in an accumulator, and each frame runs as many
+    steps as fit in it; what is left over becomes alpha, how far the frame is
+    drawn between the last two steps. A slow frame is made up with more steps
+    (up to max_substeps) instead of one long step, so frame spikes do not
+    change the simulation, and time past that cap is dropped so one slow frame
+    cannot leave the next ones further behind.
+    """
+    def __init__(self, step: float = 1 / 60, max_substeps: int = 5):
+        """
+        :param step: Simulated seconds per step.
+        :param max_substeps: Most steps run for one frame.
+        """
+        self.step = step
+        self.max_substeps = max_substeps
+        self.accumulator = 0.0  # Frame time not yet simulated
+        self.alpha = 0.0        # accumulator / step after the last advance
+        self.steps = 0          # Steps handed out so far
+        self.dropped_time = 0.0 # Frame time thrown away by the max_substeps cap
+
+    def advance(self, frame_time: float) -> int:
+        """
+        Add a frame's time and take out the steps it completes.
+
+        :param frame_time: Real seconds since the last frame.
+        :return: The number of steps to simulate this frame.
+        """
+        self.accumulator += frame_time
+        steps = int(self.accumulator / self.step)
+        if steps > self.max_substeps:
+            # Drop the whole steps past the cap but keep the partial one, so alpha stays smooth.
+            dropped = (steps - self.max_substeps) * self.step
+            self.dropped_time += dropped
+            self.accumulator -= dropped
+            steps = self.max_substeps
+        self.accumulator -= steps * self.step
+        self.alpha = min(max(self.accumulator / self.step, 0.0), 1.0)
+        self.steps += steps
+        return steps
+
+    def get_simulated_time(self) -> float:
+        """
+        :return: Simulated seconds so far.
+        """
+        return self.steps * self.step
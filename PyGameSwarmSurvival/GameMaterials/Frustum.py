@@ -0,0 +1,99 @@
+import numpy as np
+import math
+
+
+# View frustum math for culling, done in numpy so it runs without an OpenGL context.
+# The matrices follow the OpenGL convention (column vectors, right handed view
+# space looking down -z) and match what gluPerspective and gluLookAt build.
+
+
+def perspective_matrix(fovy: float, aspect: float, near: float, far: float) -> np.ndarray:
+    """
+    Same matrix as gluPerspective.
+
+    :param fovy: Vertical field of view in degrees.
+    :param aspect: Viewport width / height.
+    :param near: Distance to the near plane.
+    :param far: Distance to the far plane.
+    :return: A 4x4 float64 projection matrix.
+    """
+    f = 1.0 / math.tan(math.radians(fovy) / 2)
+    return np.array([
+        [f / aspect, 0, 0, 0],
+        [0, f, 0, 0],
+        [0, 0, (far + near) / (near - far), 2 * far * near / (near - far)],
+        [0, 0, -1, 0]
+    ])
+
+
+def look_at_matrix(eye, center, up) -> np.ndarray:
+    """
+    Same matrix as gluLookAt.
+
+    :param eye: (x, y, z) camera position.
+    :param center: (x, y, z) point the camera looks at.
+    :param up: (x, y, z) up direction.
+    :return: A 4x4 float64 view matrix.
+    """
+    eye = np.asarray(eye, dtype=np.float64)
+    forward = np.asarray(center, dtype=np.float64) - eye
+    forward /= np.linalg.norm(forward)
+    side = np.cross(forward, np.asarray(up, dtype=np.float64))
+    side /= np.linalg.norm(side)
+    true_up = np.cross(side, forward)
+    view = np.identity(4)
+    view[0, :3] = side
+    view[1, :3] = true_up
+    view[2, :3] = -forward
+    view[:3, 3] = -view[:3, :3] @ eye
+    return view
+
+
+class Frustum:
+    """
+    The six planes of a view frustum, for testing axis aligned boxes against it.
+    """
+    def __init__(self, projection: np.ndarray, view: np.ndarray):
+        """
+        :param projection: 4x4 projection matrix (see perspective_matrix).
+        :param view: 4x4 view matrix (see look_at_matrix).
+        """
+        clip = np.asarray(projection, dtype=np.float64) @ np.asarray(view, dtype=np.float64)
+        # Gribb/Hartmann: each plane is the w row plus or minus one of the other rows.
+        # Order: left, right, bottom, top, near, far. A point p is inside a plane
+        # when dot(normal, p) + d >= 0.
+        planes = np.array([
+            clip[3] + clip[0],
+            clip[3] - clip[0],
+            clip[3] + clip[1],
+            clip[3] - clip[1],
+            clip[3] + clip[2],
+            clip[3] - clip[2]
+        ])
+        self.planes = planes / np.linalg.norm(planes[:, :3], axis=1)[:, None]
+
+    def contains_boxes(self, mins: np.ndarray, maxs: np.ndarray) -> np.ndarray:
+        """
+        Test many axis aligned boxes at once. The test is conservative: a box
+        is only rejected if it is entirely behind one of the planes, so a few
+        boxes near the frustum's corners may be kept even though they are outside.
+
+        :param mins: (n, 3) array of box minimum corners.
+        :param maxs: (n, 3) array of box maximum corners.
+        :return: A bool array, True for boxes that may be visible.
+        """
+        mins = np.asarray(mins, dtype=np.float64)
+        maxs = np.asarray(maxs, dtype=np.float64)
+        normals = self.planes[:, :3]
+        # For each box and plane, the corner furthest along the plane normal.
+        furthest = np.where(normals[None, :, :] >= 0, maxs[:, None, :], mins[:, None, :])
+        distances = np.einsum('npk,pk->np', furthest, normals) + self.planes[:, 3]
+        return np.all(distances >= 0, axis=1)
+
+    def contains_points(self, points: np.ndarray) -> np.ndarray:
+        """
+        :param points: (n, 3) array of points.
+        :return: A bool array, True for points inside the frustum.
+        """
+        points = np.asarray(points, dtype=np.float64)
+        return np.all(points @ self.planes[:, :3].T + self.planes[:, 3] >= 0, axis=1)
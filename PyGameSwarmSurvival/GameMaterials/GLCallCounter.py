@@ -0,0 +1,76 @@
+import collections
+import itertools
+
+
+class GLCallCounter:
+    """
+    Counts the OpenGL calls made by code in the given modules.
+    Every gl* function the modules imported is swapped for a wrapper that
+    counts the call, then forwards it to the real function. With mock=True the
+    real functions are never called (glGenBuffers hands out fake ids), so
+    rendering code can be measured without a window or GL context.
+
+    Use it as a context manager:
+        with GLCallCounter(MeshMap, mock=True) as counter:
+            mesh_map.render(target)
+        print(counter.total())
+    """
+    def __init__(self, *modules, mock: bool = False):
+        """
+        :param modules: Modules whose gl* functions should be counted.
+        :param mock: Replace the GL functions instead of forwarding to them.
+        """
+        self.modules = modules
+        self.mock = mock
+        self.counts = collections.Counter()
+        self.__originals = []
+        self.__buffer_ids = itertools.count(1)
+
+    def __wrap(self, name: str, function):
+        def counted(*args, **kwargs):
+            self.counts[name] += 1
+            if not self.mock:
+                return function(*args, **kwargs)
+            if name == 'glGenBuffers':
+                count = args[0]
+                ids = [next(self.__buffer_ids) for _ in range(count)]
+                return ids[0] if count == 1 else ids
+            return None
+        return counted
+
+    def install(self):
+        """
+        Start counting.
+        """
+        for module in self.modules:
+            for name, value in list(vars(module).items()):
+                if name.startswith('gl') and callable(value):
+                    self.__originals.append((module, name, value))
+                    setattr(module, name, self.__wrap(name, value))
+
+    def uninstall(self):
+        """
+        Put the real GL functions back.
+        """
+        for module, name, value in self.__originals:
+            setattr(module, name, value)
+        self.__originals.clear()
+
+    def reset(self):
+        """
+        Zero the counts.
+        """
+        self.counts.clear()
+
+    def total(self) -> int:
+        """
+        :return: The total number of GL calls counted.
+        """
+        return sum(self.counts.values())
+
+    def __enter__(self):
+        self.install()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.uninstall()
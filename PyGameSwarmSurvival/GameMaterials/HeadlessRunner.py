@@ -0,0 +1,229 @@
+import collections
+import os
+import time
+import numpy as np
+# Importing pygame prints a banner to stdout, which may be carrying a report.
+os.environ.setdefault('PYGAME_HIDE_SUPPORT_PROMPT', '1')
+from pygame.locals import K_UP, K_a, K_d, K_m
+from Entity import Player, EnemyManager
+from MeshMap import MeshMap
+from Simulation import Simulation
+from Profiler import profiler, frame_time_summary
+from FixedTimestep import FixedTimestep
+from InputRecording import InputRecording
+
+
+def scripted_input(segments):
+    """
+    Input from a script of held keys.
+
+    :param segments: (start_tick, end_tick, keys) entries; keys (a collection of
+                     pygame key constants) are held from start_tick up to but
+                     not including end_tick. Segments may overlap.
+    :return: A function of the tick giving the keys held on it.
+    """
+    segments = list(segments)
+
+    def keys_at(tick: int):
+        return [key for start, end, keys in segments if start <= tick < end for key in keys]
+
+    return keys_at
+
+
+def circling_input(ticks_per_turn: int = 240):
+    """
+    Input for load tests: run forward the whole time, keep turning and attack
+    whenever the cooldown allows, so the player drags the swarm around and
+    keeps fighting it.
+
+    :param ticks_per_turn: Ticks spent turning one way before turning the other.
+    :return: A function of the tick giving the keys held on it.
+    """
+    def keys_at(tick: int):
+        turn = K_d if (tick // ticks_per_turn) % 2 == 0 else K_a
+        return (K_UP, K_m, turn)
+
+    return keys_at
+
+
+class HeadlessRunner:
+    """
+    Runs the game loop with no window, GL or real input: a headless MeshMap,
+    the player steered by an input script, and an EnemyManager spawning from a
+    seeded generator. Ticks run back to back as fast as they can, so a run
+    gives the game's throughput, where each tick's time goes, and a hash of the
+    final state that two runs with the same settings must agree on.
+
+    The settings default to main's.
+    """
+    def __init__(self,
+                 seed: int = 0,
+                 input_script=None,
+                 chunk_width: int = 10,
+                 render_distance: int = 10,
+                 map_seed: int = 48,
+                 scale: float = 0.003,
+                 spawn_rate: float = 2,
+                 group_spawn_size: int = 4,
+                 executor: str = 'inline',
+                 step: float = 1 / 60):
+        """
+        :param seed: Seed for enemy spawns.
+        :param input_script: A function of the tick giving the pygame key constants
+                             held on it, such as scripted_input builds; None for circling_input.
+        :param chunk_width: Tiles along each chunk side.
+        :param render_distance: Chunks streamed around the player in each direction.
+        :param map_seed: Terrain seed.
+        :param scale: Terrain noise scale.
+        :param spawn_rate: Seconds between enemy groups.
+        :param group_spawn_size: Average enemies per group.
+        :param executor: MeshMap chunk generation backend. 'inline' keeps streaming
+                         on the runner's thread, so every run streams the same way.
+        :param step: Simulated seconds per tick.
+        """
+        self.input_script = input_script if input_script is not None else circling_input()
+        # The settings a recording needs to be replayed on the same game.
+        self.settings = {
+            'seed': seed,
+            'chunk_width': chunk_width,
+            'render_distance': render_distance,
+            'map_seed': map_seed,
+            'scale': scale,
+            'spawn_rate': spawn_rate,
+            'group_spawn_size': group_spawn_size,
+            'step': step
+        }
+        start_placement = (0, 0, 0, 45)
+        self.mesh_map = MeshMap(
+            chunk_width=chunk_width,
+            render_distance=render_distance,
+            chunks_per_update=1,
+            seed=map_seed,
+            scale=scale,
+            height_limit=1000,
+            initial_target=(start_placement[0], start_placement[2]),
+            executor=executor,
+            headless=True
+        )
+        player = Player(
+            placement=start_placement,
+            max_speed=2,
+            max_acceleration=0.1,
+            friction_coefficient=0.7,
+            jump_power=0.7,
+            gravity=0.1,
+            max_fall_velocity=-1.5,
+            width=0.75,
+            max_attack_range=3.0,
+            attack_cooldown=1.0
+        )
+        enemy_manager = EnemyManager(
+            mesh_map=self.mesh_map,
+            spawn_radius=(render_distance * chunk_width),
+            spawn_rate=spawn_rate,
+            group_spawn_size=group_spawn_size,
+            seed=seed
+        )
+        self.simulation = Simulation(self.mesh_map, player, enemy_manager, step=step)
+        # Seconds spent outside the simulation step in each tick.
+        self.timings = {'input': 0.0, 'map': 0.0}
+
+    def tick(self):
+        """
+        Run one tick: read the script's keys, stream the map around the player
+        the way a frame would, and step the simulation. Each tick is a frame
+        of the module profiler.
+        """
+        simulation = self.simulation
+        profiler.begin_frame()
+        start = time.perf_counter()
+        keys = collections.defaultdict(bool, dict.fromkeys(self.input_script(simulation.steps), True))
+        input_done = time.perf_counter()
+        player_position = simulation.player.get_position()
+        self.mesh_map.update((player_position[0], player_position[2]), heading=player_position[3])
+        map_done = time.perf_counter()
+        simulation.step(keys)
+        self.timings['input'] += input_done - start
+        self.timings['map'] += map_done - input_done
+        profiler.end_frame()
+
+    @classmethod
+    def from_recording(cls, recording: InputRecording, executor: str = 'inline'):
+        """
+        :param recording: An InputRecording with the settings of the session it
+                          holds under metadata['settings'].
+        :param executor: MeshMap chunk generation backend.
+        :return: A runner set up like that session, ready for replay.
+        """
+        return cls(executor=executor, **recording.metadata.get('settings', {}))
+
+    def run(self, ticks: int) -> dict:
+        """
+        Run ticks ticks back to back.
+
+        :param ticks: Number of ticks.
+        :return: A report dict: 'ticks', 'seconds', 'ticks_per_second',
+                 'simulated_seconds', 'enemies', 'state_hash', and 'subsystems',
+                 the total and per tick milliseconds spent in each part of a tick.
+        """
+        start = time.perf_counter()
+        for _ in range(ticks):
+            self.tick()
+        return self.__report(ticks, time.perf_counter() - start)
+
+    def replay(self, recording: InputRecording) -> dict:
+        """
+        Play a recording back frame by frame the way main's loop ran it: each
+        frame's recorded time goes through a FixedTimestep, the steps it gives
+        run with the frame's keys, and the map streams around the player. Frames
+        run back to back, timed without the recorded waits.
+
+        :param recording: An InputRecording made with this runner's settings.
+        :return: The run report, plus 'frame_times', a frame_time_summary of how
+                 long each frame took here, 'recorded_state_hash', the state hash
+                 saved with the recording if any, and 'matches_recording'.
+        """
+        simulation = self.simulation
+        timestep = FixedTimestep(step=simulation.step_time, max_substeps=recording.metadata.get('max_substeps', 5))
+        frame_seconds = np.zeros(len(recording))
+        start = time.perf_counter()
+        for frame in range(len(recording)):
+            profiler.begin_frame()
+            frame_start = time.perf_counter()
+            keys = recording.get_keys(frame)
+            for _ in range(timestep.advance(recording.get_frame_time(frame))):
+                simulation.step(keys)
+            map_start = time.perf_counter()
+            player_position = simulation.player.get_interpolated_position(timestep.alpha)
+            self.mesh_map.update((player_position[0], player_position[2]), heading=player_position[3])
+            frame_end = time.perf_counter()
+            self.timings['map'] += frame_end - map_start
+            frame_seconds[frame] = frame_end - frame_start
+            profiler.end_frame()
+        report = self.__report(simulation.steps, time.perf_counter() - start)
+        report['frame_times'] = frame_time_summary(frame_seconds)
+        report['recorded_state_hash'] = recording.metadata.get('state_hash')
+        report['matches_recording'] = report['recorded_state_hash'] == report['state_hash']
+        return report
+
+    def __report(self, ticks: int, seconds: float) -> dict:
+        simulation = self.simulation
+        timings = dict(self.timings, **simulation.timings)
+        return {
+            'ticks': simulation.steps,
+            'seconds': seconds,
+            'ticks_per_second': ticks / seconds if seconds else float('inf'),
+            'simulated_seconds': simulation.get_simulated_time(),
+            'enemies': len(simulation.enemy_manager.enemies),
+            'state_hash': simulation.state_hash(),
+            'subsystems': {
+                name: {'total_ms': total * 1000, 'per_tick_ms': total * 1000 / max(simulation.steps, 1)}
+                for name, total in timings.items()
+            }
+        }
+
+    def cleanup(self):
+        """
+        Stop the map's chunk generation.
+        """
+        self.mesh_map.cleanup()
@@ -0,0 +1,110 @@
+import collections
+import json
+import struct
+import numpy as np
+from pygame.locals import K_a, K_d, K_LEFT, K_RIGHT, K_UP, K_DOWN, K_SPACE, K_m, K_q, K_e, K_w, K_s
+
+# Every key the game reads, in bit order of a recorded key mask.
+RECORDED_KEYS = (K_a, K_d, K_LEFT, K_RIGHT, K_UP, K_DOWN, K_SPACE, K_m, K_q, K_e, K_w, K_s)
+
+# File layout: magic, format version and metadata length, the metadata as JSON,
+# the frame count, then one (frame milliseconds, key mask) record per frame.
+_MAGIC = b'SWRP'
+_VERSION = 1
+_HEADER = struct.Struct('<4sHI')
+_COUNT = struct.Struct('<I')
+_FRAME = np.dtype([('frame_ms', '<u2'), ('keys', '<u2')])
+
+
+class InputRecording:
+    """
+    The keys held and the frame time of every frame of a play session, plus
+    the settings needed to play it again (enemy seed, simulation step, map and
+    spawn settings) as a metadata dict. Played back through a FixedTimestep,
+    the same frame times give the same simulation steps with the same keys, so
+    a session replays exactly. Frame times are whole milliseconds, as
+    pygame's Clock.tick gives them, and saved files take 4 bytes a frame.
+    """
+    def __init__(self, metadata: dict = None):
+        """
+        :param metadata: JSON serializable settings of the session.
+        """
+        self.metadata = dict(metadata or {})
+        self.__frame_ms = []
+        self.__key_masks = []
+
+    def __len__(self):
+        return len(self.__frame_ms)
+
+    def record(self, frame_ms: int, keys):
+        """
+        Add a frame.
+
+        :param frame_ms: Milliseconds the frame took, as from Clock.tick.
+        :param keys: Pressed keys, indexed by pygame key constant, as from pygame.key.get_pressed.
+        """
+        mask = 0
+        for bit, key in enumerate(RECORDED_KEYS):
+            if keys[key]:
+                mask |= 1 << bit
+        self.__frame_ms.append(min(int(frame_ms), 0xFFFF))
+        self.__key_masks.append(mask)
+
+    def get_frame_time(self, frame: int) -> float:
+        """
+        :return: Seconds the frame took, the same as the game computed from Clock.tick.
+        """
+        return self.__frame_ms[frame] / 1000.0
+
+    def get_frame_times(self) -> np.ndarray:
+        """
+        :return: Every frame's time in seconds.
+        """
+        return np.array(self.__frame_ms, dtype=np.float64) / 1000.0
+
+    def get_keys(self, frame: int):
+        """
+        :return: A mapping of pygame key constant to whether it was held on the frame.
+        """
+        mask = self.__key_masks[frame]
+        return collections.defaultdict(bool, {key: True for bit, key in enumerate(RECORDED_KEYS) if mask >> bit & 1})
+
+    def save(self, path: str):
+        """
+        Write the recording to path.
+        """
+        metadata = json.dumps(self.metadata, sort_keys=True).encode('utf-8')
+        frames = np.empty(len(self), dtype=_FRAME)
+        frames['frame_ms'] = self.__frame_ms
+        frames['keys'] = self.__key_masks
+        with open(path, 'wb') as file:
+            file.write(_HEADER.pack(_MAGIC, _VERSION, len(metadata)))
+            file.write(metadata)
+            file.write(_COUNT.pack(len(frames)))
+            file.write(frames.tobytes())
+
+    @classmethod
+    def load(cls, path: str):
+        """
+        Read a recording written by save.
+
+        :param path: Recording file.
+        :return: The InputRecording.
+        """
+        with open(path, 'rb') as file:
+            data = file.read()
+        magic, version, metadata_length = _HEADER.unpack_from(data)
+        if magic != _MAGIC:
+            raise ValueError(f"{path} is not an input recording")
+        if version != _VERSION:
+            raise ValueError(f"{path} is recording format {version}; only {_VERSION} is supported")
+        offset = _HEADER.size
+        metadata = json.loads(data[offset:offset + metadata_length].decode('utf-8'))
+        offset += metadata_length
+        (count,) = _COUNT.unpack_from(data, offset)
+        offset += _COUNT.size
+        frames = np.frombuffer(data, dtype=_FRAME, count=count, offset=offset)
+        recording = cls(metadata)
+        recording.__frame_ms = frames['frame_ms'].astype(np.int64).tolist()
+        recording.__key_masks = frames['keys'].astype(np.int64).tolist()
+        return recording
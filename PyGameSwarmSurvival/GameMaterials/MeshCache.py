@@ -0,0 +1,164 @@
+from OpenGL.GL import *
+import numpy as np
+import math
+
+
+def cone_mesh(slices: int, stacks: int):
+    """
+    Same surface gluCylinder draws with a base radius of 1, a top radius of 0
+    and a height of 1: rings around the z axis from z = 0 to the tip at z = 1,
+    open at the base.
+
+    :param slices: Subdivisions around the z axis.
+    :param stacks: Subdivisions along the z axis.
+    :return: A tuple (vertices, indices): an (n, 3) float32 array and a uint32
+             array of triangle corners.
+    """
+    z = np.linspace(0, 1, stacks + 1, dtype=np.float32)
+    return _ring_mesh(1 - z, z, slices)
+
+
+def sphere_mesh(slices: int, stacks: int):
+    """
+    Same surface gluSphere draws with a radius of 1: rings around the z axis
+    from the pole at z = -1 to the pole at z = 1.
+
+    :param slices: Subdivisions around the z axis.
+    :param stacks: Subdivisions along the z axis.
+    :return: A tuple (vertices, indices): an (n, 3) float32 array and a uint32
+             array of triangle corners.
+    """
+    polar = np.linspace(math.pi, 0, stacks + 1, dtype=np.float32)
+    return _ring_mesh(np.sin(polar), np.cos(polar), slices)
+
+
+def _ring_mesh(radii: np.ndarray, heights: np.ndarray, slices: int):
+    """
+    Join rings of the given radii, at the given heights along z, with
+    triangles. Each ring has slices + 1 vertices so the seam closes.
+    """
+    angles = np.linspace(0, 2 * math.pi, slices + 1, dtype=np.float32)
+    vertices = np.empty((len(radii), slices + 1, 3), dtype=np.float32)
+    # gluCylinder and gluSphere put the first slice on +y.
+    vertices[:, :, 0] = radii[:, None] * np.sin(angles)
+    vertices[:, :, 1] = radii[:, None] * np.cos(angles)
+    vertices[:, :, 2] = heights[:, None]
+
+    ring = np.arange(len(radii) - 1, dtype=np.uint32)[:, None] * (slices + 1)
+    lower = (ring + np.arange(slices, dtype=np.uint32)).ravel()
+    upper = lower + slices + 1
+    indices = np.stack((lower, lower + 1, upper + 1, lower, upper + 1, upper), axis=1)
+    return vertices.reshape(-1, 3), indices.ravel()
+
+
+# The shapes a MeshCache can build, by name.
+MESH_SHAPES = {
+    'cone': cone_mesh,
+    'sphere': sphere_mesh
+}
+
+
+class MeshCache:
+    """
+    Builds unit model meshes (a cone or a sphere of radius 1) into VBOs once
+    and draws them from there, so models are placed with glTranslatef,
+    glRotatef and glScalef alone instead of being tessellated again every
+    frame. Meshes far from the camera use fewer slices and stacks: each LOD
+    distance passed halves both, the same way MeshMap halves chunk detail.
+    """
+    def __init__(self, lod_distances: tuple = (30.0, 60.0), min_slices: int = 6, min_stacks: int = 2):
+        """
+        No GL calls are made until a mesh is first drawn.
+
+        :param lod_distances: Ascending camera distances at which the detail of
+                              a mesh is halved again.
+        :param min_slices: Fewest slices a mesh is reduced to.
+        :param min_stacks: Fewest stacks a mesh is reduced to.
+        """
+        self.lod_distances = lod_distances
+        self.min_slices = min_slices
+        self.min_stacks = min_stacks
+        # Mesh records, keyed by (shape, slices, stacks).
+        self.__meshes = {}
+
+    def get_detail(self, slices: int, stacks: int, distance: float = None):
+        """
+        :param slices: Subdivisions around the axis at full detail.
+        :param stacks: Subdivisions along the axis at full detail.
+        :param distance: Distance from the camera; None for full detail.
+        :return: A tuple (slices, stacks) to draw a mesh with at that distance.
+        """
+        if distance is None:
+            return slices, stacks
+        lod_step = 2 ** sum(distance >= lod_distance for lod_distance in self.lod_distances)
+        return (max(min(slices, self.min_slices), slices // lod_step),
+                max(min(stacks, self.min_stacks), stacks // lod_step))
+
+    def __build(self, key):
+        shape, slices, stacks = key
+        vertices, indices = MESH_SHAPES[shape](slices, stacks)
+        vbo, ibo = glGenBuffers(2)
+        glBindBuffer(GL_ARRAY_BUFFER, vbo)
+        glBufferData(GL_ARRAY_BUFFER, vertices.nbytes, vertices, GL_STATIC_DRAW)
+        glBindBuffer(GL_ARRAY_BUFFER, 0)
+        glBindBuffer(GL_ELEMENT_ARRAY_BUFFER, ibo)
+        glBufferData(GL_ELEMENT_ARRAY_BUFFER, indices.nbytes, indices, GL_STATIC_DRAW)
+        glBindBuffer(GL_ELEMENT_ARRAY_BUFFER, 0)
+        mesh = {
+            'vbo': vbo,
+            'ibo': ibo,
+            'vertex_count': len(vertices),
+            'index_count': len(indices)
+        }
+        self.__meshes[key] = mesh
+        return mesh
+
+    def get_mesh(self, shape: str, slices: int, stacks: int) -> dict:
+        """
+        Get a mesh record, building and uploading the mesh the first time it is
+        asked for. This must run on the main thread.
+
+        :param shape: A key of MESH_SHAPES.
+        :param slices: Subdivisions around the axis.
+        :param stacks: Subdivisions along the axis.
+        :return: A dict with the mesh's 'vbo', 'ibo', 'vertex_count' and 'index_count'.
+        """
+        key = (shape, slices, stacks)
+        mesh = self.__meshes.get(key)
+        if mesh is None:
+            mesh = self.__build(key)
+        return mesh
+
+    def draw(self, shape: str, slices: int, stacks: int, distance: float = None):
+        """
+        Draw a unit mesh with the current matrix and color. This must run on the
+        main thread.
+
+        :param shape: A key of MESH_SHAPES.
+        :param slices: Subdivisions around the axis at full detail.
+        :param stacks: Subdivisions along the axis at full detail.
+        :param distance: Distance from the camera, to pick the detail; None for full detail.
+        """
+        mesh = self.get_mesh(shape, *self.get_detail(slices, stacks, distance))
+        glBindBuffer(GL_ARRAY_BUFFER, mesh['vbo'])
+        glEnableClientState(GL_VERTEX_ARRAY)
+        glVertexPointer(3, GL_FLOAT, 0, None)
+        glBindBuffer(GL_ELEMENT_ARRAY_BUFFER, mesh['ibo'])
+        glDrawElements(GL_TRIANGLES, mesh['index_count'], GL_UNSIGNED_INT, None)
+        glDisableClientState(GL_VERTEX_ARRAY)
+        glBindBuffer(GL_ELEMENT_ARRAY_BUFFER, 0)
+        glBindBuffer(GL_ARRAY_BUFFER, 0)
+
+    def get_mesh_count(self) -> int:
+        """
+        :return: The number of meshes built so far.
+        """
+        return len(self.__meshes)
+
+    def delete(self):
+        """
+        Delete every mesh's buffers.
+        """
+        for mesh in self.__meshes.values():
+            glDeleteBuffers(2, [mesh['vbo'], mesh['ibo']])
+        self.__meshes.clear()
@@ -3,25 +3,162 @@
 
 
 import numpy as np
-import pygame
 from OpenGL.GL import *
 import noise
 import concurrent.futures
+import collections
+import functools
 import math
 import ctypes
-import colorsys
+import os
+import struct
+import heapq
+import time
+import types
+import warnings
+from multiprocessing import resource_tracker, shared_memory
+import ChunkGenerator
+from ChunkCache import ChunkCache
+from Frustum import Frustum
+from VertexArena import VertexArena
+from VBOPool import VBOPool
+from Profiler import profiled
+
+# Chunk generation backends selectable with MeshMap(executor=...).
+EXECUTOR_BACKENDS = ('threads', 'processes', 'inline')
+# Chunk mesh formats selectable with MeshMap(mesh_format=...).
+# 'triangles': non-indexed float32 [x, y, z, r, g, b] vertices (24 bytes each).
+# 'indexed': deduplicated int16 positions and uint8 colors drawn through an index buffer.
+MESH_FORMATS = ('triangles', 'indexed')
+# Ways of submitting chunks to OpenGL selectable with MeshMap(draw_mode=...).
+# 'per_chunk': set up and tear down client state around every chunk.
+# 'batched': set up client state once per frame, then bind and draw each chunk.
+#            Indexed chunks still need their own transform, buffers and pointers each.
+# 'arena': pack chunks into a few shared VBOs and draw each with one glMultiDrawArrays
+#          (triangles format only), so the GL call count does not grow with the chunk count.
+#          The default for the triangles format.
+DRAW_MODES = ('per_chunk', 'batched', 'arena')
+# For rounding single heights to float32 without going through numpy.
+_FLOAT32 = struct.Struct('f')
+
+
+def _noise_tile_height(seed: int, scale: float, height_limit: int, tile_x: int, tile_z: int) -> float:
+    """
+    Height of a tile computed from noise, rounded to float32 like the chunk
+    height grids so both agree. noise.pnoise2's arguments are passed by
+    position, which halves the cost of the call.
+    """
+    base_noise = noise.pnoise2(tile_x * scale, tile_z * scale, 4, 0.5, 2.0, 1024, 1024, seed)
+    # Normalize noise to [0, 1] then scale to height_limit.
+    normalized_noise = (base_noise + 1) / 2
+    return _FLOAT32.unpack(_FLOAT32.pack((normalized_noise ** 5) * height_limit))[0]
+
+
+class _InlineExecutor(concurrent.futures.Executor):
+    """
+    Executor that runs each task immediately on the calling thread.
+    Useful for debugging and profiling chunk generation without any pool.
+    """
+    def submit(self, fn, /, *args, **kwargs):
+        future = concurrent.futures.Future()
+        try:
+            future.set_result(fn(*args, **kwargs))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
+
+class _HeadlessVBOPool:
+    """
+    Stands in for VBOPool when there is no OpenGL context: chunk data is
+    measured as if it had been uploaded but no buffers are created.
+    """
+    created = 0
+    reused = 0
+
+    def acquire(self, data: np.ndarray, target=GL_ARRAY_BUFFER):
+        return None, data.nbytes
+
+    def reserve(self, nbytes: int):
+        return None, nbytes
+
+    def write(self, buffer, offset: int, data: np.ndarray, target=GL_ARRAY_BUFFER):
+        pass
+
+    def release(self, buffer, capacity: int):
+        pass
+
+    def free_bytes(self) -> int:
+        return 0
+
+    def trim(self, max_bytes: int):
+        pass
+
+    def delete(self):
+        pass
+
 
 class MeshMap:
-    def __init__(self, chunk_width: int, render_distance: int, chunks_per_update: int, seed: int, scale: float, height_limit: int, initial_target: tuple = None):
+    def __init__(self, chunk_width: int, render_distance: int, chunks_per_update: int, seed: int, scale: float, height_limit: int, initial_target: tuple = None,
+                 executor: str = 'threads', workers: int = None, cache: ChunkCache = None,
+                 evict_distance: int = None, host_budget_bytes: int = None, gpu_budget_bytes: int = None,
+                 mesh_format: str = 'triangles', greedy: bool = False, lod_distances: tuple = None,
+                 draw_mode: str = None, arena_vertices: int = 1 << 20, tile_height_cache_size: int = 4096,
+                 max_pending_chunks: int = None, heading_bias: float = 0.5,
+                 upload_budget_ms: float = 4.0, upload_piece_bytes: int = 1 << 16, vbo_pool_size: int = 64,
+                 headless: bool = False):
         """
         Initialize the MeshMap.
 
         :param chunk_width: Number of tiles per chunk side.
         :param render_distance: Number of chunks to render in each direction from the target.
-        :param chunks_per_update: Maximum number of chunks to complete (and create VBOs for) per update.
+        :param chunks_per_update: Maximum number of finished chunks to create VBOs for per update.
         :param seed: Seed for the noise generator.
         :param scale: Scale for noise generation.
         :param height_limit: Maximum height of the generated terrain.
+        :param executor: Chunk generation backend: 'threads', 'processes' or 'inline'.
+        :param workers: Number of generation workers (defaults to the CPU count). Ignored for 'inline'.
+        :param cache: Optional ChunkCache to load chunks from and save newly generated chunks to.
+        :param evict_distance: Chunks further than this many chunks from the target are evicted.
+                               Defaults to just outside the initial preload area, so chunks are
+                               loaded at render_distance but only dropped well past it.
+        :param host_budget_bytes: Optional cap on host memory held by resident chunks.
+        :param gpu_budget_bytes: Optional cap on VBO memory: the full capacity of resident chunks' buffers
+                                 plus the free buffers the VBO pool keeps. Free buffers are deleted first,
+                                 then least recently needed chunks outside the render distance are evicted.
+        :param mesh_format: How chunk meshes are stored on the GPU: 'triangles' or 'indexed'.
+        :param greedy: Merge neighboring faces of equal height into larger quads when meshing chunks.
+                       The noise terrain has almost no equal neighboring heights, so this saves no
+                       triangles on it while meshing takes 1.2-1.8x longer (bench_greedy_mesh); it only
+                       pays off on terrain with flat regions, e.g. about 95% fewer triangles with
+                       heights terraced to multiples of 25.
+        :param lod_distances: Optional increasing chunk distances from the target, e.g. (8, 16, 24).
+                              Chunks further away than the first are built from every 2nd tile,
+                              further than the second from every 4th tile, and so on.
+                              chunk_width must be divisible by the coarsest step.
+        :param draw_mode: How chunks are submitted to OpenGL: 'per_chunk', 'batched' or 'arena'.
+                          Defaults to 'arena' for the triangles format and 'batched' for the
+                          indexed one, which arenas cannot hold.
+        :param arena_vertices: Number of vertices each shared VBO holds in 'arena' draw mode.
+        :param tile_height_cache_size: Most tile heights outside resident chunks get_tile_height
+                                       remembers, least recently used dropped first. 0 for none.
+        :param max_pending_chunks: Most chunks handed to the executor at once; the rest wait in
+                                   the priority queue. Defaults to twice the larger of the
+                                   worker count and chunks_per_update (chunks_per_update for 'inline').
+        :param heading_bias: How strongly update's heading favors chunks ahead of the target,
+                             from 0 (distance only) to 1.
+        :param upload_budget_ms: Milliseconds per update to spend uploading finished chunks.
+                                 At least one piece is uploaded per update if any chunk is ready,
+                                 and no more than chunks_per_update chunks are started. None for
+                                 no time limit.
+        :param upload_piece_bytes: Most bytes of a chunk's data update writes with one glBufferSubData
+                                   call. Larger chunks are uploaded a piece at a time, over several
+                                   updates if the budget runs out, and only drawn once complete.
+                                   None to upload every chunk whole.
+        :param vbo_pool_size: Most buffers of evicted chunks kept for reuse by new chunks.
+        :param headless: Generate and keep chunk data without making any OpenGL calls, so the
+                         map runs without a display (render then only culls, whatever the
+                         draw mode).
         """
         self.__chunk_width = chunk_width
         self.__render_distance = render_distance
@@ -29,13 +166,107 @@ class MeshMap:
         self.__seed = seed
         self.__scale = scale
         self.__height_limit = height_limit
+        self.__cache = cache
+        if mesh_format not in MESH_FORMATS:
+            raise ValueError(f"Unknown mesh format {mesh_format!r}, expected one of {MESH_FORMATS}")
+        self.__mesh_format = mesh_format
+        if draw_mode is None:
+            draw_mode = 'arena' if mesh_format == 'triangles' else 'batched'
+        if draw_mode not in DRAW_MODES:
+            raise ValueError(f"Unknown draw mode {draw_mode!r}, expected one of {DRAW_MODES}")
+        if draw_mode == 'arena' and mesh_format != 'triangles':
+            raise ValueError("The 'arena' draw mode needs the 'triangles' mesh format")
+        if draw_mode == 'batched' and mesh_format == 'indexed' and not headless:
+            warnings.warn("The 'indexed' mesh format needs a transform and buffers of its own for every chunk, so "
+                          "it is drawn with about twice the GL calls of the triangles format in 'batched' mode and "
+                          "many more than in 'arena' mode. Prefer the triangles format unless VBO memory runs out.",
+                          stacklevel=2)
+        self.__headless = headless
+        self.__draw_mode = draw_mode
+        self.__arena_vertices = arena_vertices
+        # Shared VBOs chunks are packed into in 'arena' draw mode.
+        self.__arenas = []
+        self.__greedy = greedy
+        self.__lod_distances = tuple(lod_distances or ())
+        if list(self.__lod_distances) != sorted(self.__lod_distances):
+            raise ValueError(f"LOD distances must be increasing, got {self.__lod_distances}")
+        if chunk_width % (2 ** len(self.__lod_distances)):
+            raise ValueError(f"Chunk width {chunk_width} is not divisible by the coarsest LOD step {2 ** len(self.__lod_distances)}")
 
         # Dictionary to store generated chunks. Each key is a (chunk_x, chunk_z) tuple.
-        self.__chunks = {}
+        # Ordered from least to most recently needed, for budget eviction.
+        self.__chunks = collections.OrderedDict()
+        # Eviction settings and memory counters.
+        self.__evict_distance = evict_distance if evict_distance is not None else render_distance * 2 + 2
+        self.__host_budget_bytes = host_budget_bytes
+        self.__gpu_budget_bytes = gpu_budget_bytes
+        self.__host_bytes = 0
+        self.__gpu_bytes = 0
+        self.__distance_evictions = 0
+        self.__budget_evictions = 0
+        # Heights get_tile_height computes from noise for (tile_x, tile_z). The C lru_cache
+        # adds about 0.5 us to a miss and answers a hit in about 0.2 us, against 1.5 us of noise.
+        self.__noise_tile_height = functools.lru_cache(maxsize=tile_height_cache_size)(
+            functools.partial(_noise_tile_height, seed, scale, height_limit))
+        # Sorted keys and stacked height grids of the resident full detail chunks, for
+        # get_tile_heights. None when chunks have changed since it was built.
+        self.__height_index = None
+        # Drawn and culled chunk counts from the last render.
+        self.__render_stats = {'drawn_chunks': 0, 'frustum_culled': 0, 'distance_culled': 0}
+        # Chunk the target was in at the last update, and the chunks required around it.
+        self.__current_chunk = None
+        self.__required_chunks = set()
+        # Scheduling state from the last time the required set was rebuilt: the LOD step
+        # and priority of each required chunk, the heading sector, and a heap of
+        # (priority, coord) for required chunks not yet handed to the executor.
+        self.__required_lods = {}
+        self.__priorities = {}
+        self.__heading_sector = None
+        self.__queue = []
+        self.__heading_bias = heading_bias
+        # When each chunk still on its way was first requested, for time-to-visible metrics.
+        self.__request_times = {}
+        self.__recent_times_to_visible = collections.deque(maxlen=1000)
+        self.__cancelled_chunks = 0
+        # Buffers are reused between chunks instead of created and deleted per chunk.
+        self.__vbo_pool = _HeadlessVBOPool() if headless else VBOPool(max_free=vbo_pool_size)
+        # Finished chunk data waiting to be uploaded, keyed by coord.
+        self.__staged_chunks = {}
+        self.__upload_budget_ms = upload_budget_ms
+        self.__upload_piece_bytes = upload_piece_bytes
+        # The chunk being uploaded a piece at a time, from __begin_upload, or None.
+        self.__upload = None
+        # Running estimate of upload seconds per byte of vertex data, for fitting
+        # uploads into the budget, and (bytes, seconds) uploaded in recent updates.
+        self.__upload_seconds_per_byte = None
+        self.__recent_uploads = collections.deque(maxlen=1000)
         # Dictionary to store futures for chunks currently being generated.
         self.__chunk_futures = {}
-        # Thread pool executor for async chunk data generation.
-        self.__executor = concurrent.futures.ThreadPoolExecutor(max_workers=chunks_per_update)
+        # Executor for async chunk data generation.
+        if executor not in EXECUTOR_BACKENDS:
+            raise ValueError(f"Unknown executor backend {executor!r}, expected one of {EXECUTOR_BACKENDS}")
+        self.__executor_backend = executor
+        if workers is None:
+            workers = os.cpu_count() or 1
+        if max_pending_chunks is None:
+            max_pending_chunks = chunks_per_update if executor == 'inline' else max(workers, chunks_per_update) * 2
+        self.__max_pending_chunks = max_pending_chunks
+        if executor == 'processes':
+            if os.name == 'posix':
+                # Start the resource tracker before the workers so they share it
+                # and blocks they attach to stay owned by this process.
+                resource_tracker.ensure_running()
+            self.__executor = concurrent.futures.ProcessPoolExecutor(max_workers=workers)
+            # Shared memory blocks workers write chunk data into (with the LOD step
+            # of the chunk), keyed by future, plus spares for reuse.
+            self.__future_blocks = {}
+            self.__free_blocks = []
+        elif executor == 'threads':
+            self.__executor = concurrent.futures.ThreadPoolExecutor(max_workers=workers)
+        else:
+            self.__executor = _InlineExecutor()
+        # Futures that were answered straight from the cache.
+        self.__cached_futures = set()
 
         if initial_target is not None:
             self.__preload_initial(initial_target)
@@ -60,253 +291,1015 @@ class MeshMap:
         # Schedule tasks for any required chunk not yet generated.
         for coord in required_chunks:
             if coord not in self.__chunks and coord not in self.__chunk_futures:
-                self.__chunk_futures[coord] = self.__executor.submit(
-                    self.__generate_chunk_data, coord[0], coord[1]
-                )
+                lod_step = self.__lod_step(coord[0] - current_chunk_x, coord[1] - current_chunk_z)
+                self.__chunk_futures[coord] = self.__submit_chunk(coord, lod_step)
         # Wait for all tasks to complete.
         concurrent.futures.wait(list(self.__chunk_futures.values()))
         # Process all completed futures without breaking.
         for coord, future in list(self.__chunk_futures.items()):
             try:
-                vertex_array, vertex_count = future.result()
-                vbo = self.__create_vbo(vertex_array)
-                self.__chunks[coord] = {
-                    'vertices': vertex_array,
-                    'vbo': vbo,
-                    'vertex_count': vertex_count
-                }
+                self.__store_chunk(coord, *self.__chunk_result(coord, future))
             except Exception as e:
                 print(f"Error preloading chunk {coord}: {e}")
             del self.__chunk_futures[coord]
     
-    def __generate_chunk_data(self, chunk_x: int, chunk_z: int):
+    def __lod_step(self, dx: int, dz: int) -> int:
+        """
+        :param dx: Chunk offset from the target's chunk in x.
+        :param dz: Chunk offset from the target's chunk in z.
+        :return: The tile step to build a chunk at that offset with (1 is full detail).
+        """
+        distance = max(abs(dx), abs(dz))
+        lod_step = 1
+        for lod_distance in self.__lod_distances:
+            if distance > lod_distance:
+                lod_step *= 2
+        return lod_step
+
+    def __chunk_lod_step(self, heights: np.ndarray) -> int:
         """
-        Generate the vertex data for a chunk (without creating the VBO).
-        The data is interleaved as [x, y, z, r, g, b] per vertex.
-        In addition to the top faces of each tile, vertical walls are generated
-        to connect a tile's top to its lower neighbor.
-        This function is executed asynchronously.
+        :param heights: A chunk's height grid.
+        :return: The tile step the chunk was built with, from the size of its grid.
+        """
+        return self.__chunk_width // (heights.shape[0] - 2)
+
+    def __cache_key(self, coord: tuple, lod_step: int):
+        return (self.__seed, self.__scale, self.__height_limit, self.__chunk_width, self.__greedy, lod_step, coord[0], coord[1])
+
+    def __submit_chunk(self, coord: tuple, lod_step: int = 1):
+        """
+        Queue async generation of a chunk's data on the selected backend,
+        or answer it right away from the cache if it is there.
+        Only the chunk coordinates and terrain parameters are sent to the worker.
+        With the process backend the worker writes the chunk data into a
+        shared memory block owned by this MeshMap rather than pickling it back.
         
-        :param chunk_x: Chunk coordinate in x.
-        :param chunk_z: Chunk coordinate in z.
-        :return: A tuple (vertex_array, vertex_count)
+        :param coord: A (chunk_x, chunk_z) tuple.
+        :param lod_step: Tile step to build the chunk with (1 is full detail).
+        :return: A future for the chunk data.
         """
-        grid_size = self.__chunk_width + 2
-        heights = np.zeros((grid_size, grid_size), dtype=np.float32)
+        if self.__cache is not None:
+            cached = self.__cache.get(self.__cache_key(coord, lod_step))
+            if cached is not None:
+                future = concurrent.futures.Future()
+                future.set_result(cached)
+                self.__cached_futures.add(future)
+                return future
+
+        args = (coord[0], coord[1], self.__seed, self.__scale, self.__height_limit, self.__chunk_width, self.__greedy, lod_step)
+        if self.__executor_backend != 'processes':
+            return self.__executor.submit(ChunkGenerator.generate_chunk_data, *args)
+
+        if self.__free_blocks:
+            block = self.__free_blocks.pop()
+        else:
+            block = shared_memory.SharedMemory(create=True, size=ChunkGenerator.max_chunk_floats(self.__chunk_width) * 4)
+        future = self.__executor.submit(ChunkGenerator.generate_chunk_shared, *args, block.name)
+        self.__future_blocks[future] = (block, lod_step)
+        return future
+
+    def __chunk_result(self, coord: tuple, future):
+        """
+        Get the data from a finished chunk future, saving newly generated chunks to the cache.
         
-        # Compute heights for grid cells.
-        # The tile at index [1,1] corresponds to the first tile in the chunk.
-        start_x = chunk_x * self.__chunk_width
-        start_z = chunk_z * self.__chunk_width
+        :param coord: The (chunk_x, chunk_z) the future was submitted for.
+        :param future: A future from __submit_chunk.
+        :return: A tuple (heights, vertex_array, vertex_count)
+        """
+        if future in self.__cached_futures:
+            self.__cached_futures.discard(future)
+            return future.result()
+
+        if self.__executor_backend == 'processes':
+            block, lod_step = self.__future_blocks.pop(future)
+            try:
+                vertex_count = future.result()
+                packed_floats = (self.__chunk_width // lod_step + 2) ** 2 + vertex_count * 6
+                packed = np.ndarray((packed_floats,), dtype=np.float32, buffer=block.buf).copy()
+            finally:
+                self.__free_blocks.append(block)
+            result = ChunkGenerator.unpack_chunk(packed, self.__chunk_width // lod_step)
+        else:
+            result = future.result()
+
+        if self.__cache is not None:
+            self.__cache.put(self.__cache_key(coord, self.__chunk_lod_step(result[0])), result[0], result[1])
+        return result
+
+    def __release_chunk_future(self, future):
+        """
+        Drop a chunk future whose result will never be collected.
+        With the process backend its shared memory block is recycled if the
+        task never started, or freed once the worker is done with it.
         
-        for i in range(grid_size):
-            for j in range(grid_size):
-                # Compute world coordinates
-                world_x = start_x + (i - 1)
-                world_z = start_z + (j - 1)
-                heights[i, j] = self.get_tile_height((world_x, world_z))
-
-        vertices = []  # Holds vertex (x,y,z) and color (r,g,b)
-
-        # Loop over each actual tile in the chunk.
-        for i in range(1, self.__chunk_width+1):
-            for j in range(1, self.__chunk_width+1):
-                tile_height = heights[i, j]
-                # World position of the tile's bottom-left corner.
-                world_x = start_x + (i - 1)
-                world_z = start_z + (j - 1)
-                # Get top-face color.
-                top_color = self.__get_color(tile_height)
-                
-                # Top face triangles
-                p1 = (world_x,       tile_height, world_z)
-                p2 = (world_x + 1,   tile_height, world_z)
-                p3 = (world_x + 1,   tile_height, world_z + 1)
-                p4 = (world_x,       tile_height, world_z + 1)
-                # Triangle 1: p1, p2, p3
-                vertices.extend(p1 + top_color)
-                vertices.extend(p2 + top_color)
-                vertices.extend(p3 + top_color)
-                # Triangle 2: p1, p3, p4
-                vertices.extend(p1 + top_color)
-                vertices.extend(p3 + top_color)
-                vertices.extend(p4 + top_color)
-
-                # For each of the four sides, check the neighbor height.
-                # Generate a wall if tile is higher than neighbor.
-                # Define neighbor offsets and corresponding edge vertex positions.
-                # (di, dj, (local top edge start), (local top edge end))
-                # Local coordinates: (0,0) is bottom-left of the tile; (1,1) is top-right.
-                sides = [
-                    (0, 1,  ((0, 1), (1, 1))),  # North edge: top edge (p4 to p3)
-                    (0, -1, ((0, 0), (1, 0))),  # South edge: bottom edge (p1 to p2)
-                    (1, 0,  ((1, 0), (1, 1))),  # East edge: right edge (p2 to p3)
-                    (-1, 0, ((0, 0), (0, 1)))   # West edge: left edge (p1 to p4)
-                ]
-                for di, dj, ((lx0, lz0), (lx1, lz1)) in sides:
-                    neighbor_height = heights[i + di, j + dj]
-                    # Only create a wall if there's a gap.
-                    if tile_height > neighbor_height:
-                        # For wall color, darken the tile's top color.
-                        wall_color = tuple(c * 0.7 for c in top_color)
-                        # Compute the two top edge vertices in world space.
-                        # For a tile, local x and z positions: add to world_x and world_z.
-                        top_edge_start = (world_x + lx0, tile_height, world_z + lz0)
-                        top_edge_end   = (world_x + lx1, tile_height, world_z + lz1)
-                        # The bottom edge corresponds to the neighbor's height.
-                        bottom_edge_start = (world_x + lx0, neighbor_height, world_z + lz0)
-                        bottom_edge_end   = (world_x + lx1, neighbor_height, world_z + lz1)
-                        # Create two triangles for the vertical quad.
-                        # Triangle 1: top_edge_start, bottom_edge_start, bottom_edge_end
-                        vertices.extend(top_edge_start + wall_color)
-                        vertices.extend(bottom_edge_start + wall_color)
-                        vertices.extend(bottom_edge_end + wall_color)
-                        # Triangle 2: top_edge_start, bottom_edge_end, top_edge_end
-                        vertices.extend(top_edge_start + wall_color)
-                        vertices.extend(bottom_edge_end + wall_color)
-                        vertices.extend(top_edge_end + wall_color)
-
-        vertex_array = np.array(vertices, dtype=np.float32)
-        vertex_count = len(vertex_array) // 6  # 6 floats per vertex.
-        return vertex_array, vertex_count
-
-    def __create_vbo(self, vertices: np.ndarray):
-        """
-        Create an OpenGL VBO from vertex data.
+        :param future: A future from __submit_chunk.
+        """
+        cancelled = future.cancel()
+        self.__cached_futures.discard(future)
+        if self.__executor_backend != 'processes' or future not in self.__future_blocks:
+            return
+        block, _ = self.__future_blocks.pop(future)
+        if cancelled:
+            self.__free_blocks.append(block)
+        else:
+            future.add_done_callback(lambda _: (block.close(), block.unlink()))
+
+    def __arena_reserve(self, vertex_count: int):
+        """
+        Find room for a chunk's vertices in the first arena with room, creating
+        a new arena if none has any.
         This must run on the main thread.
         
-        :param vertices: A numpy array of interleaved vertex and color data.
-        :return: The VBO id.
+        :return: A tuple (arena, first_vertex)
         """
-        vbo = glGenBuffers(1)
-        glBindBuffer(GL_ARRAY_BUFFER, vbo)
-        glBufferData(GL_ARRAY_BUFFER, vertices.nbytes, vertices, GL_STATIC_DRAW)
-        glBindBuffer(GL_ARRAY_BUFFER, 0)
-        return vbo
+        for arena in self.__arenas:
+            first = arena.reserve(vertex_count)
+            if first is not None:
+                return arena, first
+        arena = VertexArena(max(self.__arena_vertices, vertex_count), 6 * 4)
+        self.__arenas.append(arena)
+        return arena, arena.reserve(vertex_count)
 
-    def __get_color(self, height: float):
+    def __store_chunk(self, coord: tuple, heights: np.ndarray, vertex_array: np.ndarray, vertex_count: int):
         """
-        Determine a color based on the height value.
+        Upload a finished chunk whole and make it resident.
+        This must run on the main thread.
         
-        :param height: The y value or height.
-        :return: A tuple (r, g, b) with values in the range [0, 1].
+        :param coord: A (chunk_x, chunk_z) tuple.
         """
-        normalized = height / self.__height_limit
-        r, g, b = colorsys.hsv_to_rgb(normalized, 1, 1)
-        return (r, g, b)
-     
-    def update(self, target):
+        upload = self.__begin_upload(coord, heights, vertex_array, vertex_count)
+        self.__upload_piece(upload, math.inf)
+        self.__finish_upload(upload)
+
+    def __begin_upload(self, coord: tuple, heights: np.ndarray, vertex_array: np.ndarray, vertex_count: int) -> dict:
+        """
+        Reserve buffer space for a finished chunk and build its chunk record.
+        The data is written by __upload_piece, whole or over several updates,
+        and the chunk is made resident by __finish_upload. Only a compact copy
+        of the height grid is kept once the vertex data is in the VBO.
+        This must run on the main thread.
+        
+        :param coord: A (chunk_x, chunk_z) tuple.
+        :return: The upload's state: the chunk record and the (write, bytes) still to write.
+        """
+        heights = np.array(heights, dtype=np.float32)
+        lod_step = self.__chunk_lod_step(heights)
+        # Vertical extent of the mesh (walls and skirts included), for culling.
+        vertex_heights = vertex_array[1::6]
+        min_height = float(vertex_heights.min())
+        max_height = float(vertex_heights.max())
+        if self.__mesh_format == 'indexed':
+            start_x = coord[0] * self.__chunk_width
+            start_z = coord[1] * self.__chunk_width
+            mesh = ChunkGenerator.build_indexed_mesh(vertex_array, start_x, start_z)
+            # Positions then colors, one after the other in the same VBO.
+            vertex_data = np.concatenate((mesh['positions'].view(np.uint8).ravel(), mesh['colors'].ravel()))
+            vbo, vbo_capacity = self.__vbo_pool.reserve(vertex_data.nbytes)
+            ibo, ibo_capacity = self.__vbo_pool.reserve(mesh['indices'].nbytes)
+            writes = [(lambda offset, data, vbo=vbo: self.__vbo_pool.write(vbo, offset, data), vertex_data),
+                      (lambda offset, data, ibo=ibo: self.__vbo_pool.write(ibo, offset, data, GL_ELEMENT_ARRAY_BUFFER), mesh['indices'])]
+            chunk = {
+                'heights': heights,
+                'vbo': vbo,
+                'vbo_capacity': vbo_capacity,
+                'ibo': ibo,
+                'ibo_capacity': ibo_capacity,
+                'vbo_bytes': vertex_data.nbytes + mesh['indices'].nbytes,
+                'gpu_bytes': vbo_capacity + ibo_capacity,
+                'color_offset': mesh['positions'].nbytes,
+                'index_count': len(mesh['indices']),
+                'index_type': GL_UNSIGNED_SHORT if mesh['indices'].dtype == np.uint16 else GL_UNSIGNED_INT,
+                'origin': (start_x, mesh['y_offset'], start_z),
+                'y_step': mesh['y_step'],
+                'vertex_count': vertex_count,
+                'lod_step': lod_step,
+                'min_height': min_height,
+                'max_height': max_height
+            }
+        elif self.__draw_mode == 'arena' and not self.__headless:
+            arena, first = self.__arena_reserve(vertex_count)
+            base = first * arena.vertex_bytes
+            writes = [(lambda offset, data: arena.write(base + offset, data), vertex_array)]
+            chunk = {
+                'heights': heights,
+                'arena': arena,
+                'first': first,
+                'vbo_bytes': vertex_array.nbytes,
+                'gpu_bytes': vertex_array.nbytes,
+                'vertex_count': vertex_count,
+                'lod_step': lod_step,
+                'min_height': min_height,
+                'max_height': max_height
+            }
+        else:
+            # Fill a VBO from the pool on the main thread.
+            vbo, vbo_capacity = self.__vbo_pool.reserve(vertex_array.nbytes)
+            writes = [(lambda offset, data: self.__vbo_pool.write(vbo, offset, data), vertex_array)]
+            chunk = {
+                'heights': heights,
+                'vbo': vbo,
+                'vbo_capacity': vbo_capacity,
+                'vbo_bytes': vertex_array.nbytes,
+                'gpu_bytes': vbo_capacity,
+                'vertex_count': vertex_count,
+                'lod_step': lod_step,
+                'min_height': min_height,
+                'max_height': max_height
+            }
+        # The buffer space is held from now on, resident or not.
+        self.__gpu_bytes += chunk['gpu_bytes']
+        writes = [(write, np.ascontiguousarray(data).view(np.uint8).ravel()) for write, data in writes]
+        return {'coord': coord, 'chunk': chunk, 'writes': writes, 'offset': 0,
+                'remaining': sum(len(data) for _, data in writes)}
+
+    def __upload_piece(self, upload: dict, max_bytes: float) -> int:
+        """
+        Write up to max_bytes more of an upload's data, one glBufferSubData call per buffer written to.
+        This must run on the main thread.
+        
+        :param upload: An upload from __begin_upload.
+        :return: The number of bytes written.
+        """
+        written = 0
+        writes = upload['writes']
+        while writes and written < max_bytes:
+            write, data = writes[0]
+            offset = upload['offset']
+            piece = data[offset:offset + min(max_bytes - written, len(data) - offset)]
+            write(offset, piece)
+            written += len(piece)
+            upload['offset'] += len(piece)
+            if upload['offset'] == len(data):
+                writes.pop(0)
+                upload['offset'] = 0
+        upload['remaining'] -= written
+        return written
+
+    def __finish_upload(self, upload: dict):
+        """
+        Make a fully written chunk resident, replacing the chunk already
+        there if it was built at a different level of detail.
+        
+        :param upload: An upload from __begin_upload with nothing left to write.
+        """
+        coord = upload['coord']
+        chunk = upload['chunk']
+        if coord in self.__chunks:
+            self.__evict_chunk(coord)
+        self.__chunks[coord] = chunk
+        self.__height_index = None
+        self.__host_bytes += chunk['heights'].nbytes
+
+    def __release_buffers(self, chunk: dict):
+        """
+        Return a chunk's VBO space to the pool or its arena.
+        
+        :param chunk: A chunk record from __begin_upload.
+        """
+        if 'arena' in chunk:
+            arena = chunk['arena']
+            arena.release(chunk['first'], chunk['vertex_count'])
+            # Keep one arena around for the next chunks; drop any other that empties.
+            if arena.used == 0 and len(self.__arenas) > 1:
+                arena.delete()
+                self.__arenas.remove(arena)
+        else:
+            self.__vbo_pool.release(chunk['vbo'], chunk['vbo_capacity'])
+        if 'ibo' in chunk:
+            self.__vbo_pool.release(chunk['ibo'], chunk['ibo_capacity'])
+        self.__gpu_bytes -= chunk['gpu_bytes']
+
+    def __evict_chunk(self, coord: tuple):
+        """
+        Return a resident chunk's VBO to the pool and drop its host data.
+        
+        :param coord: A (chunk_x, chunk_z) tuple.
+        """
+        chunk = self.__chunks.pop(coord)
+        self.__height_index = None
+        self.__release_buffers(chunk)
+        self.__host_bytes -= chunk['heights'].nbytes
+
+    def __evict_distant_chunks(self):
+        """
+        Evict every resident chunk further than evict_distance from the current chunk.
+        The gap between render_distance and evict_distance keeps chunks from being
+        evicted and regenerated when the target moves back and forth across a boundary.
+        """
+        current_chunk_x, current_chunk_z = self.__current_chunk
+        for coord in list(self.__chunks):
+            if max(abs(coord[0] - current_chunk_x), abs(coord[1] - current_chunk_z)) > self.__evict_distance:
+                self.__evict_chunk(coord)
+                self.__distance_evictions += 1
+
+    def __gpu_usage(self) -> int:
+        """
+        :return: Bytes of buffer storage held: the full capacity of every resident
+                 chunk's buffers, plus the free buffers the VBO pool keeps for reuse.
+        """
+        return self.__gpu_bytes + self.__vbo_pool.free_bytes()
+
+    def __over_budget(self):
+        if self.__host_budget_bytes is not None and self.__host_bytes > self.__host_budget_bytes:
+            return True
+        return self.__gpu_budget_bytes is not None and self.__gpu_usage() > self.__gpu_budget_bytes
+
+    def __trim_vbo_pool(self):
+        """
+        Delete free pooled buffers that push VBO memory over its budget.
+        """
+        if self.__gpu_budget_bytes is not None:
+            self.__vbo_pool.trim(max(self.__gpu_budget_bytes - self.__gpu_bytes, 0))
+
+    def __enforce_budgets(self):
+        """
+        Evict least recently needed chunks until host and VBO memory fit their budgets.
+        Free pooled buffers go before any chunk does, and the buffers evicted chunks
+        hand back to the pool only stay while they fit. Chunks within the render
+        distance are never evicted, so the budgets are soft if they are smaller
+        than the visible area itself.
+        """
+        if not self.__over_budget():
+            return
+        self.__trim_vbo_pool()
+        for coord in list(self.__chunks):
+            if not self.__over_budget():
+                break
+            if coord not in self.__required_chunks:
+                self.__evict_chunk(coord)
+                self.__budget_evictions += 1
+                self.__trim_vbo_pool()
+
+    def __chunk_priority(self, coord: tuple, target, forward) -> float:
+        """
+        Lower is sooner: distance from the target to the chunk's center in chunks,
+        scaled down for chunks ahead of the heading and up for chunks behind it.
+        
+        :param coord: A (chunk_x, chunk_z) tuple.
+        :param target: The (x, z) target position.
+        :param forward: Unit (x, z) heading vector, or None to use distance only.
+        """
+        dx = (coord[0] + 0.5) * self.__chunk_width - target[0]
+        dz = (coord[1] + 0.5) * self.__chunk_width - target[1]
+        distance = math.hypot(dx, dz)
+        if forward is None or distance == 0:
+            return distance / self.__chunk_width
+        alignment = (dx * forward[0] + dz * forward[1]) / distance
+        return distance / self.__chunk_width * (1 - self.__heading_bias * alignment)
+
+    def __schedule(self, target, current_chunk: tuple, heading: float):
+        """
+        Work out the chunks required around the target and queue the missing
+        ones by priority. Queued and not yet started work for chunks that are
+        no longer required is cancelled.
+        
+        :param target: The (x, z) target position.
+        :param current_chunk: The chunk the target is in.
+        :param heading: Heading in degrees (as in Player.position[3]), or None.
+        """
+        forward = None
+        if heading is not None:
+            # Matches the direction Player.update moves forward in.
+            forward = (math.sin(math.radians(heading)), -math.cos(math.radians(heading)))
+        current_chunk_x, current_chunk_z = current_chunk
+        required_lods = {}
+        for dx in range(-self.__render_distance, self.__render_distance + 1):
+            for dz in range(-self.__render_distance, self.__render_distance + 1):
+                required_lods[(current_chunk_x + dx, current_chunk_z + dz)] = self.__lod_step(dx, dz)
+        self.__required_lods = required_lods
+        self.__required_chunks = set(required_lods)
+        self.__priorities = {coord: self.__chunk_priority(coord, target, forward) for coord in required_lods}
+
+        for coord, future in list(self.__chunk_futures.items()):
+            if coord not in required_lods and future.cancel():
+                self.__release_chunk_future(future)
+                del self.__chunk_futures[coord]
+                self.__request_times.pop(coord, None)
+                self.__cancelled_chunks += 1
+        # Finished chunks that have left the render distance are not worth uploading.
+        for coord in list(self.__staged_chunks):
+            if coord not in required_lods:
+                del self.__staged_chunks[coord]
+                self.__request_times.pop(coord, None)
+
+        self.__queue = [
+            (self.__priorities[coord], coord) for coord, lod_step in required_lods.items()
+            if coord not in self.__chunk_futures and coord not in self.__staged_chunks
+            and (coord not in self.__chunks or self.__chunks[coord]['lod_step'] != lod_step)
+        ]
+        heapq.heapify(self.__queue)
+        now = time.perf_counter()
+        for coord in list(self.__request_times):
+            if coord not in required_lods and coord not in self.__chunk_futures:
+                del self.__request_times[coord]
+        for _, coord in self.__queue:
+            self.__request_times.setdefault(coord, now)
+
+    @profiled('MeshMap.update')
+    def update(self, target, heading: float = None):
         """
         Update the map given a target position. This method ensures that
         all chunks within the render distance are generated (or queued for generation)
         and processes a limited number of completed asynchronous tasks per update cycle.
+        Chunks are generated and uploaded closest first (and, given a heading,
+        ahead of the target before behind it). The required set and queue are only
+        rebuilt when the target crosses into another chunk or turns to face
+        another 45 degree sector.
         
         :param target: An (x, z) iterable indicating the center position.
+        :param heading: Optional heading in degrees, e.g. Player.position[3].
         """
         target_x, target_z = target
         current_chunk_x = math.floor(target_x / self.__chunk_width)
         current_chunk_z = math.floor(target_z / self.__chunk_width)
+        heading_sector = None if heading is None else round(heading / 45) % 8
 
-        # Determine required chunk coordinates based on render_distance.
-        required_chunks = set()
-        for dx in range(-self.__render_distance, self.__render_distance + 1):
-            for dz in range(-self.__render_distance, self.__render_distance + 1):
-                chunk_coord = (current_chunk_x + dx, current_chunk_z + dz)
-                required_chunks.add(chunk_coord)
-                if chunk_coord not in self.__chunks and chunk_coord not in self.__chunk_futures:
-                    # Queue async gen of chunk data.
-                    self.__chunk_futures[chunk_coord] = self.__executor.submit(
-                        self.__generate_chunk_data, chunk_coord[0], chunk_coord[1]
-                    )
-
-        # Process a limited number of async tasks.
-        processed = 0
+        if (current_chunk_x, current_chunk_z) != self.__current_chunk or heading_sector != self.__heading_sector:
+            crossed = (current_chunk_x, current_chunk_z) != self.__current_chunk
+            self.__current_chunk = (current_chunk_x, current_chunk_z)
+            self.__heading_sector = heading_sector
+            self.__schedule((target_x, target_z), self.__current_chunk, heading)
+            if crossed:
+                # Crossed into a new chunk: refresh recency of everything needed now
+                # and drop what is now too far away.
+                for coord in self.__required_chunks:
+                    if coord in self.__chunks:
+                        self.__chunks.move_to_end(coord)
+                self.__evict_distant_chunks()
+
+        # Hand the most urgent queued chunks to the executor, keeping only a few
+        # in flight so new priorities take effect quickly. Chunks waiting to be
+        # uploaded count too, so generation backs off when uploads fall behind.
+        uploading = None if self.__upload is None else self.__upload['coord']
+        while self.__queue and len(self.__chunk_futures) + len(self.__staged_chunks) + (uploading is not None) < self.__max_pending_chunks:
+            _, coord = heapq.heappop(self.__queue)
+            lod_step = self.__required_lods[coord]
+            if coord in self.__chunk_futures or coord in self.__staged_chunks or coord == uploading or (coord in self.__chunks and self.__chunks[coord]['lod_step'] == lod_step):
+                continue
+            # Queue async gen of chunk data. A chunk at the wrong level of
+            # detail keeps being drawn until its replacement is ready.
+            self.__chunk_futures[coord] = self.__submit_chunk(coord, lod_step)
+
+        if self.__upload_chunks():
+            self.__enforce_budgets()
+
+    def __upload_chunks(self) -> int:
+        """
+        Stage the data of finished chunk futures, then upload staged chunks most
+        urgent first until the upload budget is spent. Chunks are written a piece
+        of at most upload_piece_bytes at a time, and the time a piece will take is
+        predicted from its size, so a large chunk is finished over the next updates
+        rather than overrunning this one. At least one piece is always uploaded.
+        This must run on the main thread.
+        
+        :return: The number of chunks finished and made resident.
+        """
+        start = time.perf_counter()
         for coord, future in list(self.__chunk_futures.items()):
-            if processed >= self.__chunks_per_update:
-                break
-            if future.done():
+            if not future.done():
+                continue
+            del self.__chunk_futures[coord]
+            try:
+                self.__staged_chunks[coord] = self.__chunk_result(coord, future)
+            except Exception as e:
+                print(f"Error generating chunk {coord}: {e}")
+                # Try again later, as if it had never been generated.
+                if coord in self.__required_lods:
+                    heapq.heappush(self.__queue, (self.__priorities[coord], coord))
+
+        budget = None if self.__upload_budget_ms is None else self.__upload_budget_ms / 1000
+        piece_bytes = math.inf if self.__upload_piece_bytes is None else self.__upload_piece_bytes
+        ready = iter(sorted((self.__priorities.get(coord, math.inf), coord) for coord in self.__staged_chunks)[:self.__chunks_per_update])
+        uploaded_chunks = 0
+        uploaded_bytes = 0
+        while True:
+            # Carry on with the chunk already being uploaded before starting another.
+            if self.__upload is None:
+                _, coord = next(ready, (None, None))
+                if coord is None:
+                    break
+                next_bytes = self.__staged_chunks[coord][1].nbytes
+            else:
+                next_bytes = self.__upload['remaining']
+            if uploaded_bytes and budget is not None and self.__upload_seconds_per_byte is not None:
+                predicted = min(next_bytes, piece_bytes) * self.__upload_seconds_per_byte
+                if time.perf_counter() - start + predicted > budget:
+                    break
+            if self.__upload is None:
+                heights, vertex_array, vertex_count = self.__staged_chunks.pop(coord)
                 try:
-                    vertex_array, vertex_count = future.result()
-                    # Create the VBO on the main thread.
-                    vbo = self.__create_vbo(vertex_array)
-                    self.__chunks[coord] = {
-                        'vertices': vertex_array,
-                        'vbo': vbo,
-                        'vertex_count': vertex_count
-                    }
+                    self.__upload = self.__begin_upload(coord, heights, vertex_array, vertex_count)
                 except Exception as e:
-                    print(f"Error generating chunk {coord}: {e}")
-                del self.__chunk_futures[coord]
-                processed += 1
+                    print(f"Error uploading chunk {coord}: {e}")
+                    if coord in self.__required_lods:
+                        heapq.heappush(self.__queue, (self.__priorities[coord], coord))
+                    continue
+            upload = self.__upload
+            coord = upload['coord']
+            upload_start = time.perf_counter()
+            try:
+                written = self.__upload_piece(upload, piece_bytes)
+            except Exception as e:
+                print(f"Error uploading chunk {coord}: {e}")
+                self.__upload = None
+                self.__release_buffers(upload['chunk'])
+                if coord in self.__required_lods:
+                    heapq.heappush(self.__queue, (self.__priorities[coord], coord))
+                continue
+            if written:
+                seconds_per_byte = (time.perf_counter() - upload_start) / written
+                if self.__upload_seconds_per_byte is None:
+                    self.__upload_seconds_per_byte = seconds_per_byte
+                else:
+                    self.__upload_seconds_per_byte += (seconds_per_byte - self.__upload_seconds_per_byte) * 0.2
+            uploaded_bytes += written
+            if upload['writes']:
+                continue
+            self.__upload = None
+            self.__finish_upload(upload)
+            uploaded_chunks += 1
+            self.__mark_visible(coord)
+            lod_step = self.__required_lods.get(coord)
+            if lod_step is not None and self.__chunks[coord]['lod_step'] != lod_step:
+                # Its detail band changed while it was being generated.
+                heapq.heappush(self.__queue, (self.__priorities[coord], coord))
+                self.__request_times[coord] = time.perf_counter()
+        self.__recent_uploads.append((uploaded_chunks, uploaded_bytes, time.perf_counter() - start))
+        return uploaded_chunks
 
-    def render(self, target):
+    def __mark_visible(self, coord: tuple):
         """
-        Render only the chunks that fall within the render distance of the given target.
-        The method uses the target position to compute which chunks to draw, binds their VBOs,
-        and issues draw calls.
+        Record how long a chunk took from being requested to being uploaded.
+        Preloaded chunks are not timed.
         
+        :param coord: A (chunk_x, chunk_z) tuple that was just stored.
+        """
+        requested = self.__request_times.pop(coord, None)
+        if requested is None:
+            return
+        time_to_visible = time.perf_counter() - requested
+        self.__chunks[coord]['time_to_visible'] = time_to_visible
+        self.__recent_times_to_visible.append(time_to_visible)
+
+    def cull(self, target, frustum: Frustum = None, max_distance: float = None) -> list:
+        """
+        Public method: Pick the resident chunks to draw this frame: those within the render
+        distance of the target whose bounding box is inside the frustum and
+        within max_distance. Needs no OpenGL context.
+        Updates the counts returned by get_render_stats.
+
         :param target: An (x, z) iterable indicating the center position.
+        :param frustum: Optional Frustum to cull against.
+        :param max_distance: Optional world distance from the target; chunks whose
+                             nearest point is further away than this are not drawn.
+        :return: A list of (coord, chunk) tuples to draw, in storage order.
         """
         target_x, target_z = target
         current_chunk_x = math.floor(target_x / self.__chunk_width)
         current_chunk_z = math.floor(target_z / self.__chunk_width)
+        candidates = [
+            (coord, chunk) for coord, chunk in self.__chunks.items()
+            if abs(coord[0] - current_chunk_x) <= self.__render_distance
+            and abs(coord[1] - current_chunk_z) <= self.__render_distance
+        ]
+        self.__render_stats = {'drawn_chunks': len(candidates), 'frustum_culled': 0, 'distance_culled': 0}
+        if not candidates or (frustum is None and max_distance is None):
+            return candidates
 
-        # Determine the set of chunk coordinates that should be rendered.
-        visible_chunks = set()
-        for dx in range(-self.__render_distance, self.__render_distance + 1):
-            for dz in range(-self.__render_distance, self.__render_distance + 1):
-                visible_chunks.add((current_chunk_x + dx, current_chunk_z + dz))
+        # Bounding boxes: x and z from the chunk coordinates, y from the recorded heights.
+        coords = np.array([coord for coord, _ in candidates], dtype=np.float64)
+        mins = np.empty((len(candidates), 3))
+        maxs = np.empty((len(candidates), 3))
+        mins[:, 0] = coords[:, 0] * self.__chunk_width
+        mins[:, 2] = coords[:, 1] * self.__chunk_width
+        maxs[:, 0] = mins[:, 0] + self.__chunk_width
+        maxs[:, 2] = mins[:, 2] + self.__chunk_width
+        mins[:, 1] = [chunk['min_height'] for _, chunk in candidates]
+        maxs[:, 1] = [chunk['max_height'] for _, chunk in candidates]
 
+        visible = np.ones(len(candidates), dtype=bool)
+        if max_distance is not None:
+            # Distance from the target to the nearest point of each box in x/z.
+            dx = np.maximum(np.maximum(mins[:, 0] - target_x, target_x - maxs[:, 0]), 0)
+            dz = np.maximum(np.maximum(mins[:, 2] - target_z, target_z - maxs[:, 2]), 0)
+            visible &= dx * dx + dz * dz <= max_distance * max_distance
+            self.__render_stats['distance_culled'] = int(len(candidates) - visible.sum())
+        if frustum is not None:
+            in_frustum = frustum.contains_boxes(mins, maxs)
+            self.__render_stats['frustum_culled'] = int((visible & ~in_frustum).sum())
+            visible &= in_frustum
+        self.__render_stats['drawn_chunks'] = int(visible.sum())
+        return [candidate for candidate, keep in zip(candidates, visible) if keep]
+
+    @profiled('MeshMap.render')
+    def render(self, target, frustum: Frustum = None, max_distance: float = None):
+        """
+        Render only the chunks that fall within the render distance of the given target.
+        The method uses the target position to compute which chunks to draw, binds their VBOs,
+        and issues draw calls.
+        
+        :param target: An (x, z) iterable indicating the center position.
+        :param frustum: Optional Frustum (e.g. from Camera.get_frustum) to skip chunks outside the view.
+        :param max_distance: Optional world distance from the target to draw chunks within,
+                             for a round rather than square draw area.
+        """
+        visible = self.cull(target, frustum, max_distance)
+        if self.__headless:
+            return
         # Render only the visible chunks using the fixed-function pipeline.
-        stride = 6 * 4  # 6 floats per vertex, 4 bytes each
-        for coord, chunk in self.__chunks.items():
-            if coord in visible_chunks:
-                glBindBuffer(GL_ARRAY_BUFFER, chunk['vbo'])
+        if self.__draw_mode == 'per_chunk':
+            for coord, chunk in visible:
                 glEnableClientState(GL_VERTEX_ARRAY)
-                glVertexPointer(3, GL_FLOAT, stride, ctypes.c_void_p(0))
                 glEnableClientState(GL_COLOR_ARRAY)
-                glColorPointer(3, GL_FLOAT, stride, ctypes.c_void_p(12))
-                
-                glDrawArrays(GL_TRIANGLES, 0, chunk['vertex_count'])
-                
+                self.__draw_chunk(chunk)
                 glDisableClientState(GL_VERTEX_ARRAY)
                 glDisableClientState(GL_COLOR_ARRAY)
+                if 'ibo' in chunk:
+                    glBindBuffer(GL_ELEMENT_ARRAY_BUFFER, 0)
                 glBindBuffer(GL_ARRAY_BUFFER, 0)
+            return
+
+        if not visible:
+            return
+        glEnableClientState(GL_VERTEX_ARRAY)
+        glEnableClientState(GL_COLOR_ARRAY)
+        if self.__draw_mode == 'arena':
+            self.__draw_arenas(visible)
+        else:
+            for coord, chunk in visible:
+                self.__draw_chunk(chunk)
+        glDisableClientState(GL_VERTEX_ARRAY)
+        glDisableClientState(GL_COLOR_ARRAY)
+        glBindBuffer(GL_ELEMENT_ARRAY_BUFFER, 0)
+        glBindBuffer(GL_ARRAY_BUFFER, 0)
+
+    def __draw_chunk(self, chunk: dict):
+        """
+        Bind a chunk's buffers, point the enabled client arrays at them and draw it.
+        
+        :param chunk: A resident chunk dictionary.
+        """
+        if 'ibo' in chunk:
+            self.__draw_indexed_chunk(chunk)
+            return
+        stride = 6 * 4  # 6 floats per vertex, 4 bytes each
+        glBindBuffer(GL_ARRAY_BUFFER, chunk['vbo'])
+        glVertexPointer(3, GL_FLOAT, stride, ctypes.c_void_p(0))
+        glColorPointer(3, GL_FLOAT, stride, ctypes.c_void_p(12))
+        glDrawArrays(GL_TRIANGLES, 0, chunk['vertex_count'])
+
+    def __draw_indexed_chunk(self, chunk: dict):
+        """
+        Draw a chunk stored in the 'indexed' mesh format.
+        The int16 positions are chunk-local with quantized heights, so the
+        modelview is moved to the chunk origin and scaled in y to place them.
+        
+        :param chunk: A resident chunk dictionary.
+        """
+        glPushMatrix()
+        glTranslatef(*chunk['origin'])
+        glScalef(1, chunk['y_step'], 1)
+        glBindBuffer(GL_ARRAY_BUFFER, chunk['vbo'])
+        glBindBuffer(GL_ELEMENT_ARRAY_BUFFER, chunk['ibo'])
+        glVertexPointer(3, GL_SHORT, 0, ctypes.c_void_p(0))
+        glColorPointer(3, GL_UNSIGNED_BYTE, 0, ctypes.c_void_p(chunk['color_offset']))
+        glDrawElements(GL_TRIANGLES, chunk['index_count'], chunk['index_type'], ctypes.c_void_p(0))
+        glPopMatrix()
+
+    def __draw_arenas(self, visible: list):
+        """
+        Draw every visible chunk with one glMultiDrawArrays call per arena.
+        
+        :param visible: (coord, chunk) tuples from __cull.
+        """
+        ranges = {}
+        for coord, chunk in visible:
+            firsts, counts = ranges.setdefault(chunk['arena'], ([], []))
+            firsts.append(chunk['first'])
+            counts.append(chunk['vertex_count'])
+        stride = 6 * 4  # 6 floats per vertex, 4 bytes each
+        for arena, (firsts, counts) in ranges.items():
+            glBindBuffer(GL_ARRAY_BUFFER, arena.vbo)
+            glVertexPointer(3, GL_FLOAT, stride, ctypes.c_void_p(0))
+            glColorPointer(3, GL_FLOAT, stride, ctypes.c_void_p(12))
+            glMultiDrawArrays(GL_TRIANGLES, np.array(firsts, dtype=np.int32), np.array(counts, dtype=np.int32), len(firsts))
 
     def cleanup(self):
         """
         Flush all generated chunks and pending asynchronous tasks.
-        This will delete all VBOs and clear the chunk dictionary.
+        This will delete all VBOs, clear the chunk dictionary and shut down
+        the chunk generation workers, so the map can't stream afterwards.
         """
-        for chunk in self.__chunks.values():
-            glDeleteBuffers(1, [chunk['vbo']])
-        self.__chunks.clear()
+        for coord in list(self.__chunks):
+            self.__evict_chunk(coord)
+        if self.__upload is not None:
+            self.__release_buffers(self.__upload['chunk'])
+            self.__upload = None
+        for arena in self.__arenas:
+            arena.delete()
+        self.__arenas.clear()
+        self.__host_bytes = 0
+        self.__gpu_bytes = 0
+        self.__current_chunk = None
+        self.__required_chunks = set()
+        self.__required_lods = {}
+        self.__priorities = {}
+        self.__heading_sector = None
+        self.__queue = []
+        self.__request_times.clear()
         for future in self.__chunk_futures.values():
-            future.cancel()
+            self.__release_chunk_future(future)
         self.__chunk_futures.clear()
+        self.__staged_chunks.clear()
+        self.__vbo_pool.delete()
+        # Waiting lets running tasks release their shared memory blocks first.
+        self.__executor.shutdown(wait=True, cancel_futures=True)
+        if self.__executor_backend == 'processes':
+            while self.__free_blocks:
+                block = self.__free_blocks.pop()
+                block.close()
+                block.unlink()
+
+    def get_chunk_width(self) -> int:
+        """
+        Public method: Number of tiles per chunk side.
+        """
+        return self.__chunk_width
+
+    def get_memory_stats(self) -> dict:
+        """
+        Public method: Counters for sizing the eviction budgets.
+        
+        :return: A dict with the number of resident chunks, the host bytes they hold,
+                 the VBO bytes held (whole buffer capacities, free pooled buffers
+                 included, as gpu_budget_bytes counts them), the number of shared arenas ('arena' draw mode), and how many
+                 chunks have been evicted by distance and by budget.
+        """
+        return {
+            'resident_chunks': len(self.__chunks),
+            'pending_chunks': len(self.__chunk_futures),
+            'host_bytes': self.__host_bytes,
+            'gpu_bytes': self.__gpu_usage(),
+            'arenas': len(self.__arenas),
+            'distance_evictions': self.__distance_evictions,
+            'budget_evictions': self.__budget_evictions
+        }
+
+    def get_streaming_stats(self) -> dict:
+        """
+        Public method: Chunk scheduling counters.
+        
+        :return: A dict with the number of chunks queued and in flight, how many queued
+                 chunks were cancelled after leaving the render distance, and the mean, 95th
+                 percentile and max time (seconds) from requesting a chunk to it being
+                 uploaded, over the last 1000 chunks.
+        """
+        times = np.array(self.__recent_times_to_visible)
+        return {
+            'queued_chunks': len(self.__queue),
+            'pending_chunks': len(self.__chunk_futures),
+            'cancelled_chunks': self.__cancelled_chunks,
+            'time_to_visible_mean': float(times.mean()) if len(times) else 0.0,
+            'time_to_visible_p95': float(np.percentile(times, 95)) if len(times) else 0.0,
+            'time_to_visible_max': float(times.max()) if len(times) else 0.0
+        }
+
+    def get_upload_stats(self) -> dict:
+        """
+        Public method: Chunk upload counters.
+        
+        :return: A dict with the number of finished chunks waiting to be uploaded, the bytes
+                 left to write of the chunk being uploaded a piece at a time, the chunks finished
+                 and the bytes and milliseconds uploaded by the last update, the mean and max
+                 upload milliseconds per update over the last 1000 updates, and how many buffers
+                 the VBO pool has created and reused and the bytes it holds free.
+        """
+        uploads = np.array(self.__recent_uploads, dtype=np.float64).reshape(-1, 3)
+        last = uploads[-1] if len(uploads) else np.zeros(3)
+        return {
+            'staged_chunks': len(self.__staged_chunks),
+            'partial_upload_bytes': 0 if self.__upload is None else self.__upload['remaining'],
+            'last_upload_chunks': int(last[0]),
+            'last_upload_bytes': int(last[1]),
+            'last_upload_ms': float(last[2]) * 1000,
+            'upload_ms_mean': float(uploads[:, 2].mean()) * 1000 if len(uploads) else 0.0,
+            'upload_ms_max': float(uploads[:, 2].max()) * 1000 if len(uploads) else 0.0,
+            'pool_created': self.__vbo_pool.created,
+            'pool_reused': self.__vbo_pool.reused,
+            'pool_free_bytes': self.__vbo_pool.free_bytes()
+        }
+
+    def get_time_to_visible(self) -> dict:
+        """
+        Public method: Per chunk time-to-visible.
+        
+        :return: A dict mapping each resident chunk's (chunk_x, chunk_z) to the seconds between
+                 it being requested and uploaded.
+        """
+        return {coord: chunk['time_to_visible'] for coord, chunk in self.__chunks.items() if 'time_to_visible' in chunk}
+
+    def get_render_stats(self) -> dict:
+        """
+        Public method: Culling counters from the last render.
+        
+        :return: A dict with the number of chunks drawn, and how many chunks within
+                 the render distance were skipped by the frustum and by max_distance.
+        """
+        return dict(self.__render_stats)
+
+    def get_resident_chunks(self):
+        """
+        Public method: The resident chunks, for inspecting the map headless.
+
+        :return: A read-only live mapping of each resident chunk's (chunk_x, chunk_z) to its
+                 dict, which holds 'heights', 'vertex_count', 'lod_step', 'min_height',
+                 'max_height', 'vbo_bytes' and 'gpu_bytes', plus the buffers of its draw mode
+                 ('vbo' and 'vbo_capacity', 'ibo' and 'ibo_capacity' for indexed chunks, or
+                 'arena' and 'first') and 'time_to_visible' once it has been timed.
+        """
+        return types.MappingProxyType(self.__chunks)
+
+    def get_lod_step(self, dx: int, dz: int) -> int:
+        """
+        Public method: The level of detail the map builds a chunk at.
+
+        :param dx: Chunk offset from the target's chunk in x.
+        :param dz: Chunk offset from the target's chunk in z.
+        :return: The tile step to build a chunk at that offset with (1 is full detail).
+        """
+        return self.__lod_step(dx, dz)
+
+    def submit_chunk(self, coord: tuple, lod_step: int = 1):
+        """
+        Public method: Start generating a chunk's data on the map's executor backend (or
+        answer it from the cache) without making it resident, for timing generation
+        headless. Collect the result with get_chunk_result.
+
+        :param coord: A (chunk_x, chunk_z) tuple.
+        :param lod_step: Tile step to build the chunk with (1 is full detail).
+        :return: A future for the chunk data.
+        """
+        return self.__submit_chunk(coord, lod_step)
+
+    def get_chunk_result(self, coord: tuple, future) -> tuple:
+        """
+        Public method: Wait for a future from submit_chunk, saving newly generated chunks to the cache.
+
+        :param coord: The (chunk_x, chunk_z) the future was submitted for.
+        :param future: A future from submit_chunk.
+        :return: A tuple (heights, vertex_array, vertex_count)
+        """
+        return self.__chunk_result(coord, future)
+
+    def generate_chunk(self, coord: tuple, lod_step: int = 1) -> tuple:
+        """
+        Public method: Generate a chunk's data and wait for it, without making it resident.
+
+        :param coord: A (chunk_x, chunk_z) tuple.
+        :param lod_step: Tile step to build the chunk with (1 is full detail).
+        :return: A tuple (heights, vertex_array, vertex_count)
+        """
+        return self.get_chunk_result(coord, self.submit_chunk(coord, lod_step))
+
+    def store_chunk(self, coord: tuple, heights: np.ndarray, vertex_array: np.ndarray, vertex_count: int):
+        """
+        Public method: Make chunk data (from generate_chunk) resident, uploading it unless the
+        map is headless, without any of update's scheduling. This must run on the main thread.
+
+        :param coord: A (chunk_x, chunk_z) tuple.
+        """
+        self.__store_chunk(coord, heights, vertex_array, vertex_count)
 
     def get_tile_height(self, pos: tuple) -> float:
         """
-        Public method: Given a tuple (x, z), compute and return the height of the tile at that position.
+        Public method: Given a tuple (x, z), return the height of the tile at that position.
+        This is the height the tile is drawn at (its corner at floor(x), floor(z)).
+        It is read from the resident chunk's height grid when the chunk is loaded
+        at full detail; otherwise it is computed from noise and remembered in a
+        small least recently used cache, which is only looked at once the resident chunks miss.
         
         :param pos: A tuple (x, z) representing world coordinates.
-        :return: The height at that tile, based on noise generation.
+        :return: The height at that tile.
+        """
+        tile_x = math.floor(pos[0])
+        tile_z = math.floor(pos[1])
+        chunk_x = tile_x // self.__chunk_width
+        chunk_z = tile_z // self.__chunk_width
+        chunk = self.__chunks.get((chunk_x, chunk_z))
+        if chunk is not None and chunk['lod_step'] == 1:
+            # The grid has a one tile border, so the chunk's first tile is at [1, 1].
+            return chunk['heights'].item(tile_x - chunk_x * self.__chunk_width + 1, tile_z - chunk_z * self.__chunk_width + 1)
+
+        return self.__noise_tile_height(tile_x, tile_z)
+
+    def get_tile_heights(self, positions, interpolate: bool = False) -> np.ndarray:
+        """
+        Public method: Bulk version of get_tile_height for many positions at once.
+        Heights are gathered from resident full detail chunks a chunk at a
+        time; anything else is computed with the vectorized noise in one go.
+        
+        :param positions: An (n, 2) array-like of world (x, z) positions.
+        :param interpolate: Blend the heights of the four tile corners around each
+                            position bilinearly instead of taking the tile's height,
+                            for entities that should move smoothly over the terrain.
+        :return: A float64 numpy array of n heights.
+        """
+        positions = np.asarray(positions, dtype=np.float64).reshape(-1, 2)
+        tiles = np.floor(positions)
+        if not interpolate:
+            return self.__gather_tile_heights(tiles.astype(np.int64))
+        return self.interpolate_tile_heights(positions, self.__gather_tile_heights(tiles.astype(np.int64), corners=True))
+
+    def get_tile_corner_heights(self, tiles) -> np.ndarray:
+        """
+        Public method: The heights get_tile_heights blends between, for callers
+        that keep them while their positions stay on the same tile.
+
+        :param tiles: An (n, 2) array-like of integer tile (x, z) coordinates.
+        :return: A (4, n) float64 array of the heights of each tile and the tiles
+                 at +x, +z and +x +z of it; row 0 is the tile's own height.
+        """
+        return self.__gather_tile_heights(np.asarray(tiles, dtype=np.int64).reshape(-1, 2), corners=True)
+
+    @staticmethod
+    def interpolate_tile_heights(positions, corner_heights) -> np.ndarray:
+        """
+        Public method: Blend corner heights bilinearly, as get_tile_heights does.
+
+        :param positions: An (n, 2) array-like of world (x, z) positions.
+        :param corner_heights: A (4, n) array from get_tile_corner_heights for the
+                               tiles the positions are on.
+        :return: A float64 numpy array of n heights.
+        """
+        positions = np.asarray(positions, dtype=np.float64).reshape(-1, 2)
+        fx, fz = (positions - np.floor(positions)).T
+        bottom = corner_heights[0] + fx * (corner_heights[1] - corner_heights[0])
+        top = corner_heights[2] + fx * (corner_heights[3] - corner_heights[2])
+        return bottom + fz * (top - bottom)
+
+    def __gather_tile_heights(self, tiles: np.ndarray, corners: bool = False) -> np.ndarray:
+        """
+        :param tiles: An (n, 2) int64 array of tile (x, z) coordinates.
+        :param corners: Also gather the heights of the tiles at +x, +z and +x +z of each tile.
+                        These always fall in the same chunk grid thanks to its border.
+        :return: A float64 array of the tiles' heights (float32 values, as in the chunk grids),
+                 or with corners a (4, n) array for the tile, +x, +z and +x +z.
+        """
+        offsets = np.array(((0, 0), (1, 0), (0, 1), (1, 1)) if corners else ((0, 0),))
+        heights = np.empty((len(offsets), len(tiles)), dtype=np.float64)
+        if not len(tiles):
+            return heights if corners else heights[0]
+        chunk_coords = tiles // self.__chunk_width
+        # The grids have a one tile border, so a chunk's first tile is at [1, 1].
+        local = tiles - chunk_coords * self.__chunk_width + 1
+
+        # Find each tile's chunk among the resident full detail chunks by key.
+        if self.__height_index is None:
+            self.__build_height_index()
+        chunk_keys, grids = self.__height_index
+        tile_keys = chunk_coords[:, 0] * (1 << 32) + chunk_coords[:, 1]
+        slots = np.minimum(np.searchsorted(chunk_keys, tile_keys), max(len(chunk_keys) - 1, 0))
+        found = chunk_keys[slots] == tile_keys if len(chunk_keys) else np.zeros(len(tiles), dtype=bool)
+        found_slots = slots[found]
+        found_x = local[found, 0]
+        found_z = local[found, 1]
+        for i, (offset_x, offset_z) in enumerate(offsets):
+            heights[i, found] = grids[found_slots, found_x + offset_x, found_z + offset_z]
+
+        missing = ~found
+        if missing.any():
+            missing_tiles = (tiles[missing][None, :, :] + offsets[:, None, :]).reshape(-1, 2)
+            heights[:, missing] = ChunkGenerator.terrain_heights(
+                missing_tiles[:, 0], missing_tiles[:, 1], self.__seed, self.__scale, self.__height_limit
+            ).astype(np.float32).reshape(len(offsets), -1)
+        return heights if corners else heights[0]
+
+    def __build_height_index(self):
+        """
+        Stack the height grids of the resident full detail chunks, sorted by
+        chunk key, so get_tile_heights can find and gather them with array
+        operations. Rebuilt lazily after chunks are stored or evicted.
+        """
+        coords = [coord for coord, chunk in self.__chunks.items() if chunk['lod_step'] == 1]
+        keys = np.array([chunk_x * (1 << 32) + chunk_z for chunk_x, chunk_z in coords], dtype=np.int64)
+        order = np.argsort(keys)
+        grid_size = self.__chunk_width + 2
+        grids = np.empty((len(coords), grid_size, grid_size), dtype=np.float32)
+        for slot, index in enumerate(order):
+            grids[slot] = self.__chunks[coords[index]]['heights']
+        self.__height_index = (keys[order], grids)
+
+    def get_heights(self, xs, zs) -> np.ndarray:
+        """
+        Public method: Computes the terrain heights at many exact positions at once
+        (not floored to tiles) using the vectorized Perlin implementation,
+        which matches noise.pnoise2 exactly.
+        
+        :param xs: Array-like of world x coordinates.
+        :param zs: Array-like of world z coordinates (same shape as xs).
+        :return: A float64 numpy array of heights with the shape of xs.
         """
-        x, z = pos
-        base_noise = noise.pnoise2(
-            x * self.__scale,
-            z * self.__scale,
-            octaves=4,
-            persistence=0.5,
-            lacunarity=2.0,
-            repeatx=1024,
-            repeaty=1024,
-            base=self.__seed
-        )
-        # Normalize noise to [0, 1] then scale to height_limit.
-        normalized_noise = (base_noise + 1) / 2
-        y = (normalized_noise **5 ) * self.__height_limit
-        return y
+        return ChunkGenerator.terrain_heights(xs, zs, self.__seed, self.__scale, self.__height_limit)
 
 
 
@@ -327,6 +1320,7 @@ if __name__ == '__main__':
     import numpy as np
     import noise  # pip install noise
     import concurrent.futures
+    from Frustum import perspective_matrix, look_at_matrix
     
     # Initialize pygame and create an OpenGL-enabled window.
     pygame.init()
@@ -343,11 +1337,13 @@ if __name__ == '__main__':
     glLoadIdentity()
     gluPerspective(45, (display[0] / display[1]), 0.1, 100000.0)
     glMatrixMode(GL_MODELVIEW)
+    projection = perspective_matrix(45, (display[0] / display[1]), 0.1, 100000.0)
 
     # Create an instance of MeshMap.
     max_height = 1000
     rendering = 30
-    mesh_map = MeshMap(chunk_width=16, render_distance=rendering, chunks_per_update=6, seed=42, scale=0.005, height_limit=max_height, initial_target=(0, 0))
+    mesh_map = MeshMap(chunk_width=16, render_distance=rendering, chunks_per_update=6, seed=42, scale=0.005, height_limit=max_height, initial_target=(0, 0), executor='processes',
+                       lod_distances=(8, 16, 24))
 
     # Starting target position (x, z). We'll update this with arrow keys.
     target = [0.0, 0.0]
@@ -393,9 +1389,11 @@ if __name__ == '__main__':
                   target[0], 0, target[1],       # Look-at position (target).
                   0, 1, 0)                      # Up vector.
 
-        # Update and render the MeshMap using the current target position.
+        # Update and render the MeshMap using the current target position,
+        # skipping chunks outside the camera's view.
+        view = look_at_matrix((camera_x, camera_y, camera_z), (target[0], 0, target[1]), (0, 1, 0))
         mesh_map.update(target)
-        mesh_map.render(target)
+        mesh_map.render(target, frustum=Frustum(projection, view))
 
         pygame.display.flip()
 
@@ -0,0 +1,213 @@
+import importlib.metadata
+import numpy as np
+import noise
+
+# Vectorized port of the 2D Perlin noise in the `noise` package (noise.pnoise2).
+# All of the arithmetic is done in float32, in the same order as the C
+# extension, so a batch of samples comes back bit-for-bit identical to calling
+# noise.pnoise2 once per sample.
+# That only holds for the version of the extension it was ported from, and for
+# a non-zero base it also depends on how that build lays out its tables (see
+# PERM). So pnoise2 only takes the vectorized path once a parity probe against
+# noise.pnoise2 has passed for the base, and otherwise calls noise.pnoise2 per sample.
+NOISE_VERSION = '1.2.2'
+
+# Gradient table used by the C extension's grad2 (only x and y are read).
+GRAD3 = np.array([
+    (1, 1, 0), (-1, 1, 0), (1, -1, 0), (-1, -1, 0),
+    (1, 0, 1), (-1, 0, 1), (1, 0, -1), (-1, 0, -1),
+    (0, 1, 1), (0, -1, 1), (0, 1, -1), (0, -1, -1),
+    (1, 0, -1), (-1, 0, -1), (0, -1, 1), (0, 1, 1)
+], dtype=np.float32)
+
+# The 4D gradient table sits directly after PERM in the compiled extension.
+GRAD4 = np.array([
+    (0, 1, 1, 1), (0, 1, 1, -1), (0, 1, -1, 1), (0, 1, -1, -1),
+    (0, -1, 1, 1), (0, -1, 1, -1), (0, -1, -1, 1), (0, -1, -1, -1),
+    (1, 0, 1, 1), (1, 0, 1, -1), (1, 0, -1, 1), (1, 0, -1, -1),
+    (-1, 0, 1, 1), (-1, 0, 1, -1), (-1, 0, -1, 1), (-1, 0, -1, -1),
+    (1, 1, 0, 1), (1, 1, 0, -1), (1, -1, 0, 1), (1, -1, 0, -1),
+    (-1, 1, 0, 1), (-1, 1, 0, -1), (-1, -1, 0, 1), (-1, -1, 0, -1),
+    (1, 1, 1, 0), (1, 1, -1, 0), (1, -1, 1, 0), (1, -1, -1, 0),
+    (-1, 1, 1, 0), (-1, 1, -1, 0), (-1, -1, 1, 0), (-1, -1, -1, 0)
+], dtype=np.float32)
+
+# Ken Perlin's reference permutation.
+_PERMUTATION = np.array([
+    151, 160, 137, 91, 90, 15, 131, 13, 201, 95, 96, 53, 194, 233, 7, 225, 140,
+    36, 103, 30, 69, 142, 8, 99, 37, 240, 21, 10, 23, 190, 6, 148, 247, 120,
+    234, 75, 0, 26, 197, 62, 94, 252, 219, 203, 117, 35, 11, 32, 57, 177, 33,
+    88, 237, 149, 56, 87, 174, 20, 125, 136, 171, 168, 68, 175, 74, 165, 71,
+    134, 139, 48, 27, 166, 77, 146, 158, 231, 83, 111, 229, 122, 60, 211, 133,
+    230, 220, 105, 92, 41, 55, 46, 245, 40, 244, 102, 143, 54, 65, 25, 63, 161,
+    1, 216, 80, 73, 209, 76, 132, 187, 208, 89, 18, 169, 200, 196, 135, 130,
+    116, 188, 159, 86, 164, 100, 109, 198, 173, 186, 3, 64, 52, 217, 226, 250,
+    124, 123, 5, 202, 38, 147, 118, 126, 255, 82, 85, 212, 207, 206, 59, 227,
+    47, 16, 58, 17, 182, 189, 28, 42, 223, 183, 170, 213, 119, 248, 152, 2, 44,
+    154, 163, 70, 221, 153, 101, 155, 167, 43, 172, 9, 129, 22, 39, 253, 19, 98,
+    108, 110, 79, 113, 224, 232, 178, 185, 112, 104, 218, 246, 97, 228, 251, 34,
+    242, 193, 238, 210, 144, 12, 191, 179, 162, 241, 81, 51, 145, 235, 249, 14,
+    239, 107, 49, 192, 214, 31, 181, 199, 106, 157, 184, 84, 204, 176, 115, 121,
+    50, 45, 127, 4, 150, 254, 138, 236, 205, 93, 222, 114, 67, 29, 24, 72, 243,
+    141, 128, 195, 78, 66, 215, 61, 156, 180
+], dtype=np.uint8)
+
+# The C extension offsets its lookups by `base` without wrapping, so with a
+# non-zero seed it reads past the end of its 512 entry table into whatever the
+# compiler put after it, GRAD4 in the 1.2.2 builds this was checked against.
+# Those bytes are appended here so seeded noise matches such a build; the
+# parity probe catches builds where it does not.
+PERM = np.concatenate((
+    _PERMUTATION,
+    _PERMUTATION,
+    np.frombuffer(GRAD4.tobytes(), dtype=np.uint8)
+)).astype(np.intp)
+
+
+def _noise2(x, y, repeatx, repeaty, base):
+    """
+    Single octave of 2D Perlin noise over float32 arrays.
+
+    :param x: float32 array of x sample coordinates.
+    :param y: float32 array of y sample coordinates.
+    :param repeatx: float32 period in x.
+    :param repeaty: float32 period in y.
+    :param base: Offset into the permutation table (the seed).
+    :return: float32 array of noise values.
+    """
+    i = np.floor(np.fmod(x, repeatx)).astype(np.int32)
+    j = np.floor(np.fmod(y, repeaty)).astype(np.int32)
+    ii = np.fmod((i + 1).astype(np.float32), repeatx).astype(np.int32)
+    jj = np.fmod((j + 1).astype(np.float32), repeaty).astype(np.int32)
+    i = (i & 255) + base
+    j = (j & 255) + base
+    ii = (ii & 255) + base
+    jj = (jj & 255) + base
+
+    x = x - np.floor(x)
+    y = y - np.floor(y)
+    fx = x * x * x * (x * (x * 6 - 15) + 10)
+    fy = y * y * y * (y * (y * 6 - 15) + 10)
+
+    A = PERM[i]
+    AA = PERM[A + j]
+    AB = PERM[A + jj]
+    B = PERM[ii]
+    BA = PERM[B + j]
+    BB = PERM[B + jj]
+
+    x1 = x - 1
+    y1 = y - 1
+    g_aa = _grad2(PERM[AA], x, y)
+    g_ba = _grad2(PERM[BA], x1, y)
+    g_ab = _grad2(PERM[AB], x, y1)
+    g_bb = _grad2(PERM[BB], x1, y1)
+
+    bottom = g_aa + fx * (g_ba - g_aa)
+    top = g_ab + fx * (g_bb - g_ab)
+    return bottom + fy * (top - bottom)
+
+
+def _grad2(hash, x, y):
+    h = hash & 15
+    return x * GRAD3[h, 0] + y * GRAD3[h, 1]
+
+
+def pnoise2(x, y, octaves=1, persistence=0.5, lacunarity=2.0, repeatx=1024, repeaty=1024, base=0):
+    """
+    Equivalent of noise.pnoise2 over arrays: vectorized where the parity probe
+    for the base passed, else noise.pnoise2 called once per sample.
+    Accepts array-like coordinates of any (matching) shape.
+
+    :param x: Sample x coordinates.
+    :param y: Sample y coordinates.
+    :param octaves: Number of octaves of noise to sum.
+    :param persistence: Amplitude multiplier between octaves.
+    :param lacunarity: Frequency multiplier between octaves.
+    :param repeatx: Period of the noise in x.
+    :param repeaty: Period of the noise in y.
+    :param base: Seed offset into the permutation table.
+    :return: A float64 array of noise values in roughly [-1, 1].
+    """
+    if octaves < 1:
+        raise ValueError("Expected octaves value > 0")
+    if is_vectorized(base):
+        return _vectorized_pnoise2(x, y, octaves, persistence, lacunarity, repeatx, repeaty, base)
+    x, y = np.broadcast_arrays(np.asarray(x, dtype=np.float64), np.asarray(y, dtype=np.float64))
+    reference = np.frompyfunc(lambda x, y: noise.pnoise2(x, y, octaves, persistence, lacunarity, repeatx, repeaty, base), 2, 1)
+    return np.asarray(reference(x, y), dtype=np.float64)
+
+
+def _installed_version():
+    try:
+        return importlib.metadata.version('noise')
+    except importlib.metadata.PackageNotFoundError:
+        return None
+
+
+# Result of the parity probe per base, filled in by is_vectorized.
+_parity = {}
+
+
+def is_vectorized(base: int = 0) -> bool:
+    """
+    Whether pnoise2 takes the vectorized path for a base. The first call for
+    each base compares the port with noise.pnoise2 on a fixed set of samples
+    spread over many cells and octaves; the installed noise package must also
+    be the version the port was made from.
+
+    :param base: Seed offset into the permutation table.
+    """
+    if base not in _parity:
+        if _installed_version() != NOISE_VERSION:
+            _parity[base] = False
+        else:
+            rng = np.random.default_rng(0)
+            xs = rng.uniform(-3000, 3000, 512)
+            ys = rng.uniform(-3000, 3000, 512)
+            vectorized = _vectorized_pnoise2(xs, ys, 4, 0.5, 2.0, 1024, 1024, base)
+            reference = [noise.pnoise2(x, y, 4, 0.5, 2.0, 1024, 1024, base) for x, y in zip(xs, ys)]
+            _parity[base] = bool(np.array_equal(vectorized, reference))
+    return _parity[base]
+
+
+def _vectorized_pnoise2(x, y, octaves, persistence, lacunarity, repeatx, repeaty, base):
+    """
+    The port of noise.pnoise2 over arrays, with pnoise2's parameters.
+    """
+    x = np.asarray(x, dtype=np.float64).astype(np.float32)
+    y = np.asarray(y, dtype=np.float64).astype(np.float32)
+    persistence = np.float32(persistence)
+    lacunarity = np.float32(lacunarity)
+    repeatx = np.float32(repeatx)
+    repeaty = np.float32(repeaty)
+
+    if octaves == 1:
+        return _noise2(x, y, repeatx, repeaty, base).astype(np.float64)
+
+    # Evaluate every octave in one pass by stacking them along a new leading
+    # axis, then sum them in order so the float32 rounding matches the C loop.
+    freqs = np.empty(octaves, dtype=np.float32)
+    amps = np.empty(octaves, dtype=np.float32)
+    freq = np.float32(1.0)
+    amp = np.float32(1.0)
+    max_amp = np.float32(0.0)
+    for octave in range(octaves):
+        freqs[octave] = freq
+        amps[octave] = amp
+        max_amp += amp
+        freq *= lacunarity
+        amp *= persistence
+
+    octave_shape = (octaves,) + (1,) * x.ndim
+    freqs = freqs.reshape(octave_shape)
+    layers = _noise2(x * freqs, y * freqs, repeatx * freqs, repeaty * freqs, base)
+    layers *= amps.reshape(octave_shape)
+    total = layers[0].copy()
+    for octave in range(1, octaves):
+        total += layers[octave]
+    return (total / max_amp).astype(np.float64)
+
+
+# Probe the default base at import, so a mismatched build shows up straight away.
+is_vectorized(0)
@@ -0,0 +1,193 @@
+import collections
+import contextlib
+import functools
+import json
+import time
+import numpy as np
+
+# Handed out by disabled profilers, so a disabled scope costs one method call.
+_NO_SCOPE = contextlib.nullcontext()
+
+
+class Profiler:
+    """
+    Times named scopes of each frame. While enabled, every scope records its
+    start and duration; end_frame then files the frame's total time per scope
+    in a ring buffer of the last capacity frames, which get_breakdown
+    summarises as percentiles, and the recent scopes themselves can be saved
+    as a Chrome trace (chrome://tracing or https://ui.perfetto.dev). While
+    disabled scopes and frames do nothing.
+
+    The module's profiler instance is the one the game's scopes report to.
+    """
+    def __init__(self, capacity: int = 600, enabled: bool = False):
+        """
+        :param capacity: Frames kept for get_breakdown; the Chrome trace keeps
+                         the scopes of about as many frames.
+        :param enabled: Start timing straight away.
+        """
+        self.enabled = enabled
+        self.capacity = capacity
+        # Seconds per scope of each of the last capacity frames, with the whole frame under 'frame'.
+        self.__frames = collections.deque(maxlen=capacity)
+        # (name, start, duration) of recent scopes, in perf_counter seconds.
+        self.__events = collections.deque(maxlen=capacity * 32)
+        self.__current = {}
+        self.__frame_start = None
+
+    @contextlib.contextmanager
+    def __timed(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, start, time.perf_counter())
+
+    def scope(self, name: str):
+        """
+        Time a block of code:
+            with profiler.scope('MeshMap.update'):
+                ...
+
+        :param name: Scope name. Scopes of the same name in a frame add up.
+        :return: A context manager.
+        """
+        if not self.enabled:
+            return _NO_SCOPE
+        return self.__timed(name)
+
+    def record(self, name: str, start: float, end: float):
+        """
+        Add a scope timed elsewhere.
+
+        :param name: Scope name.
+        :param start: time.perf_counter() when it started.
+        :param end: time.perf_counter() when it ended.
+        """
+        self.__current[name] = self.__current.get(name, 0.0) + end - start
+        self.__events.append((name, start, end - start))
+
+    def begin_frame(self):
+        """
+        Start timing a frame.
+        """
+        if self.enabled:
+            self.__current = {}
+            self.__frame_start = time.perf_counter()
+
+    def end_frame(self):
+        """
+        Stop timing the frame begun last and file its scope times.
+        """
+        if not self.enabled or self.__frame_start is None:
+            return
+        self.record('frame', self.__frame_start, time.perf_counter())
+        self.__frames.append(self.__current)
+        self.__current = {}
+        self.__frame_start = None
+
+    def clear(self):
+        """
+        Forget every recorded frame and scope.
+        """
+        self.__frames.clear()
+        self.__events.clear()
+        self.__current = {}
+        self.__frame_start = None
+
+    def get_frame_count(self) -> int:
+        """
+        :return: The number of frames in the ring buffer.
+        """
+        return len(self.__frames)
+
+    def get_breakdown(self, percentiles: tuple = (50, 99)) -> dict:
+        """
+        :param percentiles: Percentiles to report.
+        :return: A dict of scope name to a dict of 'p<percentile>' to milliseconds,
+                 over the frames in the ring buffer, with 'frame' first and the
+                 rest slowest first by the last percentile. A frame that did not
+                 enter a scope counts as 0 ms for it.
+        """
+        if not self.__frames:
+            return {}
+        names = {name for frame in self.__frames for name in frame}
+        breakdown = {}
+        for name in names:
+            times = np.fromiter((frame.get(name, 0.0) for frame in self.__frames), dtype=np.float64,
+                                count=len(self.__frames)) * 1000
+            breakdown[name] = {f"p{percentile}": float(value)
+                               for percentile, value in zip(percentiles, np.percentile(times, percentiles))}
+        last = f"p{percentiles[-1]}"
+        order = sorted(names, key=lambda name: (name != 'frame', -breakdown[name][last]))
+        return {name: breakdown[name] for name in order}
+
+    def get_chrome_trace(self) -> dict:
+        """
+        :return: The recent scopes as a Chrome trace event dict, ready for json.dump.
+        """
+        origin = self.__events[0][1] if self.__events else 0.0
+        events = [{
+            'name': name,
+            'cat': 'frame' if name == 'frame' else 'scope',
+            'ph': 'X',
+            'ts': (start - origin) * 1e6,
+            'dur': duration * 1e6,
+            'pid': 0,
+            'tid': 0
+        } for name, start, duration in self.__events]
+        return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+    def export_chrome_trace(self, path: str):
+        """
+        Write the recent scopes to path as Chrome trace JSON.
+        """
+        with open(path, 'w') as file:
+            json.dump(self.get_chrome_trace(), file)
+
+
+profiler = Profiler()
+
+
+def profiled(name: str):
+    """
+    Decorate a function so each call is timed as a scope of the module's profiler.
+
+    :param name: Scope name.
+    """
+    def decorate(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not profiler.enabled:
+                return function(*args, **kwargs)
+            with profiler.scope(name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def frame_time_summary(frame_times, bin_edges_ms: tuple = (4, 8, 16.7, 33.3, 50, 100)) -> dict:
+    """
+    Summarise frame times as percentiles and a histogram.
+
+    :param frame_times: Frame times in seconds.
+    :param bin_edges_ms: Upper edges of the histogram bins in milliseconds; a last
+                         bin takes everything slower.
+    :return: A dict of 'frames', 'mean_ms', 'p50_ms', 'p95_ms', 'p99_ms', 'max_ms' and
+             'histogram', a list of {'up_to_ms', 'frames'} bins ('up_to_ms' is None for the last).
+    """
+    milliseconds = np.asarray(frame_times, dtype=np.float64) * 1000
+    if not len(milliseconds):
+        return {'frames': 0, 'histogram': []}
+    p50, p95, p99 = np.percentile(milliseconds, (50, 95, 99))
+    counts = np.bincount(np.searchsorted(bin_edges_ms, milliseconds), minlength=len(bin_edges_ms) + 1)
+    return {
+        'frames': len(milliseconds),
+        'mean_ms': float(milliseconds.mean()),
+        'p50_ms': float(p50),
+        'p95_ms': float(p95),
+        'p99_ms': float(p99),
+        'max_ms': float(milliseconds.max()),
+        'histogram': [{'up_to_ms': edge, 'frames': int(count)}
+                      for edge, count in zip(list(bin_edges_ms) + [None], counts)]
+    }
@@ -0,0 +1,69 @@
+from OpenGL.GL import *
+import pygame
+import time
+from Profiler import Profiler
+
+
+class ProfilerOverlay:
+    """
+    Draws a Profiler's frame time breakdown in the top left corner of the
+    window. The text is only laid out again every refresh_interval seconds;
+    in between the same pixels are drawn again.
+    """
+    def __init__(self, profiler: Profiler, display, refresh_interval: float = 0.5, font_size: int = 18):
+        """
+        :param profiler: The profiler to show.
+        :param display: (width, height) of the window in pixels.
+        :param refresh_interval: Seconds between text updates.
+        :param font_size: Text height in pixels.
+        """
+        self.profiler = profiler
+        self.display = display
+        self.refresh_interval = refresh_interval
+        self.font = pygame.font.SysFont('monospace', font_size)
+        self.__pixels = None
+        self.__size = (0, 0)
+        self.__last_refresh = None
+
+    def get_lines(self) -> list:
+        """
+        :return: The overlay's text, one string per line.
+        """
+        breakdown = self.profiler.get_breakdown()
+        if not breakdown:
+            return ["profiling: waiting for frames"]
+        lines = [f"{str(self.profiler.get_frame_count()) + ' frames':<34} {'p50 ms':>7}  {'p99 ms':>7}"]
+        for name, timing in breakdown.items():
+            lines.append(f"{name:<34.34} {timing['p50']:7.2f}  {timing['p99']:7.2f}")
+        return lines
+
+    def __refresh(self):
+        surfaces = [self.font.render(line, True, (255, 255, 255)) for line in self.get_lines()]
+        width = max(surface.get_width() for surface in surfaces) + 8
+        height = sum(surface.get_height() for surface in surfaces) + 8
+        panel = pygame.Surface((width, height), pygame.SRCALPHA)
+        panel.fill((0, 0, 0, 160))
+        y = 4
+        for surface in surfaces:
+            panel.blit(surface, (4, y))
+            y += surface.get_height()
+        # Flipped, since glDrawPixels fills rows from the bottom up.
+        self.__pixels = pygame.image.tostring(panel, 'RGBA', True)
+        self.__size = (width, height)
+
+    def draw(self):
+        """
+        Draw the overlay over the frame. This must run on the main thread.
+        """
+        now = time.perf_counter()
+        if self.__last_refresh is None or now - self.__last_refresh >= self.refresh_interval:
+            self.__refresh()
+            self.__last_refresh = now
+        width, height = self.__size
+        glPushAttrib(GL_ENABLE_BIT | GL_COLOR_BUFFER_BIT)
+        glDisable(GL_DEPTH_TEST)
+        glEnable(GL_BLEND)
+        glBlendFunc(GL_SRC_ALPHA, GL_ONE_MINUS_SRC_ALPHA)
+        glWindowPos2i(0, max(self.display[1] - height, 0))
+        glDrawPixels(width, height, GL_RGBA, GL_UNSIGNED_BYTE, self.__pixels)
+        glPopAttrib()
@@ -0,0 +1,88 @@
+import collections
+import hashlib
+import time
+import numpy as np
+
+
+class Simulation:
+    """
+    One fixed length game step at a time: the player moves, the enemies chase
+    and the player's attack lands, with no rendering. The window loop runs it
+    from a FixedTimestep; without a window it can be stepped as fast as the
+    machine allows.
+    """
+    def __init__(self, mesh_map, player, enemy_manager, step: float = 1 / 60):
+        """
+        :param mesh_map: The MeshMap the player and enemies stand on.
+        :param player: The Player.
+        :param enemy_manager: The EnemyManager chasing the player.
+        :param step: Simulated seconds per step. Player movement is tuned per
+                     step, so this sets the game speed too.
+        """
+        self.mesh_map = mesh_map
+        self.player = player
+        self.enemy_manager = enemy_manager
+        self.step_time = step
+        self.steps = 0
+        # Seconds spent in each part of the step so far.
+        self.timings = {'player': 0.0, 'enemies': 0.0, 'attacks': 0.0}
+
+    def step(self, keys):
+        """
+        Advance the game by one step.
+
+        :param keys: Pressed keys, indexed by pygame key constant, as from pygame.key.get_pressed.
+        """
+        start = time.perf_counter()
+        player_position = self.player.get_position()
+        tile_height = self.mesh_map.get_tile_height((player_position[0], player_position[2]))
+        self.player.update(keys, tile_height, self.step_time)
+        player_done = time.perf_counter()
+
+        self.enemy_manager.update(self.player.get_position(), self.step_time)
+        enemies_done = time.perf_counter()
+        if self.player.is_attacking:
+            attack_center, attack_radius = self.player.get_attack_area()
+            self.enemy_manager.handle_player_attacks(attack_center, attack_radius)
+        attacks_done = time.perf_counter()
+
+        self.timings['player'] += player_done - start
+        self.timings['enemies'] += enemies_done - player_done
+        self.timings['attacks'] += attacks_done - enemies_done
+        self.steps += 1
+
+    def run(self, step_count: int, keys=None):
+        """
+        Advance the game by step_count steps without rendering.
+
+        :param step_count: Number of steps.
+        :param keys: Keys held for every step; None for no keys.
+        """
+        if keys is None:
+            keys = collections.defaultdict(bool)
+        for _ in range(step_count):
+            self.step(keys)
+
+    def state_hash(self) -> str:
+        """
+        :return: A hex digest of everything the steps change (the step count, the
+                 player's state and every live enemy's), equal between runs
+                 only if they simulated the same thing.
+        """
+        digest = hashlib.sha256()
+        player = self.player
+        enemies = self.enemy_manager
+        count = len(enemies.enemies)
+        digest.update(np.array((self.steps, count), dtype=np.int64).tobytes())
+        digest.update(np.array((player.attack_timer, player.cooldown_timer, player.is_attacking,
+                                enemies.time_since_last_spawn), dtype=np.float64).tobytes())
+        for array in (player.position, player.velocity, enemies.positions[:count],
+                      enemies.velocities[:count], enemies.healths[:count]):
+            digest.update(np.ascontiguousarray(array).tobytes())
+        return digest.hexdigest()
+
+    def get_simulated_time(self) -> float:
+        """
+        :return: Simulated seconds so far.
+        """
+        return self.steps * self.step_time
@@ -0,0 +1,294 @@
+import math
+import numpy as np
+
+
+def neighbour_pairs(points, radius: float):
+    """
+    Find every pair of points within radius of each other without testing all
+    pairs: points are sorted into cells radius wide, and each point is only
+    compared with points in its own cell and the four neighbouring cells ahead of
+    it, so each pair is found once and the cost grows with the number of points
+    times the density rather than with the number of points squared.
+
+    :param points: An (n, 2) array-like of (x, z) positions.
+    :param radius: Largest distance between the points of a pair.
+    :return: A tuple (first, second, offsets, distances): the indices of the points
+             of each pair, points[first] - points[second] as an (m, 2) array, and
+             the distances between them.
+    """
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+    count = len(points)
+    if count < 2:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64), np.zeros((0, 2)), np.zeros(0)
+    cells = np.floor(points / radius).astype(np.int64)
+    cells -= cells.min(axis=0)
+    # Keys leave a spare row on each side in z, so stepping a key by a cell in z
+    # never wraps around into the next column of cells.
+    column = int(cells[:, 1].max()) + 3
+    keys = (cells[:, 0] + 1) * column + cells[:, 1] + 1
+    order = np.argsort(keys, kind='stable')
+    keys = keys[order]
+    # Gathering x and z separately is much faster than gathering (x, z) rows.
+    xs = points[order, 0]
+    zs = points[order, 1]
+
+    cell_count = int(keys[-1]) + column + 2
+    if cell_count <= 8 * count:
+        # Few enough cells to look up where each one starts in a table.
+        cell_starts = np.searchsorted(keys, np.arange(cell_count + 1))
+
+        def cell_range(cell_keys):
+            return cell_starts[cell_keys], cell_starts[cell_keys + 1]
+    else:
+        def cell_range(cell_keys):
+            return np.searchsorted(keys, cell_keys, 'left'), np.searchsorted(keys, cell_keys, 'right')
+
+    starts = np.arange(count)
+    # Later points in the same cell, then every point in the cells at +x -z, +x, +x +z and +z,
+    # as one run of indices per point and cell, all expanded at once.
+    neighbour_lows, neighbour_highs = cell_range((keys + np.array([[column - 1], [column], [column + 1], [1]])).ravel())
+    lows = np.concatenate((starts + 1, neighbour_lows))
+    highs = np.concatenate((cell_range(keys)[1], neighbour_highs))
+    counts = highs - lows
+    ends = np.cumsum(counts)
+    first = np.repeat(np.tile(starts, 5), counts)
+    second = np.repeat(lows - (ends - counts), counts) + np.arange(int(ends[-1]))
+    offset_x = xs[first] - xs[second]
+    offset_z = zs[first] - zs[second]
+    squared = offset_x * offset_x + offset_z * offset_z
+    close = np.flatnonzero(squared <= radius * radius)
+    offsets = np.stack((offset_x[close], offset_z[close]), axis=1)
+    return order[first[close]], order[second[close]], offsets, np.sqrt(squared[close])
+
+
+class SpatialHashGrid:
+    """
+    Uniform grid over the x, z plane for finding points near a position without
+    testing every point. Points are identified by slot (their row in the points
+    array the grid is updated with). The slots are kept sorted by cell, with
+    where each cell's run of slots starts, the way neighbour_pairs sorts its
+    points, so a query gathers whole rows of cells with a few array operations
+    and no Python loop over slots.
+
+    Sorting costs a pass over every slot, so slots that change cell or are added
+    are not sorted in straight away: they are kept loose and every query tests
+    them directly, until there are enough of them to be worth sorting again.
+    Removals just blank out and renumber the slots they touch.
+    """
+    def __init__(self, cell_size: float, direct_limit: int = 512, loose_fraction: float = 1 / 32):
+        """
+        :param cell_size: Width of a grid cell in world units.
+        :param direct_limit: Queries of at most this many points test every point in one
+                             pass instead, which costs less than gathering cells.
+        :param loose_fraction: Share of the slots that may be loose before they are sorted in.
+        """
+        self.cell_size = cell_size
+        self.direct_limit = direct_limit
+        self.loose_fraction = loose_fraction
+        # The cell each slot was last put in, as an (n, 2) int64 array.
+        self.__slot_cells = np.zeros((0, 2), dtype=np.int64)
+        # Cells are numbered row by row (x major) across the box of cells occupied
+        # at the last sort: key = (cell_x - low_x) * columns + (cell_z - low_z).
+        self.__low = (0, 0)
+        self.__high = (-1, -1)
+        self.__columns = 0
+        # Slots sorted by key (-1 where a slot was removed or went loose), and their keys.
+        self.__order = np.zeros(0, dtype=np.int64)
+        self.__keys = np.zeros(0, dtype=np.int64)
+        # Index into __order where each key's run starts (one more entry than keys),
+        # or None when the occupied box has too many cells for a table.
+        self.__cell_starts = None
+        # Where each slot is in __order, or -1 for loose slots.
+        self.__ranks = np.zeros(0, dtype=np.int64)
+        self.__loose_count = 0
+        # The loose slots, found again after they change.
+        self.__loose_slots = np.zeros(0, dtype=np.int64)
+
+    def __len__(self):
+        return len(self.__slot_cells)
+
+    def __cells_of(self, points) -> np.ndarray:
+        points = np.asarray(points)
+        # In float64 so points and query bounds near a cell edge land in the same cell.
+        cells = np.empty(points.shape, dtype=np.float64)
+        np.divide(points, self.cell_size, out=cells, dtype=np.float64)
+        return np.floor(cells, out=cells).astype(np.int64)
+
+    def __sort(self):
+        """
+        Sort every slot by cell key, loose ones included, with a radix sort when
+        there are few enough cells for 16 bit keys.
+        """
+        cells = self.__slot_cells
+        self.__loose_count = 0
+        self.__loose_slots = np.zeros(0, dtype=np.int64)
+        if not len(cells):
+            self.__high = (self.__low[0] - 1, self.__low[1] - 1)
+            self.__columns = 0
+            self.__order = np.zeros(0, dtype=np.int64)
+            self.__keys = np.zeros(0, dtype=np.int64)
+            self.__ranks = np.zeros(0, dtype=np.int64)
+            self.__cell_starts = None
+            return
+        # Reducing each column on its own is much faster than reducing along axis 0.
+        cells_x, cells_z = cells[:, 0], cells[:, 1]
+        self.__low = (int(cells_x.min()), int(cells_z.min()))
+        self.__high = (int(cells_x.max()), int(cells_z.max()))
+        self.__columns = self.__high[1] - self.__low[1] + 1
+        keys = (cells_x - self.__low[0]) * self.__columns + (cells_z - self.__low[1])
+        cell_count = (self.__high[0] - self.__low[0] + 1) * self.__columns
+        order = np.argsort(keys.astype(np.uint16) if cell_count <= 1 << 16 else keys, kind='stable')
+        self.__order = order
+        self.__keys = keys[order]
+        self.__ranks = np.empty_like(order)
+        self.__ranks[order] = np.arange(len(order))
+        if cell_count <= 8 * len(keys):
+            self.__cell_starts = np.zeros(cell_count + 1, dtype=np.int64)
+            np.cumsum(np.bincount(keys, minlength=cell_count), out=self.__cell_starts[1:])
+        else:
+            self.__cell_starts = None
+
+    def update(self, points) -> int:
+        """
+        Put points that have changed cell since the last update in their new
+        cell, and add any points past the end of the last update as new slots.
+        Slots dropped with remove must not be in points.
+
+        :param points: An (n, 2) array-like of (x, z) positions, one row per slot.
+        :return: The number of slots moved or added.
+        """
+        cells = self.__cells_of(points)
+        previous = self.__slot_cells
+        if len(cells) < len(previous):
+            raise ValueError(f"Grid has {len(previous)} slots but was updated with {len(cells)} points; "
+                             f"remove the dropped slots first")
+        kept = cells[:len(previous)]
+        moved = np.flatnonzero((kept[:, 0] != previous[:, 0]) | (kept[:, 1] != previous[:, 1]))
+        added = len(cells) - len(previous)
+        self.__slot_cells = cells
+        if not len(moved) and not added:
+            return 0
+        # Slots that left their sorted place, and new slots, go loose.
+        ranks = self.__ranks
+        moved_ranks = ranks[moved]
+        sorted_out = moved_ranks >= 0
+        self.__order[moved_ranks[sorted_out]] = -1
+        ranks[moved] = -1
+        if added:
+            ranks = np.concatenate((ranks, np.full(added, -1, dtype=np.int64)))
+            self.__ranks = ranks
+        self.__loose_count += int(np.count_nonzero(sorted_out)) + added
+        self.__loose_slots = None
+        if self.__loose_count > max(self.direct_limit, len(cells) * self.loose_fraction):
+            self.__sort()
+        return len(moved) + added
+
+    def remove(self, removed, moved_from=(), moved_to=()):
+        """
+        Drop slots and renumber others without sorting again or looking at any
+        other slot, for swarms that fill the holes left by removed points with
+        points from their end. Points keep the cell they were last updated into.
+
+        :param removed: Slots to drop.
+        :param moved_from: Surviving slots that were moved to new rows.
+        :param moved_to: The row each of moved_from now lives in; each is a removed
+                         slot, and afterwards every slot is below the new length.
+        """
+        removed = np.atleast_1d(np.asarray(removed, dtype=np.int64))
+        moved_from = np.asarray(moved_from, dtype=np.int64)
+        moved_to = np.asarray(moved_to, dtype=np.int64)
+        ranks = self.__ranks
+        removed_ranks = ranks[removed]
+        self.__order[removed_ranks[removed_ranks >= 0]] = -1
+        from_ranks = ranks[moved_from]
+        self.__order[from_ranks[from_ranks >= 0]] = moved_to[from_ranks >= 0]
+        ranks[moved_to] = from_ranks
+        self.__slot_cells[moved_to] = self.__slot_cells[moved_from]
+        length = len(self.__slot_cells) - len(removed)
+        self.__slot_cells = self.__slot_cells[:length]
+        self.__ranks = ranks[:length]
+        loose_removed = int(np.count_nonzero(removed_ranks < 0))
+        if loose_removed or np.any(from_ranks < 0):
+            self.__loose_count -= loose_removed
+            self.__loose_slots = None
+
+    def rebuild(self, points):
+        """
+        Forget every slot and add points from scratch.
+
+        :param points: An (n, 2) array-like of (x, z) positions, one row per slot.
+        """
+        self.__slot_cells = self.__cells_of(points).reshape(-1, 2)
+        self.__sort()
+
+    def __candidates(self, mins, maxs) -> np.ndarray:
+        """
+        :return: Slots in every sorted cell overlapping the box from mins to maxs, and every loose slot.
+        """
+        if self.__loose_slots is None:
+            self.__loose_slots = np.flatnonzero(self.__ranks < 0)
+        # Python scalars, as numpy calls on two element arrays cost more than the arithmetic.
+        cell_size = float(self.cell_size)
+        low_x = max(math.floor(float(mins[0]) / cell_size), self.__low[0])
+        low_z = max(math.floor(float(mins[1]) / cell_size), self.__low[1])
+        high_x = min(math.floor(float(maxs[0]) / cell_size), self.__high[0])
+        high_z = min(math.floor(float(maxs[1]) / cell_size), self.__high[1])
+        if high_x < low_x or high_z < low_z:
+            return self.__loose_slots
+        # Each row of cells in x is one run of keys.
+        first_key = (low_x - self.__low[0]) * self.__columns + low_z - self.__low[1]
+        last_key = first_key + high_z - low_z
+        if high_x == low_x:
+            if self.__cell_starts is not None:
+                start, end = int(self.__cell_starts[first_key]), int(self.__cell_starts[last_key + 1])
+            else:
+                start = int(np.searchsorted(self.__keys, first_key, 'left'))
+                end = int(np.searchsorted(self.__keys, last_key, 'right'))
+            candidates = self.__order[start:end]
+        else:
+            row_offsets = np.arange(high_x - low_x + 1) * self.__columns
+            if self.__cell_starts is not None:
+                starts = self.__cell_starts[row_offsets + first_key]
+                ends = self.__cell_starts[row_offsets + last_key + 1]
+            else:
+                starts = np.searchsorted(self.__keys, row_offsets + first_key, 'left')
+                ends = np.searchsorted(self.__keys, row_offsets + last_key, 'right')
+            # All runs expanded at once, as neighbour_pairs does.
+            counts = ends - starts
+            total = np.cumsum(counts)
+            candidates = self.__order[np.repeat(starts - (total - counts), counts) + np.arange(int(total[-1]))]
+        candidates = candidates[candidates >= 0]
+        if len(self.__loose_slots):
+            candidates = np.concatenate((candidates, self.__loose_slots))
+        return candidates
+
+    def query_box(self, mins, maxs, points) -> np.ndarray:
+        """
+        :param mins: (x, z) minimum corner of the box.
+        :param maxs: (x, z) maximum corner of the box.
+        :param points: The points array the grid was last updated with.
+        :return: An int64 array of the slots of points inside the box (edges included).
+        """
+        if len(self) <= self.direct_limit:
+            points = np.asarray(points)
+            return np.flatnonzero(np.all((points >= mins) & (points <= maxs), axis=1))
+        candidates = self.__candidates(mins, maxs)
+        candidate_points = np.asarray(points)[candidates]
+        inside = np.all((candidate_points >= mins) & (candidate_points <= maxs), axis=1)
+        return candidates[inside]
+
+    def query_radius(self, center, radius: float, points) -> np.ndarray:
+        """
+        :param center: (x, z) center of the circle.
+        :param radius: Radius of the circle.
+        :param points: The points array the grid was last updated with.
+        :return: An int64 array of the slots of points within radius of center.
+        """
+        center_x, center_z = float(center[0]), float(center[1])
+        if len(self) <= self.direct_limit:
+            points = np.asarray(points)
+            return np.flatnonzero(np.hypot(points[:, 0] - center_x, points[:, 1] - center_z) <= radius)
+        candidates = self.__candidates((center_x - radius, center_z - radius), (center_x + radius, center_z + radius))
+        candidate_points = np.asarray(points)[candidates]
+        distance = np.hypot(candidate_points[:, 0] - center_x, candidate_points[:, 1] - center_z)
+        return candidates[distance <= radius]
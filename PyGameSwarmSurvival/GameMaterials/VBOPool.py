@@ -0,0 +1,125 @@
+from OpenGL.GL import *
+import numpy as np
+
+
+class VBOPool:
+    """
+    Hands out buffers for chunk data and takes them back when chunks are
+    evicted, so streaming reuses buffers instead of creating and deleting
+    one per chunk. Buffers come in power of two sizes (min_bytes at least),
+    so a buffer freed by one chunk fits later chunks of the same size class,
+    and are filled with glBufferSubData, which keeps the driver from
+    reallocating their storage.
+    """
+    def __init__(self, min_bytes: int = 4096, max_free: int = 64):
+        """
+        :param min_bytes: Smallest buffer size handed out.
+        :param max_free: Most free buffers kept for reuse; more are deleted.
+        """
+        self.min_bytes = min_bytes
+        self.max_free = max_free
+        # Free buffer ids, keyed by capacity in bytes.
+        self.__free = {}
+        self.__free_count = 0
+        self.created = 0
+        self.reused = 0
+
+    def __capacity(self, nbytes: int) -> int:
+        capacity = self.min_bytes
+        while capacity < nbytes:
+            capacity *= 2
+        return capacity
+
+    def __create(self, capacity: int):
+        buffer = glGenBuffers(1)
+        glBindBuffer(GL_ARRAY_BUFFER, buffer)
+        glBufferData(GL_ARRAY_BUFFER, capacity, None, GL_STATIC_DRAW)
+        glBindBuffer(GL_ARRAY_BUFFER, 0)
+        self.created += 1
+        return buffer
+
+    def acquire(self, data: np.ndarray, target=GL_ARRAY_BUFFER):
+        """
+        Get a buffer holding data, reusing a free one of the right size if there is one.
+        This must run on the main thread.
+
+        :param data: A numpy array of vertex data or indices.
+        :param target: GL_ARRAY_BUFFER or GL_ELEMENT_ARRAY_BUFFER.
+        :return: A tuple (buffer, capacity) to hand back to release.
+        """
+        buffer, capacity = self.reserve(data.nbytes)
+        self.write(buffer, 0, data, target)
+        return buffer, capacity
+
+    def reserve(self, nbytes: int):
+        """
+        Get a buffer with room for nbytes without filling it, for data written
+        with write, possibly a piece at a time. This must run on the main thread.
+
+        :return: A tuple (buffer, capacity) to hand back to release.
+        """
+        capacity = self.__capacity(nbytes)
+        free = self.__free.get(capacity)
+        if free:
+            buffer = free.pop()
+            self.__free_count -= 1
+            self.reused += 1
+        else:
+            buffer = self.__create(capacity)
+        return buffer, capacity
+
+    def write(self, buffer, offset: int, data: np.ndarray, target=GL_ARRAY_BUFFER):
+        """
+        Write data into a buffer from acquire or reserve. This must run on the main thread.
+
+        :param offset: Byte offset in the buffer to write at.
+        :param data: A numpy array of the bytes to write.
+        :param target: GL_ARRAY_BUFFER or GL_ELEMENT_ARRAY_BUFFER.
+        """
+        glBindBuffer(target, buffer)
+        glBufferSubData(target, offset, data.nbytes, data)
+        glBindBuffer(target, 0)
+
+    def release(self, buffer, capacity: int):
+        """
+        Give a buffer back for reuse, or delete it if the pool is full.
+
+        :param buffer: A buffer id from acquire.
+        :param capacity: The capacity acquire returned with it.
+        """
+        if self.__free_count >= self.max_free:
+            glDeleteBuffers(1, [buffer])
+            return
+        self.__free.setdefault(capacity, []).append(buffer)
+        self.__free_count += 1
+
+    def free_bytes(self) -> int:
+        """
+        :return: The total size of the free buffers held for reuse.
+        """
+        return sum(capacity * len(buffers) for capacity, buffers in self.__free.items())
+
+    def trim(self, max_bytes: int):
+        """
+        Delete free buffers, largest first, until they take up at most max_bytes.
+        This must run on the main thread.
+        """
+        free_bytes = self.free_bytes()
+        for capacity in sorted(self.__free, reverse=True):
+            buffers = self.__free[capacity]
+            while buffers and free_bytes > max_bytes:
+                glDeleteBuffers(1, [buffers.pop()])
+                self.__free_count -= 1
+                free_bytes -= capacity
+            if not buffers:
+                del self.__free[capacity]
+
+    def delete(self):
+        """
+        Delete every free buffer.
+        """
+        for buffers in self.__free.values():
+            if buffers:
+                glDeleteBuffers(len(buffers), buffers)
+        self.__free.clear()
+        self.__free_count = 0
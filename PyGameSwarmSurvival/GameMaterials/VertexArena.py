@@ -0,0 +1,104 @@
+from OpenGL.GL import *
+import bisect
+import numpy as np
+
+
+class VertexArena:
+    """
+    One large VBO that many chunks' vertex data is packed into, so they can
+    all be drawn with a single glMultiDrawArrays call.
+    Space is handed out in whole vertices with a first-fit free list;
+    neighboring free ranges are merged when chunks are released.
+    """
+    def __init__(self, capacity: int, vertex_bytes: int):
+        """
+        Create the arena's buffer. This must run on the main thread.
+
+        :param capacity: Number of vertices the arena can hold.
+        :param vertex_bytes: Size of one vertex in bytes.
+        """
+        self.capacity = capacity
+        self.vertex_bytes = vertex_bytes
+        self.used = 0
+        # Free ranges as sorted (first, count) lists.
+        self.__free_firsts = [0]
+        self.__free_counts = [capacity]
+
+        self.vbo = glGenBuffers(1)
+        glBindBuffer(GL_ARRAY_BUFFER, self.vbo)
+        glBufferData(GL_ARRAY_BUFFER, capacity * vertex_bytes, None, GL_DYNAMIC_DRAW)
+        glBindBuffer(GL_ARRAY_BUFFER, 0)
+
+    def allocate(self, data: np.ndarray, count: int):
+        """
+        Find room for count vertices and upload data there.
+
+        :param data: The vertex data, count * vertex_bytes bytes.
+        :param count: Number of vertices.
+        :return: The first vertex of the range, or None if the arena has no room.
+        """
+        first = self.reserve(count)
+        if first is not None:
+            self.write(first * self.vertex_bytes, data)
+        return first
+
+    def reserve(self, count: int):
+        """
+        Find room for count vertices without filling it, for data written with
+        write, possibly a piece at a time.
+
+        :param count: Number of vertices.
+        :return: The first vertex of the range, or None if the arena has no room.
+        """
+        for i, free_count in enumerate(self.__free_counts):
+            if free_count >= count:
+                break
+        else:
+            return None
+        first = self.__free_firsts[i]
+        if free_count == count:
+            del self.__free_firsts[i]
+            del self.__free_counts[i]
+        else:
+            self.__free_firsts[i] += count
+            self.__free_counts[i] -= count
+        self.used += count
+        return first
+
+    def write(self, offset: int, data: np.ndarray):
+        """
+        Upload data into the arena's buffer.
+
+        :param offset: Byte offset in the buffer to write at.
+        :param data: A numpy array of the bytes to write.
+        """
+        glBindBuffer(GL_ARRAY_BUFFER, self.vbo)
+        glBufferSubData(GL_ARRAY_BUFFER, offset, data.nbytes, data)
+        glBindBuffer(GL_ARRAY_BUFFER, 0)
+
+    def release(self, first: int, count: int):
+        """
+        Give a range back, merging it with free neighbors.
+
+        :param first: First vertex of a range from allocate.
+        :param count: Number of vertices in the range.
+        """
+        self.used -= count
+        i = bisect.bisect(self.__free_firsts, first)
+        # Merge with the free range after it.
+        if i < len(self.__free_firsts) and first + count == self.__free_firsts[i]:
+            count += self.__free_counts[i]
+            del self.__free_firsts[i]
+            del self.__free_counts[i]
+        # Merge with the free range before it.
+        if i > 0 and self.__free_firsts[i - 1] + self.__free_counts[i - 1] == first:
+            self.__free_counts[i - 1] += count
+        else:
+            self.__free_firsts.insert(i, first)
+            self.__free_counts.insert(i, count)
+
+    def delete(self):
+        """
+        Delete the arena's buffer.
+        """
+        glDeleteBuffers(1, [self.vbo])
@@ -1,8 +1,17 @@
+import os
+import random
+import argparse
 import pygame
 from pygame.locals import *
 from Entity import Player, EnemyManager
 from Camera import Camera
-from MeshMap import MeshMap
+from MeshMap import MeshMap, EXECUTOR_BACKENDS
+import ChunkCache
+from Simulation import Simulation
+from FixedTimestep import FixedTimestep
+from Profiler import profiler, frame_time_summary
+from ProfilerOverlay import ProfilerOverlay
+from InputRecording import InputRecording
 
 
 
@@ -21,16 +30,33 @@ from MeshMap import MeshMap
 
 
 # Main Loop
-def main():
+def main(record_path=None, replay_path=None, chunk_cache_path=None, executor='threads'):
     # Set up pygame to use opengl
     pygame.init()
     display = (1500, 900)
     pygame.display.set_mode(display, DOUBLEBUF | OPENGL)
     pygame.display.set_caption("Demo")
     
-    # Set basic conditions
-    render_distance = 10
-    chunk_width = 10
+    # Set basic conditions (the ones a recording needs to replay the game are kept together)
+    settings = {
+        'seed': random.randrange(2 ** 31),  # Enemy spawn seed
+        'chunk_width': 10,
+        'render_distance': 10,
+        'map_seed': 48,
+        'scale': 0.003,
+        'spawn_rate': 2,
+        'group_spawn_size': 4,
+        'step': 1 / 60
+    }
+    max_substeps = 5
+    # Replays play the keys and frame times of a recording instead of live input
+    replay = InputRecording.load(replay_path) if replay_path else None
+    if replay is not None:
+        settings.update(replay.metadata['settings'])
+        max_substeps = replay.metadata.get('max_substeps', max_substeps)
+    recording = InputRecording({'settings': settings, 'max_substeps': max_substeps}) if record_path else None
+    render_distance = settings['render_distance']
+    chunk_width = settings['chunk_width']
     start_placement = (0, 0, 0, 45)  # (x, y, z, r)
     
     # Make the mesh map which handles everything map related
@@ -38,10 +64,12 @@ def main():
         chunk_width=chunk_width,
         render_distance=render_distance,
         chunks_per_update=1,
-        seed=48,
-        scale=0.003,
+        seed=settings['map_seed'],
+        scale=settings['scale'],
         height_limit=1000,
-        initial_target=(start_placement[0], start_placement[2])
+        initial_target=(start_placement[0], start_placement[2]),
+        executor=executor,
+        cache=ChunkCache.ChunkCache(chunk_cache_path) if chunk_cache_path else None
     )
     
     # Make the player character which also takes in key controls
@@ -65,48 +93,86 @@ def main():
     enemy_manager = EnemyManager(
         mesh_map = mesh_map,
         spawn_radius=(render_distance * chunk_width),
-        spawn_rate=2,
-        group_spawn_size=4,
+        spawn_rate=settings['spawn_rate'],
+        group_spawn_size=settings['group_spawn_size'],
+        seed=settings['seed']
     )
     
+    # Run the game in fixed steps so its speed does not depend on the frame rate
+    simulation = Simulation(mesh_map, player, enemy_manager, step=settings['step'])
+    timestep = FixedTimestep(step=simulation.step_time, max_substeps=max_substeps)
+    
+    # F3 toggles frame profiling and its overlay, F4 saves the last frames as a Chrome trace
+    profiler_overlay = ProfilerOverlay(profiler, display)
+    trace_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'profile_trace.json')
+    
     # Main game loop
     clock = pygame.time.Clock()
     running = True
+    frame = 0
+    frame_times = []
     while running: 
         # Limit fps to 60 and get the delta of each loop
-        dt = clock.tick(60) / 1000.0 
+        frame_ms = clock.tick(60)
+        frame_times.append(frame_ms / 1000.0)
+        if replay is not None and frame == len(replay):
+            break
+        profiler.begin_frame()
         # Quit script if pygame quits
         for event in pygame.event.get():
             if event.type == QUIT:
                 running = False
-                mesh_map.cleanup()
+            elif event.type == KEYDOWN and event.key == K_F3:
+                profiler.enabled = not profiler.enabled
+                profiler.clear()
+            elif event.type == KEYDOWN and event.key == K_F4:
+                profiler.export_chrome_trace(trace_path)
         
-        # Get keys pressed this loop
-        keys = pygame.key.get_pressed()
+        # Get keys pressed this loop, from the replay if there is one
+        if replay is not None:
+            keys = replay.get_keys(frame)
+            frame_time = replay.get_frame_time(frame)
+        else:
+            keys = pygame.key.get_pressed()
+            frame_time = frame_ms / 1000.0
+        if recording is not None:
+            recording.record(frame_ms, keys)
+        frame += 1
         
-        # Update user control related items
-        player_pos = player.get_position()
-        tile_height = mesh_map.get_tile_height((player_pos[0], player_pos[2]))
-        player.update(keys, tile_height, dt)
-        camera.update(keys)
+        # Run however many simulation steps this frame's time covers
+        for _ in range(timestep.advance(frame_time)):
+            simulation.step(keys)
+            camera.update(keys)
         
-        # Update independent logic and render everything
-        camera.apply()
-        mesh_map.update((player_pos[0], player_pos[2]))
-        mesh_map.render((player_pos[0], player_pos[2]))
+        # Render everything between the last two steps
+        alpha = timestep.alpha
+        player_pos = player.get_interpolated_position(alpha)
+        camera.apply(alpha)
+        mesh_map.update((player_pos[0], player_pos[2]), heading=player_pos[3])
+        mesh_map.render((player_pos[0], player_pos[2]), frustum=camera.get_frustum())
         # player.draw_entity_box()
-        player.render()
+        player.render(camera.zoom_distance, alpha)
         
-        # Manage all enemy behaviors 
-        enemy_manager.update(player.get_position(), dt)
-        if player.is_attacking:
-            attack_center, attack_radius = player.get_attack_area()
-            enemy_manager.handle_player_attacks(attack_center, attack_radius)
         # Render all enemies
-        enemy_manager.render(player_pos, ((render_distance + 1) * chunk_width))
+        enemy_manager.render(player_pos, ((render_distance + 1) * chunk_width), alpha)
+        if profiler.enabled:
+            profiler_overlay.draw()
         
         # Flip the pygame buffer for the next loop
         pygame.display.flip()
+        profiler.end_frame()
+    
+    mesh_map.cleanup()
+    enemy_manager.cleanup()
+    player.cleanup()
+    if recording is not None:
+        recording.metadata['state_hash'] = simulation.state_hash()
+        recording.save(record_path)
+    if replay is not None:
+        summary = frame_time_summary(frame_times[1:])
+        print(f"Replayed {frame} frames: p50 {summary['p50_ms']:.1f} ms, p95 {summary['p95_ms']:.1f} ms, "
+              f"p99 {summary['p99_ms']:.1f} ms, max {summary['max_ms']:.1f} ms; state "
+              f"{'matches' if simulation.state_hash() == replay.metadata.get('state_hash') else 'differs from'} the recording")
 
 
 
@@ -119,9 +185,15 @@ def main():
         
 
 if __name__ == '__main__':
-    
-    import cProfile
-    cProfile.run('main()')
+    parser = argparse.ArgumentParser(description="Play the game.")
+    parser.add_argument('--record', metavar='PATH', default=None, help="Record the session's input to PATH.")
+    parser.add_argument('--replay', metavar='PATH', default=None, help="Play back a recorded session instead of live input.")
+    parser.add_argument('--chunk-cache', metavar='DIR', nargs='?', const=ChunkCache.default_directory(), default=None,
+                        help="Keep generated chunks on disk between runs, in DIR or the user cache folder (up to 512 MiB).")
+    parser.add_argument('--executor', choices=EXECUTOR_BACKENDS, default='threads',
+                        help="Where chunks are generated; 'processes' sidesteps the GIL but starts a worker per CPU.")
+    args = parser.parse_args()
+    main(record_path=args.record, replay_path=args.replay, chunk_cache_path=args.chunk_cache, executor=args.executor)
 
 
 
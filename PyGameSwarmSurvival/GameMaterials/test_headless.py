@@ -0,0 +1,124 @@
+import concurrent.futures
+import numpy as np
+import pytest
+import Benchmark
+import ChunkGenerator
+import Frustum
+import Perlin
+from MeshMap import MeshMap, EXECUTOR_BACKENDS
+
+
+# pytest tests for the headless parts of the game, through MeshMap's public
+# headless hooks and the correctness checks in Benchmark, on small sizes:
+#     python -m pytest -q
+# The timings are left to Benchmark.py.
+
+SETTINGS = dict(chunk_width=10, chunks_per_update=1, seed=48, scale=0.003, height_limit=1000)
+
+
+@pytest.fixture
+def mesh_map():
+    mesh_map = MeshMap(render_distance=2, executor='inline', headless=True, **SETTINGS)
+    yield mesh_map
+    mesh_map.cleanup()
+
+
+def test_generate_chunk_matches_generator(mesh_map):
+    heights, vertex_array, vertex_count = mesh_map.generate_chunk((1, -2))
+    reference = ChunkGenerator.generate_chunk_data(1, -2, 48, 0.003, 1000, 10)
+    np.testing.assert_array_equal(heights, reference[0])
+    np.testing.assert_array_equal(vertex_array, reference[1])
+    assert vertex_count == reference[2]
+    assert not mesh_map.get_resident_chunks(), "generate_chunk made the chunk resident"
+
+
+@pytest.mark.parametrize('executor', EXECUTOR_BACKENDS)
+def test_submit_chunk_on_each_backend(mesh_map, executor):
+    other = MeshMap(render_distance=2, executor=executor, workers=2, headless=True, **SETTINGS)
+    coords = [(0, 0), (3, -1), (-2, 5)]
+    futures = [(coord, other.submit_chunk(coord)) for coord in coords]
+    concurrent.futures.wait([future for _, future in futures])
+    for coord, future in futures:
+        np.testing.assert_array_equal(other.get_chunk_result(coord, future)[1], mesh_map.generate_chunk(coord)[1])
+    other.cleanup()
+    if executor != 'inline':
+        with pytest.raises(RuntimeError):
+            other.submit_chunk((0, 0))
+
+
+def test_store_chunk_makes_it_resident(mesh_map):
+    heights, vertex_array, vertex_count = mesh_map.generate_chunk((4, 4))
+    mesh_map.store_chunk((4, 4), heights, vertex_array, vertex_count)
+    chunks = mesh_map.get_resident_chunks()
+    assert chunks[(4, 4)]['vertex_count'] == vertex_count and chunks[(4, 4)]['lod_step'] == 1
+    # The height grid has a ring of the neighbouring chunks' tiles around the chunk's own.
+    tiles = heights[1:-1, 1:-1]
+    assert chunks[(4, 4)]['min_height'] <= tiles.min() and chunks[(4, 4)]['max_height'] >= tiles.max()
+    with pytest.raises(TypeError):
+        chunks[(5, 5)] = {}
+    assert mesh_map.get_tile_height((45, 45)) == pytest.approx(float(heights[1 + 5, 1 + 5]))
+
+
+def test_lod_steps():
+    mesh_map = MeshMap(render_distance=2, executor='inline', headless=True, lod_distances=(2, 4), **dict(SETTINGS, chunk_width=12))
+    assert [mesh_map.get_lod_step(d, 0) for d in (0, 2, 3, 4, 5)] == [1, 1, 2, 2, 4]
+    heights, _, _ = mesh_map.generate_chunk((-3, 1), mesh_map.get_lod_step(-3, 1))
+    assert heights.shape == (12 // 2 + 2, 12 // 2 + 2)
+    mesh_map.cleanup()
+
+
+def test_cull():
+    mesh_map = MeshMap(render_distance=2, executor='inline', headless=True, initial_target=(0, 0), **SETTINGS)
+    drawn = mesh_map.cull((5, 5))
+    assert sorted(coord for coord, _ in drawn) == [(dx, dz) for dx in range(-2, 3) for dz in range(-2, 3)]
+    assert len(mesh_map.cull((5, 5), max_distance=10)) < len(drawn)
+
+    # Looking down towards -z from above the terrain: nothing behind the camera is drawn.
+    eye = np.array([5.0, 50.0, 5.0])
+    frustum = Frustum.Frustum(Frustum.perspective_matrix(45, 1500 / 900, 0.01, 2000),
+                              Frustum.look_at_matrix(eye, (5, 40, -20), (0, 1, 0)))
+    visible = mesh_map.cull((5, 5), frustum)
+    assert visible and all(coord[1] <= 0 for coord, _ in visible)
+    stats = mesh_map.get_render_stats()
+    assert stats['drawn_chunks'] == len(visible) and stats['frustum_culled'] == len(drawn) - len(visible)
+    mesh_map.cleanup()
+
+
+def test_noise_parity():
+    Benchmark.check_noise_parity(samples=2000)
+
+
+def test_noise_fallback(monkeypatch):
+    xs = np.linspace(-300, 300, 40).reshape(5, 8)
+    vectorized = Perlin.pnoise2(xs, xs / 3, octaves=4, base=48)
+    # As if the parity probe had failed: the same noise from noise.pnoise2, one sample at a time.
+    monkeypatch.setitem(Perlin._parity, 48, False)
+    np.testing.assert_array_equal(Perlin.pnoise2(xs, xs / 3, octaves=4, base=48), vectorized)
+
+
+def test_indexed_mesh():
+    Benchmark.check_indexed_mesh(chunks=2)
+
+
+def test_frustum_culling():
+    Benchmark.check_frustum_culling(render_distance=4, boxes=2000)
+
+
+def test_physics_parity():
+    Benchmark.check_physics_parity(count=2000)
+
+
+def test_fixed_timestep():
+    Benchmark.check_fixed_timestep(render_distance=3, steps=300, soak_steps=300)
+
+
+def test_headless_determinism():
+    Benchmark.check_headless_determinism(ticks=300)
+
+
+def test_enemy_draw_calls():
+    Benchmark.check_enemy_draw_calls(swarm_sizes=(10, 1000))
+
+
+def test_gpu_budget():
+    Benchmark.check_gpu_budget(frames=40)